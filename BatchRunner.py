@@ -0,0 +1,240 @@
+"""
+BatchRunner.py
+
+Run many headless simulations, spread over all the CPU cores
+
+    python BatchRunner.py sweep.json [results.jsonl]
+
+The sweep spec is a json file. Every combination of its lists is run once:
+
+    {
+        "robotSets": ["robot.json","twoBots.json"],   robot.json style files, the fleet for the run
+        "scripts":   [null,"Scripts/Kevin.dat"],      null uses each robot's own scriptPath
+                                                      otherwise every robot runs this script
+        "seeds":     {"start":1,"count":20},          or a list of seeds
+        "arenas":    [[800,800],"maze.json"],         sizes or arena files (see Walls.py)
+        "durations": [60],                            simulated seconds
+        "physicsHz": 100,                             optional
+        "output":    "results.jsonl"                  optional, also the second argument
+    }
+
+Each run uses its seed for the robot start positions and headings (see
+RobotManager.activateRobots) and for all the randomness in the simulator so
+any line in the results can be re-run exactly.
+
+Results are written as one json line per run as soon as it finishes, runs
+finish in any order:
+
+    {"job":3,"robotSet":..,"script":..,"seed":..,"arena":..,"duration":..,
+     "ticks":..,"simTime":..,"wallTime":..,"ticksPerSecond":..,
+     "collisions":..,"wallBumps":..,"distance":..,"scriptErrors":..,
+     "robots":{"Fred":{"collisions":..,"wallBumps":..,"distance":..,"scriptErrors":..},...},
+     "error":null}
+
+Each worker process runs one simulation at a time and they share nothing,
+so throughput goes up with the number of cores.
+
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import itertools
+import traceback
+import contextlib
+import multiprocessing
+from Constants import *
+from ConsoleQueue import *
+from Log import *
+
+SCRIPTDIR=os.path.join(os.path.dirname(os.path.abspath(__file__)),"Scripts")
+
+
+def readSpec(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def getSeeds(seeds):
+    """
+    :param seeds: list of seeds or {"start":n,"count":m}
+    :return list:
+    """
+    if isinstance(seeds,dict):
+        start=seeds.get("start",0)
+        return list(range(start,start+seeds["count"]))
+    return list(seeds)
+
+
+def getJobs(spec):
+    """
+    every combination of the sweep lists
+
+    :param dict spec: see the module docstring
+    :return list: one dict per run
+    """
+    combinations=itertools.product(spec["robotSets"],
+                                   spec.get("scripts",[None]),
+                                   getSeeds(spec.get("seeds",[0])),
+                                   spec.get("arenas",[list(ARENA)]),
+                                   spec.get("durations",[60]))
+
+    jobs=[]
+    for number,(robotSet,script,seed,arena,duration) in enumerate(combinations):
+        jobs.append({"job":number,"robotSet":robotSet,"script":script,"seed":seed,
+                     "arena":arena if isinstance(arena,str) else list(arena),"duration":duration,"physicsHz":spec.get("physicsHz",100)})
+    return jobs
+
+
+def findScript(path,relativeTo):
+    """
+    robot.json files hold absolute paths from whoever saved them. If the
+    file isn't there look beside the robot.json then in Scripts.
+
+    :return str: path which exists or path unchanged
+    """
+    if os.path.exists(path): return path
+
+    name=os.path.basename(path.replace("\\","/"))
+    for folder in (relativeTo,SCRIPTDIR):
+        candidate=os.path.join(folder,name)
+        if os.path.exists(candidate): return candidate
+    return path
+
+
+def runOne(job):
+    """
+    run a single simulation, this is what the worker processes do
+
+    :param dict job: from getJobs()
+    :return dict: the job with the results added
+    """
+    result=dict(job)
+    result["error"]=None
+
+    # robot scripts print a lot, nobody is watching
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            result.update(simulate(job))
+        except Exception:
+            result["error"]=traceback.format_exc()
+
+    return result
+
+
+def simulate(job):
+    from Simulator import Simulator     # pygame is only needed by the workers
+
+    # only warnings and errors, the debug messages would cost more than the simulation
+    LOG.setLevel(WARNING)
+
+    with open(job["robotSet"]) as f:
+        robots=json.load(f)
+    folder=os.path.dirname(os.path.abspath(job["robotSet"]))
+
+    if isinstance(job["arena"],str):
+        sim=Simulator(arenaFile=job["arena"],headless=True,physicsHz=job["physicsHz"],seed=job["seed"])
+    else:
+        sim=Simulator(arena=tuple(job["arena"]),headless=True,physicsHz=job["physicsHz"],seed=job["seed"])
+    arena=sim.arena
+
+    for name in sorted(robots):
+        robot=robots[name]
+        scriptPath=job["script"] or robot.get("scriptPath")
+        if scriptPath is not None:
+            scriptPath=findScript(scriptPath,folder)
+
+        # the same choices as RobotManager.activateRobots()
+        size=robot.get("size",30)
+        X,Y=sim.randomPosition(size)
+        sim.addRobot(pos=(X,Y),arena=arena,size=size,name=robot.get("name",name),
+                     direction=sim.random.randint(0,360),scriptPath=scriptPath,color=robot["color"],speed=1)
+
+    # run a simulated second at a time so the console doesn't pile up
+    t0=time.perf_counter()
+    endTime=sim.getTime()+job["duration"]
+    while sim.running and sim.getTime()<endTime:
+        sim.run(min(1,endTime-sim.getTime()))
+        console_getEntries()
+        if sim.scheduler.getTaskCount()==0:
+            break
+    wallTime=time.perf_counter()-t0
+
+    perRobot={}
+    for bot in sim.fleet.getRobots():
+        perRobot[bot.getName()]={"collisions":bot.collisions,"wallBumps":bot.getWallBumps(),
+                                 "distance":round(bot.getDistanceTravelled(),1),"scriptErrors":bot.scriptErrors}
+    sim.stop()
+    console_getEntries()
+
+    return {
+        "ticks":sim.ticks,
+        "simTime":round(sim.getTime(),3),
+        "wallTime":round(wallTime,3),
+        "ticksPerSecond":round(sim.ticks/wallTime,1) if wallTime>0 else None,
+        "collisions":sum(r["collisions"] for r in perRobot.values()),
+        "wallBumps":sum(r["wallBumps"] for r in perRobot.values()),
+        "distance":round(sum(r["distance"] for r in perRobot.values()),1),
+        "scriptErrors":sum(r["scriptErrors"] for r in perRobot.values()),
+        "robots":perRobot,
+    }
+
+
+class BatchRunner():
+    """
+    runner=BatchRunner(spec=readSpec("sweep.json"))
+    runner.run("results.jsonl")
+    """
+    spec=None
+    processes=None          # worker processes, defaults to the number of cores
+    output="results.jsonl"
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        if self.spec.get("output") is not None:
+            self.output=self.spec["output"]
+
+        self.jobs=getJobs(self.spec)
+        self.done=0
+        self.failed=0
+
+    def run(self,output=None):
+        """
+        run every job, writing each result as it arrives
+
+        :param str output: results file, overrides the spec
+        :return int: number of runs which failed
+        """
+        if output is not None: self.output=output
+
+        processes=self.processes or os.cpu_count() or 1
+        t0=time.perf_counter()
+
+        # spawn, each worker gets a fresh interpreter with no pygame state
+        context=multiprocessing.get_context("spawn")
+        with open(self.output,"w") as f, context.Pool(processes) as pool:
+            for result in pool.imap_unordered(runOne,self.jobs):
+                f.write(json.dumps(result)+"\n")
+                f.flush()
+
+                self.done+=1
+                if result["error"] is not None:
+                    self.failed+=1
+                    print("job",result["job"],"failed:",result["error"].splitlines()[-1])
+                print("%d/%d done"%(self.done,len(self.jobs)))
+
+        print("%d runs took %.1fs on %d processes, %d failed"%(len(self.jobs),time.perf_counter()-t0,processes,self.failed))
+        return self.failed
+
+
+if __name__=="__main__":
+    if len(sys.argv)<2:
+        print("usage: python BatchRunner.py sweep.json [results.jsonl]")
+        sys.exit(1)
+
+    runner=BatchRunner(spec=readSpec(sys.argv[1]))
+    sys.exit(1 if runner.run(sys.argv[2] if len(sys.argv)>2 else None) else 0)
@@ -0,0 +1,65 @@
+"""
+Clock.py
+
+Time source for the simulator
+
+Normally the simulator runs in real time and uses the wall clock. In headless
+mode it uses a SimClock which the Simulator advances by a fixed step every
+update so scripts run as fast as the CPU allows and always take the same
+(simulated) time.
+
+Anything which needs the time (MOVE ... INTIME, DELAY, SOUND ... WAIT, LED
+flashing, wheel distances) should call clock.time() rather than time.time()
+
+"""
+
+import time
+
+
+class Clock():
+    """
+    the wall clock
+    """
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+    def time(self):
+        return time.time()
+
+    def advance(self,dt):
+        """
+        the wall clock advances by itself
+        """
+        pass
+
+
+class SimClock(Clock):
+    """
+    virtual clock, only changes when advance() is called
+
+    It counts whole ticks and works the time out from them, adding up
+    1/hz every tick would drift so DELAYs wouldn't be a whole number of ticks.
+    """
+    hz=100          # ticks per second
+    ticks=0         # ticks since the simulation started
+
+    def time(self):
+        return self.ticks/self.hz
+
+    def advance(self,dt):
+        """
+        :param float dt: seconds to add, to the nearest tick
+        """
+        self.ticks+=round(dt*self.hz)
+
+    def setTime(self,now):
+        """
+        :param float now: seconds since the simulation started, to the nearest tick
+        """
+        self.ticks=round(now*self.hz)
+
+
+# used by anything not given a clock
+WALLCLOCK=Clock()
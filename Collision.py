@@ -5,20 +5,34 @@ Library to support collision detection
 
 """
 import math
+import numpy
 from Line import *
 from Robot import *
 from Motion import *
+from Log import *
+from SweepAndPrune import *
+from Walls import *
 
 def getIntersectCoords(line1,line2):
     """
     calculate where two lines will cross
     :param Line line1:
     :param Line line2:
-    :return: x,y - point where the lines cross or None
+    :return: x,y - point where the lines cross or None if they are parallel
     """
+    if line1.vertical and line2.vertical: return None
+
+    if line1.vertical:
+        x=line1.x
+        return x,line2.slope*x+line2.c
+
+    if line2.vertical:
+        x=line2.x
+        return x,line1.slope*x+line1.c
+
     if line1.slope==line2.slope: return None
 
-    x=(line1.c-line2.c)/(line2.slope-line1.slope)
+    x=(line2.c-line1.c)/(line1.slope-line2.slope)
     y=line1.c+line1.slope*x
     return x,y
 
@@ -46,6 +60,9 @@ def haveCollided(botA,botB):
 
     collision is true if the line between centres < 2xradius
 
+    Only checks where the robots are now, the Simulator uses findContacts()
+    which checks the whole path moved in a tick.
+
     :param botA: first bot
     :param botB: nearest bot
     :return:  True or False
@@ -60,48 +77,124 @@ def haveCollided(botA,botB):
 
     # robots are the same size
     if sep<2*botA.getSize():
-        print("Bot ",botA.getName()," has collided with",botB.getName())
+        LOG.debug("collision","Bot",botA.getName(),"has collided with",botB.getName(),robot=botA.getName())
         return True
     elif sep > 0.1*2 * botA.getSize():
-        print("No collision but close call!")
+        LOG.debug("collision","No collision but close call!",robot=botA.getName())
         return False
     else:
-        print("No collision, not even close")
+        LOG.debug("collision","No collision, not even close",robot=botA.getName())
         return False
 
 
+def timeOfImpact(ax0,ay0,ax1,ay1,bx0,by0,bx1,by1,radius):
+    """
+    swept circle test for any number of pairs at once, all arguments are
+    numpy arrays (or floats) of the same length
 
-def willCollide(botA,botB):
+    Each robot moves in a straight line from its start (x0,y0) to its end
+    (x1,y1) over the tick. The pair touch when the distance between their
+    centres is radius (the sum of the robot sizes):
+
+        |d0 + t*dv| = radius    d0=B0-A0   dv=(B1-B0)-(A1-A0)   0<=t<=1
+
+    Only new contacts count. Pairs touching or overlapping at the start have
+    already been dealt with, otherwise robots which touched last tick (and
+    were stopped where they touched) would never part.
+
+    :param float radius: sum of the two robots' sizes
+    :return tuple: toi,nx,ny - fraction of the tick when they touch (nan if
+                   they don't) and the unit normal from A to B at that time
     """
+    dx=bx0-ax0
+    dy=by0-ay0
+    vx=(bx1-bx0)-(ax1-ax0)
+    vy=(by1-by0)-(ay1-ay0)
 
-    :param Quadtree botA: pointer to bot
-    :param Quadtree botB: pointer to bot
-    :return bool: True if will collide, False otherwise
+    a=vx*vx+vy*vy
+    b=2*(dx*vx+dy*vy)
+    c=dx*dx+dy*dy-radius*radius
+
+    apart=dx*dx+dy*dy>TOUCHING*radius*radius
+    disc=b*b-4*a*c
+
+    with numpy.errstate(divide="ignore",invalid="ignore"):
+        t=(-b-numpy.sqrt(numpy.maximum(disc,0)))/(2*a)
+
+    # apart and approaching means t>=0
+    hit=apart&(b<0)&(disc>=0)&(a>0)&(t<=1)
+    toi=numpy.where(hit,numpy.maximum(t,0),numpy.nan)
+
+    # centre to centre at the time of impact
+    cx=dx+numpy.where(hit,toi,0)*vx
+    cy=dy+numpy.where(hit,toi,0)*vy
+    length=numpy.sqrt(cx*cx+cy*cy)
+    with numpy.errstate(divide="ignore",invalid="ignore"):
+        nx=numpy.where(length>0,cx/length,1.0)
+        ny=numpy.where(length>0,cy/length,0.0)
+
+    return toi,nx,ny
+
+
+def findContacts(broadphase,fleet):
+    """
+    every pair of robots which touched during the last tick, using the
+    positions at the start of the tick (Fleet.beginSweep()) and now
+
+    The broadphase pairs robots whose boxes for the tick overlap, then
+    timeOfImpact() checks for the robots actually touching - closer than the
+    sum of their sizes, as haveCollided(), at any time during the tick.
+
+    :param SweepAndPrune broadphase:
+    :param Fleet fleet:
+    :return tuple: arrays a,b,toi,nx,ny sorted by toi - the slots, fraction
+                   of the tick when they touched and the normal from a to b
     """
+    x0,y0,x1,y1=fleet.getSweep()
+    broadphase.update(x0,y0,x1,y1)
+    a,b=broadphase.getPairs()
 
-    line1=Line(botA.direction,botA.get_x(),botA.get_y())
-    line2=Line(botB.direction,botB.get_x(),botB.get_y())
+    size=fleet.size[:len(x0)]
+    toi,nx,ny=timeOfImpact(x0[a],y0[a],x1[a],y1[a],x0[b],y0[b],x1[b],y1[b],size[a]+size[b])
 
-    X,Y=getIntersectCoords(line1,line2)
+    hit=~numpy.isnan(toi)
+    order=numpy.argsort(toi[hit],kind="stable")
+    return a[hit][order],b[hit][order],toi[hit][order],nx[hit][order],ny[hit][order]
 
-    t1=getTimeToCoords(X,Y,botA)
-    t2=getTimeToCoords(X,Y,botB)
 
-    if t1==t2:
-        print("Bot ",botA.getName()," will collide with",botB.getName(),"at",X,Y,"in %.2fs"%(float(t1)))
-        return True
-    elif (abs(t1-t2)/t1)<0.1:
-        print("No collision but close call")
-        return False
-    else:
-        print("No collision, not even close")
+def willCollide(botA,botB,horizon=1.0):
+    """
+    will the robots touch in the next horizon seconds if they carry on in
+    a straight line at their current speed
+
+    :param PixelBot botA: pointer to bot
+    :param PixelBot botB: pointer to bot
+    :param float horizon: seconds to look ahead
+    :return bool: True if will collide, False otherwise
+    """
+    ends=[]
+    for bot in (botA,botB):
+        x,y=bot.getPos()
+        dist=bot.getSpeed()*horizon
+        heading=bot.getDirection()
+        ends.append((x,y,x+dist*math.cos(heading),y+dist*math.sin(heading)))
+
+    toi,nx,ny=timeOfImpact(*ends[0],*ends[1],botA.getSize()+botB.getSize())
+    toi=float(toi)
+
+    if math.isnan(toi):
+        LOG.debug("collision","No collision, not even close",robot=botA.getName())
         return False
 
+    LOG.debug("collision","Bot",botA.getName(),"will collide with",botB.getName(),"in %.2fs"%(toi*horizon),robot=botA.getName())
+    return True
+
 
 
 def checkWallBump(robot):
     """
-    check if robot is approaching the arena walls
+    check if robot is approaching the arena walls or any of the walls and
+    obstacles in its Fleet (see Walls.py)
 
     Returns a tuple:-
         bump        True or False
@@ -137,36 +230,30 @@ def checkWallBump(robot):
     elif (robotY >= (height - nearestDist)) and (vMovement == DOWN):
         bump = True
 
+    walls=robot.fleet.walls
+    if not bump and walls is not None:
+        hit,nx,ny=walls.findBumps(numpy.array([robotX]),numpy.array([robotY]),
+                                  numpy.array([float(robot.getSize())]),numpy.array([robot.getDirection()]))
+        bump=bool(hit[0])
+
     # mover routine needs to take action
     return bump,hMovement,vMovement
 
 
-
 def getWallDistance(canvas,robot):
-    width,height=canvas.get_width(),canvas.get_height()
-
-    hM=hMotion(robot)
-    if hM==LEFT:
-        Line1=Line(robot.getDirection,robot.get_x(),robot.get_y())
-        Line2=Line(math.pi/2,0,0)
-        xh,yh=getIntersectCoords(Line1,Line2)
-
-
-    elif hM==RIGHT:
-        Line1=Line(robot.getDirection,robot.get_x(),robot.get_y())
-        Line2=Line(math.pi/2,width,height)
-        xh,yh=getIntersectCoords(Line1,Line2)
-
-    vM = vMotion(robot)
-    if vM == UP:
-        Line1 = Line(robot.getDirection, robot.get_x(), robot.get_y())
-        Line2 = Line(0, 0, 0)
-        xv, yv = getIntersectCoords(Line1, Line2)
-    elif vM == DOWN:
-        Line1 = Line(robot.getDirection, robot.get_x(), robot.get_y())
-        Line2 = Line(0, 0, height)
-        xv, yv = getIntersectCoords(Line1, Line2)
+    """
+    distance straight ahead to the nearest wall, the edges of the canvas
+    or any of the walls and obstacles in the robot's Fleet (see Walls.py)
+
+    :param pygame.Surface canvas: its edges are the arena walls
+    :param PixelBot robot:
+    :return float: distance or OUTOFRANGE if there's nothing there
+    """
+    walls=robot.fleet.walls
+    if walls is None:
+        walls=Walls(arena=(canvas.get_width(),canvas.get_height()))
 
+    return float(walls.castRays([robot.get_x()],[robot.get_y()],[robot.getDirection()])[0])
 
 
 def circleAndLineIntersect(robot,line,circle):
@@ -0,0 +1,262 @@
+"""
+Compiler.py
+
+Turns the lines of a HullOS script into a tree of statement nodes
+
+The script is compiled once when it is run. Lex then walks the tree
+so FOREVER and WHILE bodies are not re-lexed every time they repeat.
+
+Each block is a python list of nodes. IF, WHILE and FOREVER nodes hold
+the blocks of indented statements which follow them.
+
+Expressions are compiled here too, see Expression.py
+
+"""
+
+import re
+from Constants import *
+from Exceptions import *
+from Expression import *
+
+# node kinds
+COMMAND="COMMAND"   # machine command MOVE,TURN,SOUND etc
+PRINT="PRINT"
+SET="SET"
+IF="IF"
+WHILE="WHILE"
+FOREVER="FOREVER"
+BREAK="BREAK"
+CONTINUE="CONTINUE"
+
+
+class Node():
+    """
+    A compiled script statement
+
+    lineNumber is the index of the source line in the script and is
+    used when reporting errors
+    """
+    kind=None
+    lineNumber=0
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+class CommandNode(Node):
+    kind=COMMAND
+    command=""          # passed to RobotController.doCommand()
+
+class PrintNode(Node):
+    kind=PRINT
+    expression=None     # CompiledExpression
+    newline=False       # True for PRINTLN
+
+class SetNode(Node):
+    kind=SET
+    varname=""
+    expression=None
+
+class IfNode(Node):
+    kind=IF
+    condition=None      # CompiledExpression
+    thenBlock=None
+    elseBlock=None
+
+class WhileNode(Node):
+    kind=WHILE
+    condition=None
+    body=None
+
+class ForeverNode(Node):
+    kind=FOREVER
+    body=None
+
+class BreakNode(Node):
+    kind=BREAK
+
+class ContinueNode(Node):
+    kind=CONTINUE
+
+
+class Compiler():
+    """
+    c=Compiler()
+    program=c.compile(script.getLines())
+
+    Statements which are not understood here are assumed to be machine commands
+    and are passed to RobotController when executed.
+
+    Warnings (e.g. a BREAK outside a loop) are collected in self.warnings as
+    (lineNumber,message) tuples. Errors raise IndentationError or ScriptSyntaxError.
+    """
+
+    # never change, saves changing case
+    # command words are terminated when a none Alpha character or end of line is encountered
+    reWhile         = re.compile(r"^(while)(?:[^a-zA-Z]|$)", re.IGNORECASE)
+    reIf            = re.compile(r"^(if)(?:[^a-zA-Z]|$)", re.IGNORECASE)
+    reElse          = re.compile(r"^(else)$", re.IGNORECASE)
+    reForever       = re.compile(r"^(forever)$", re.IGNORECASE)
+    reSet           = re.compile(r"^(set)(?:[^a-zA-Z]|$)", re.IGNORECASE)
+    rePrint         = re.compile(r"^(print)(?:[^a-zA-Z]|$)", re.IGNORECASE)
+    rePrintln       = re.compile(r"^(println)(?:[^a-zA-Z]|$)", re.IGNORECASE)
+    reBreak         = re.compile(r"^(break)$", re.IGNORECASE)
+    reContinue      = re.compile(r"^(continue)$", re.IGNORECASE)
+    reEnd           = re.compile(r"^(end)$", re.IGNORECASE)
+    reIndent        = re.compile(r"^(\s*)(.*)$")   # splits the indent from the rest of the line
+    reAssignment    = re.compile(r"^\s*([a-zA-Z_]\w*)\s*=\s*(.*)$")
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.warnings=[]
+        self.lines=[]
+        self.pos=0
+        self.loopDepth=0
+
+    def Warn(self,lineNumber,msg):
+        self.warnings.append((lineNumber,msg))
+
+    def stripComment(self,line):
+        """
+        remove a trailing comment. A # inside a quoted string is not a comment
+
+        :param str line: source line
+        :return str: line without the comment
+        """
+        quote=None
+        for i,ch in enumerate(line):
+            if quote is not None:
+                if ch==quote: quote=None
+            elif ch in "\"'":
+                quote=ch
+            elif ch=="#":
+                return line[:i]
+        return line
+
+    def getIndent(self,sourceLine):
+        """
+        :param str sourceLine: line with no trailing comment
+        :return tuple: (indent,statement) tabs count as TABLENGTH spaces
+        """
+        m = self.reIndent.match(sourceLine)
+        indent=m.group(1).replace("\t", " " * TABLENGTH)
+        return len(indent), m.group(2).rstrip()
+
+    def compile(self,source):
+        """
+        compile the script source
+
+        :param list source: list of script lines as held by Script
+        :return list: the top level block of nodes
+        """
+        self.warnings=[]
+        self.lines=[]
+        self.pos=0
+        self.loopDepth=0
+
+        if source is None: source=[]
+
+        # blank lines and comment lines are thrown away once, here
+        for lineNumber,line in enumerate(source):
+            indent,statement=self.getIndent(self.stripComment(line))
+            if len(statement)>0:
+                self.lines.append((lineNumber,indent,statement))
+
+        return self.block(-1)
+
+    def block(self,parentIndent):
+        """
+        compile statements which are indented more than parentIndent
+
+        :param int parentIndent: indent of the IF/WHILE/FOREVER which owns the block
+        :return list: nodes
+        """
+        nodes=[]
+        while self.pos<len(self.lines):
+            lineNumber,indent,statement=self.lines[self.pos]
+            if indent<=parentIndent: break
+            self.pos+=1
+            node=self.statement(lineNumber,indent,statement)
+            if node is not None: nodes.append(node)
+        return nodes
+
+    def indentedBlock(self,lineNumber,indent,statement):
+        """
+        IF, ELSE, WHILE and FOREVER must be followed by at least one indented statement
+        """
+        body=self.block(indent)
+        if len(body)==0:
+            raise IndentationError("Expected indented statements after '"+statement+"' at line "+str(lineNumber))
+        return body
+
+    def expression(self,lineNumber,source):
+        try:
+            return compileExpression(source)
+        except ScriptSyntaxError as e:
+            raise ScriptSyntaxError(e.args[0]+" at line "+str(lineNumber))
+
+    def statement(self,lineNumber,indent,statement):
+        """
+        compile a single statement and, for IF/WHILE/FOREVER, the block which follows it
+
+        :return Node: or None if the statement is ignored
+        """
+        if self.reIf.match(statement):
+            node=IfNode(lineNumber=lineNumber,condition=self.expression(lineNumber,statement[2:]))
+            node.thenBlock=self.indentedBlock(lineNumber,indent,statement)
+            node.elseBlock=[]
+
+            # ELSE must be at the same indent as the IF
+            if self.pos<len(self.lines):
+                elseLine,elseIndent,elseStatement=self.lines[self.pos]
+                if elseIndent==indent and self.reElse.match(elseStatement):
+                    self.pos+=1
+                    node.elseBlock=self.indentedBlock(elseLine,indent,elseStatement)
+            return node
+
+        elif self.reForever.match(statement):
+            self.loopDepth+=1
+            node=ForeverNode(lineNumber=lineNumber)
+            node.body=self.indentedBlock(lineNumber,indent,statement)
+            self.loopDepth-=1
+            return node
+
+        elif self.reWhile.match(statement):
+            self.loopDepth+=1
+            node=WhileNode(lineNumber=lineNumber,condition=self.expression(lineNumber,statement[5:]))
+            node.body=self.indentedBlock(lineNumber,indent,statement)
+            self.loopDepth-=1
+            return node
+
+        elif self.rePrintln.match(statement):
+            return PrintNode(lineNumber=lineNumber,expression=self.expression(lineNumber,statement[7:]),newline=True)
+
+        elif self.rePrint.match(statement):
+            return PrintNode(lineNumber=lineNumber,expression=self.expression(lineNumber,statement[5:]),newline=False)
+
+        elif self.reBreak.match(statement) or self.reContinue.match(statement):
+            if self.loopDepth==0:
+                self.Warn(lineNumber,"Unexpected '"+statement+"' ignored")
+                return None
+            if self.reBreak.match(statement):
+                return BreakNode(lineNumber=lineNumber)
+            return ContinueNode(lineNumber=lineNumber)
+
+        elif self.reEnd.match(statement):
+            self.Warn(lineNumber,"Unexpected 'end' ignored")
+            return None
+
+        elif self.reElse.match(statement):
+            self.Warn(lineNumber,"Unexpected 'else' ignored")
+            return None
+
+        elif self.reSet.match(statement):
+            r=self.reAssignment.match(statement[3:])
+            if r is None:
+                raise ScriptSyntaxError("Expected SET <var>=<expr> at line "+str(lineNumber))
+            return SetNode(lineNumber=lineNumber,varname=r.group(1),expression=self.expression(lineNumber,r.group(2)))
+
+        # only machine instructions MOVE,ANGRY,HAPPY,SOUND etc are left
+        return CommandNode(lineNumber=lineNumber,command=statement)
@@ -11,6 +11,7 @@ from tkinter import *
 import tkinter.scrolledtext as tkscrolled
 t1=time.clock()
 from ConsoleQueue import *
+from Constants import *
 import pygame
 from pygame.locals import *
 t2=time.clock()
@@ -19,6 +20,10 @@ print("Console.py imports tkinter took %.6fs pygame took %.6fs"%(t1-t0,(t2-t1)))
 class Console():
 
     consoleSize=(600,150)
+    maxLines=CONSOLE_MAXLINES           # older lines are removed from the display
+    refreshInterval=CONSOLE_REFRESH     # seconds, update() does nothing more often than this
+    lastRefresh=0
+    dropped=0                           # messages lost because the queue was full
 
     root=None
     text=None
@@ -72,7 +77,30 @@ class Console():
         self.update()
 
     def update(self):
+        """
+        show the queued messages, called every frame but only
+        refreshes every refreshInterval seconds
+
+        :return:
+        """
+        now=time.time()
+        if now-self.lastRefresh<self.refreshInterval:
+            return
+        self.lastRefresh=now
+
         Q=console_getEntries()
-        for line in Q:
-            self.text.insert(END,line)
+        lost=console_getDropped()
+        if lost>0:
+            self.dropped+=lost
+            Q.insert(0,"... %d messages dropped ...\n"%lost)
+
+        if len(Q)>0:
+            # one insert for the lot
+            self.text.insert(END,"".join(Q))
+
+            lines=int(self.text.index("end-1c").split(".")[0])
+            if lines>self.maxLines:
+                self.text.delete("1.0","%d.0"%(lines-self.maxLines+1))
+            self.text.see(END)
+
         self.text.update()
\ No newline at end of file
@@ -3,27 +3,49 @@ ConsoleQueue.py
 
 Required to get around tkInter 'main thread is not in mainloop errors
 
+Script threads add messages, the Console takes them from the main thread.
+Only the latest CONSOLE_QUEUESIZE messages are kept so a script printing
+in a FOREVER loop can't use up all the memory. Messages thrown away are
+counted, see console_getDropped().
+
 """
-Q=[]
+import threading
+from collections import deque
+from Constants import *
+
+Q=deque(maxlen=CONSOLE_QUEUESIZE)
+lock=threading.Lock()
+dropped=0       # messages thrown away since console_getDropped() was last called
+
+
+def _add(msg):
+    global dropped
+    with lock:
+        if len(Q)==Q.maxlen:
+            dropped+=1      # the oldest goes
+        Q.append(msg)
 
 def console_println(*args):
-    global Q
     msg= "".join(map(str, args))
-    Q.append(msg+"\n")
+    _add(msg+"\n")
 
 def console_print( *args):
-    global Q
     msg = "".join(map(str, args))
-    Q.append(msg)
+    _add(msg)
 
 
 def console_getEntries():
-    global Q
-    queued=Q
-    Q=[]
+    with lock:
+        queued=list(Q)
+        Q.clear()
     return queued
 
-
-
-
-
+def console_getDropped():
+    """
+    :return int: messages thrown away since the last call
+    """
+    global dropped
+    with lock:
+        count=dropped
+        dropped=0
+    return count
@@ -41,6 +41,9 @@ NEARESTCOLOR=0x0000FF
 INRANGECOLOR=0xFF0000
 COLORS=["red","green","blue","cyan","magenta","yellow","white","black"]
 
+# sonar cone sprites are cached every CONEANGLESTEP degrees (see SpriteCache.py)
+CONEANGLESTEP=2
+
 LEFT="LEFT"
 RIGHT="RIGHT"
 UP="UP"
@@ -59,8 +62,63 @@ WALLMARGIN=50
 DISTANCESENSORRANGE=400
 OUTOFRANGE=DISTANCESENSORRANGE+1000
 
+# SpatialGrid cell size. A quarter of the sensor range is the length of
+# the sonar cone (DistSensor.range) so a sonar query looks at no more
+# than 3x3 cells
+GRIDCELLSIZE=DISTANCESENSORRANGE//4
+
 # when reading lines of script indentation could be tabs or spaces
 # we convert tabs to this
 TABLENGTH=4
 
-EOF="EOF"   # end of script
\ No newline at end of file
+EOF="EOF"   # end of script
+
+# seconds to wait for a robot script to stop
+STOP_TIMEOUT=2
+
+# number of compiled script expressions kept by Expression.compileExpression()
+EXPRESSION_CACHESIZE=256
+
+# Recording.py - physics ticks in each compressed chunk, also the seek granularity
+RECORD_CHUNKTICKS=500
+
+# ToneGenerator.SoundCache - bytes of note samples kept ready to play
+SOUNDCACHE_BYTES=1024*1024
+
+# ToneGenerator.AudioEngine - mixer channels (channel 0 is the software mix
+# for robots which can't have one of their own) and the software mix loop length
+AUDIO_CHANNELS=16
+AUDIO_MIXMS=100
+
+# ConsoleQueue.py and Console.py - messages waiting to be shown, lines kept
+# in the console window and seconds between console refreshes
+CONSOLE_QUEUESIZE=1000
+CONSOLE_MAXLINES=2000
+CONSOLE_REFRESH=0.1
+
+# Log.py - messages waiting for the writer thread, json lines file size
+# before it is rotated, rotated files kept and the lowest level printed
+# (10 DEBUG, 20 INFO, 30 WARNING, 40 ERROR)
+LOG_QUEUESIZE=10000
+LOG_MAXBYTES=5*1024*1024
+LOG_BACKUPS=3
+LOG_STDOUTLEVEL=30
+LOG_FILE="pixelbot.jsonl"
+
+# Events.py - events each tick's batch has room for before it grows, and
+# the number of batches used in turn (so a batch must be read within this
+# many ticks)
+EVENT_CAPACITY=256
+EVENT_BATCHES=8
+
+# Walls.py - colour and width walls and obstacles are drawn with
+WALLCOLOR=0x606060
+WALLWIDTH=3
+
+# Scheduler.WaitUntil - seconds, times closer than this count as the same so
+# a DELAY of a whole number of ticks ends on the tick it should
+TIME_RESOLUTION=1e-9
+
+# Collision.py - pairs closer than this fraction (squared) of touching
+# already count as touching
+TOUCHING=1+1e-6
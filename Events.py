@@ -0,0 +1,277 @@
+"""
+Events.py
+
+What happened each physics tick, as one batch of events
+
+    CONTACT         two robots touched, see Collision.findContacts()
+    WALL            a robot bounced off a wall, see Fleet.step()
+    SONARENTER      another robot came into a robot's sonar cone
+    SONAREXIT       and left it
+
+The Simulator adds the events as it goes through a tick then publishes the
+batch. Anything interested - the robots, the Recorder, metrics, the UI -
+subscribes and is handed the batches on its own queue.
+
+events=EventStream()
+sub=events.subscribe(kinds=(CONTACT,WALL))
+...
+for batch in sub.getAll():
+    for event in batch.events:      # numpy records of EVENTDTYPE
+        ...
+
+Events are written into preallocated numpy arrays rather than an object
+per event, only the small EventBatch and the sonar bookkeeping are made
+each tick. There are EVENT_BATCHES of them used in turn, so a batch must
+be read within that many ticks of being published, or copied with
+batch.copy(). Batches whose buffer has been reused for a later tick by the
+time they are collected are dropped and counted, as are batches beyond the
+last EVENT_BATCHES a subscription holds.
+
+"""
+
+import threading
+from collections import deque
+import numpy
+from Constants import *
+
+# event kinds
+CONTACT=1
+WALL=2
+SONARENTER=3
+SONAREXIT=4
+
+KINDNAMES={CONTACT:"CONTACT",WALL:"WALL",SONARENTER:"SONARENTER",SONAREXIT:"SONAREXIT"}
+
+EVENTDTYPE=numpy.dtype([
+    ("kind","u1"),
+    ("tick","<u4"),
+    ("robot","<i2"),        # fleet slot
+    ("other","<i2"),        # fleet slot of the other robot, -1 for walls
+    ("x","<f4"),            # where the robot was
+    ("y","<f4"),
+    ("nx","<f4"),           # CONTACT normal towards the other robot, WALL normal away from the wall
+    ("ny","<f4"),
+    ("toi","<f4"),          # CONTACT fraction of the tick when they touched
+])
+
+
+class EventBatch():
+    """
+    tick        simulator tick
+    events      numpy array of EVENTDTYPE, a view of one of the stream's buffers
+    """
+    tick=0
+    events=None
+    stream=None
+    buffer=0            # which of the stream's buffers
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+    def isValid(self):
+        """
+        :return bool: False once the buffer has been reused for a later tick
+        """
+        return self.stream.bufferTicks[self.buffer]==self.tick
+
+    def copy(self):
+        """
+        :return EventBatch: which is never reused
+        """
+        return EventBatch(tick=self.tick,events=self.events.copy(),stream=None)
+
+    def ofKind(self,kind):
+        return self.events[self.events["kind"]==kind]
+
+
+class Subscription():
+    """
+    batches published since they were last collected
+
+    A batch is only sent if it has at least one of the kinds wanted but the
+    whole batch is sent, see EventBatch.ofKind()
+    """
+    kinds=None          # event kinds wanted, None for all
+    maxBatches=EVENT_BATCHES
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.batches=deque(maxlen=self.maxBatches)
+        self.ready=threading.Condition()
+        self.dropped=0      # batches lost because they weren't collected in time
+
+    def put(self,batch):
+        with self.ready:
+            if len(self.batches)==self.batches.maxlen:
+                self.dropped+=1
+            self.batches.append(batch)
+            self.ready.notify()
+
+    def get(self,timeout=None):
+        """
+        wait for the next batch
+
+        :return EventBatch: or None if timed out
+        """
+        with self.ready:
+            if not self.batches:
+                self.ready.wait(timeout)
+            while self.batches:
+                batch=self.batches.popleft()
+                if self._valid(batch): return batch
+            return None
+
+    def getAll(self):
+        """
+        :return list: every batch waiting, without waiting
+        """
+        with self.ready:
+            batches=[batch for batch in self.batches if self._valid(batch)]
+            self.batches.clear()
+        return batches
+
+    def _valid(self,batch):
+        """
+        :return bool: False, and the batch is counted as dropped, if its buffer now holds a later tick
+        """
+        if batch.stream is None or batch.isValid(): return True
+        self.dropped+=1
+        return False
+
+
+class EventStream():
+    """
+    collects one tick's events and hands them to the subscribers
+    """
+    capacity=EVENT_CAPACITY     # events per batch, grows if a tick has more
+    numBuffers=EVENT_BATCHES
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.buffers=[numpy.zeros(self.capacity,dtype=EVENTDTYPE) for i in range(self.numBuffers)]
+        self.bufferTicks=[-1]*self.numBuffers
+        self.current=0
+        self.count=0
+        self.tick=0
+        self.subscribers=[]
+        self.totals=numpy.zeros(len(KINDNAMES)+1,dtype=int)    # events published by kind
+        self.lock=threading.Lock()
+
+        self.sonar=numpy.zeros(0,dtype=numpy.int64)     # me*n+him in sonar cones last tick
+        self.sonarSize=0
+
+    def subscribe(self,kinds=None):
+        """
+        :param tuple kinds: event kinds wanted, default all
+        :return Subscription:
+        """
+        sub=Subscription(kinds=None if kinds is None else frozenset(kinds))
+        with self.lock:
+            self.subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self,sub):
+        with self.lock:
+            if sub in self.subscribers:
+                self.subscribers.remove(sub)
+
+    # building a batch
+
+    def begin(self,tick):
+        self.current=(self.current+1)%self.numBuffers
+        self.bufferTicks[self.current]=-1       # being rewritten
+        self.count=0
+        self.tick=tick
+
+    def _reserve(self,count):
+        """
+        :return numpy.ndarray: the next count records of the current buffer
+        """
+        buffer=self.buffers[self.current]
+        if self.count+count>len(buffer):
+            # a busy tick, this buffer grows and stays grown
+            bigger=numpy.zeros(max(2*len(buffer),self.count+count),dtype=EVENTDTYPE)
+            bigger[:self.count]=buffer[:self.count]
+            self.buffers[self.current]=buffer=bigger
+
+        records=buffer[self.count:self.count+count]
+        self.count+=count
+        return records
+
+    def add(self,kind,robots,others,x,y,nx=0,ny=0,toi=0):
+        """
+        add events, all arguments can be arrays (one event each) or scalars
+
+        :param int kind: CONTACT, WALL, SONARENTER or SONAREXIT
+        """
+        count=len(robots)
+        if count==0: return
+
+        records=self._reserve(count)
+        records["kind"]=kind
+        records["tick"]=self.tick
+        records["robot"]=robots
+        records["other"]=others
+        records["x"]=x
+        records["y"]=y
+        records["nx"]=nx
+        records["ny"]=ny
+        records["toi"]=toi
+
+    def addSonar(self,fleet,me,him):
+        """
+        SONARENTER and SONAREXIT from the pairs in each other's sonar cone
+        this tick compared with last tick
+
+        :param numpy.ndarray me: robots whose cone...
+        :param numpy.ndarray him: ...has these robots in it
+        """
+        n=fleet.count
+        if n!=self.sonarSize:
+            # keys depend on the number of robots
+            self.sonar=(self.sonar//max(self.sonarSize,1))*n+self.sonar%max(self.sonarSize,1)
+            self.sonarSize=n
+
+        now=numpy.unique(me.astype(numpy.int64)*n+him)
+        entered=numpy.setdiff1d(now,self.sonar,assume_unique=True)
+        left=numpy.setdiff1d(self.sonar,now,assume_unique=True)
+        self.sonar=now
+
+        for kind,keys in ((SONARENTER,entered),(SONAREXIT,left)):
+            if len(keys)==0: continue
+            robots=keys//n
+            self.add(kind,robots,keys%n,fleet.x[robots],fleet.y[robots])
+
+    def publish(self):
+        """
+        hand the tick's events to the subscribers, nothing is sent if nothing happened
+
+        :return EventBatch: or None
+        """
+        self.bufferTicks[self.current]=self.tick
+        if self.count==0: return None
+
+        events=self.buffers[self.current][:self.count]
+        counts=numpy.bincount(events["kind"],minlength=len(self.totals))
+        self.totals+=counts
+        kinds=set(numpy.flatnonzero(counts).tolist())
+
+        batch=EventBatch(tick=self.tick,events=events,stream=self,buffer=self.current)
+        with self.lock:
+            subscribers=list(self.subscribers)
+
+        for sub in subscribers:
+            if sub.kinds is None or not sub.kinds.isdisjoint(kinds):
+                sub.put(batch)
+        return batch
+
+    def getTotals(self):
+        """
+        :return dict: events published so far by kind name
+        """
+        return {name:int(self.totals[kind]) for kind,name in KINDNAMES.items()}
@@ -28,4 +28,16 @@ class IndentationError(Error):
 
 class InvalidAngle(Error):
     """ Invalid angle"""
-    pass
\ No newline at end of file
+    pass
+
+class ScriptSyntaxError(Error):
+    """ a script statement could not be compiled"""
+    pass
+
+class RecordingError(Error):
+    """ file is not a recording Recording.py can read"""
+    pass
+
+class SnapshotError(Error):
+    """ simulator state could not be saved or restored"""
+    pass
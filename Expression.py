@@ -0,0 +1,123 @@
+"""
+Expression.py
+
+Compiles script expressions into python code objects
+
+@variables e.g. @distance are turned into python names (_at_distance) so the
+expression only needs compiling once. Their values are supplied in a small
+namespace each time the expression is evaluated.
+
+@variables inside quoted strings are also replaced, so
+    println "I am here: @X , @Y"
+prints the robot position.
+
+"""
+
+import re
+from functools import lru_cache
+from Constants import *
+from Exceptions import *
+
+PREFIX="_at_"   # python name prefix for @variables
+
+# @variables understood by Lex
+ATVARIABLES=("distance","range","light","moving","random","name","angle","compass","x","y","collided","bumped")
+
+reAtVariable=re.compile(r"@([a-zA-Z]+)")
+
+# splits an expression into code and quoted strings
+reStrings=re.compile(r"(\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*')")
+
+
+class CompiledExpression():
+    """
+    source      the expression text from the script
+    code        python code object
+    variables   tuple of @variable names used (lower case, no @)
+    """
+    source=""
+    code=None
+    variables=()
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+
+def _replaceInString(literal,variables):
+    """
+    turn a quoted string containing @variables into a concatenation
+
+    "at @X" becomes ("at "+str(_at_x))
+
+    Unknown @words are left alone, they are just text.
+
+    :param str literal: string including quotes
+    :param list variables: names found are appended
+    :return str: python source
+    """
+    quote=literal[0]
+    parts=reAtVariable.split(literal[1:-1])   # text,name,text,name...,text
+
+    terms=[]
+    text=""
+    for i,part in enumerate(parts):
+        if i%2==0:
+            text+=part
+        elif part.lower() not in ATVARIABLES:
+            text+="@"+part
+        else:
+            if len(text)>0: terms.append(quote+text+quote)
+            text=""
+            name=part.lower()
+            variables.append(name)
+            terms.append("str("+PREFIX+name+")")
+
+    if len(terms)==0:
+        return literal
+
+    if len(text)>0: terms.append(quote+text+quote)
+    return "("+"+".join(terms)+")"
+
+
+def _replaceInCode(code,variables):
+
+    def rename(m):
+        name=m.group(1).lower()
+        if name not in ATVARIABLES:
+            raise ScriptSyntaxError("Unknown variable @"+m.group(1))
+        variables.append(name)
+        return PREFIX+name
+
+    return reAtVariable.sub(rename,code)
+
+
+@lru_cache(maxsize=EXPRESSION_CACHESIZE)
+def compileExpression(source):
+    """
+    compile a script expression. Results are cached by source text
+
+    :param str source: e.g. "@distance<100"
+    :return CompiledExpression:
+    """
+    variables=[]
+    pySource=[]
+
+    # odd numbered parts are quoted strings
+    for i,part in enumerate(reStrings.split(source.strip())):
+        if i%2==0:
+            pySource.append(_replaceInCode(part,variables))
+        else:
+            pySource.append(_replaceInString(part,variables))
+
+    try:
+        code=compile("".join(pySource),"<script>","eval")
+    except SyntaxError:
+        raise ScriptSyntaxError("Invalid expression: "+source)
+
+    # remove duplicates but keep the order
+    unique=[]
+    for name in variables:
+        if name not in unique: unique.append(name)
+
+    return CompiledExpression(source=source,code=code,variables=tuple(unique))
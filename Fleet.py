@@ -0,0 +1,488 @@
+"""
+Fleet.py
+
+Structure of arrays store for the position and motion of every robot
+
+Each robot is given a slot when it is created. PixelBot.pos and
+PixelBot.direction read and write the arrays so there is only one copy
+of the robot state.
+
+Timed MOVE, TURN and ARC commands set the motion for a slot and the
+Simulator calls step() once per tick to advance every moving robot at
+once.
+
+A motion is a segment of path - a line, a turn on the spot or an arc -
+kept as the pose it started from and the seconds since then (elapsed).
+The pose at any time along it is worked out directly, see poseAt(), so
+nothing piles up from adding small steps each tick and drawing can ask
+for the pose at any moment in between ticks.
+
+When a segment starts the first time it will hit a wall, the arena edges
+or any walls and obstacles (see Walls.py), is found with Trajectory.py.
+step() splits the segment there: the robot bounces and a new segment
+starts from the point it hit, with what is left of the motion.
+
+Anything else which moves a robot (POS, pushing robots apart after a
+collision) calls rebase() to start the segment again from where it is.
+
+"""
+
+import math
+import threading
+import numpy
+from Constants import *
+from Trajectory import *
+
+# motion kinds
+NOMOTION=0
+LINEAR=1        # MOVE <dist> INTIME <time>
+TURN=2          # TURN <angle> INTIME <time>
+ARC=3           # ARC <radius> ANGLE <angle> INTIME <time>
+
+# per robot float arrays
+FIELDS=(
+    "x","y",            # position
+    "heading",          # radians, clockwise from East (pygame y is down)
+    "size",             # robot radius
+    "leftSpeed",        # wheel speeds, set by the current motion or setSpeed()
+    "rightSpeed",
+    "speed",            # LINEAR distance per second
+    "turnRate",         # TURN and ARC radians per second
+    "remaining",        # seconds of motion left after elapsed
+    "cx","cy",          # ARC centre of rotation
+    "radius",           # ARC radius, negative turns left
+    "arcAngle",         # ARC angle of the robot about cx,cy (radians)
+    "travelled",        # total distance moved by timed MOVE and ARC commands
+    "bumps",            # number of times the robot has bounced off a wall
+    "elapsed",          # seconds since the current segment started
+    "x0","y0",          # where the segment started
+    "heading0",
+    "arcAngle0",
+    "hitTime",          # elapsed when the segment hits a wall, inf if it doesn't
+    "hitNx","hitNy",    # normal away from that wall
+    "hitEdge",          # 1 if it is an arena edge
+)
+
+# splits one robot can have in one tick, a robot wedged in a corner waits for the next tick
+MAXHITS=4
+# and in an ARC with no INTIME, which goes all the way round at once
+JUMPHITS=64
+
+
+class Fleet():
+    """
+    fleet=Fleet(arena=(800,800))
+    slot=fleet.add(robot)
+    fleet.startLinear(slot,speed,duration)
+    fleet.step(1/fps)   # once per tick
+    """
+    arena=(0,0)         # width and height
+    capacity=16         # grows as robots are added
+    count=0             # slots in use
+    walls=None          # Walls, obstacles robots bounce off as well as the arena edges
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.robots=[]
+        self.count=0
+        self.previous=None      # count,x,y,heading before the last step
+        self.sweep=None         # count,x,y at the start of the tick, see Collision.findContacts()
+        self.wallHits=[]        # (slots,x,y,nx,ny) for wall bumps since getWallHits()
+        self.drawn=None         # x,y,heading interpolated for drawing
+        self.lastStep=0         # dt of the last step()
+        self.lock=threading.Lock()      # scripts may start motions from their own threads
+
+        for name in FIELDS:
+            setattr(self,name,numpy.zeros(0))
+        self.motion=numpy.zeros(0,dtype=numpy.int8)
+
+        self._allocate(self.capacity)
+
+    def _allocate(self,capacity):
+        """
+        resize the arrays keeping the current contents
+        """
+        for name in FIELDS+("motion",):
+            old=getattr(self,name)
+            new=numpy.zeros(capacity,dtype=old.dtype)
+            new[:self.count]=old[:self.count]
+            setattr(self,name,new)
+
+        self.capacity=capacity
+
+    def add(self,robot):
+        """
+        :param PixelBot robot:
+        :return int: slot number for the robot
+        """
+        with self.lock:
+            if self.count==self.capacity:
+                self._allocate(2*self.capacity)
+            slot=self.count
+            self.count+=1
+            self.robots.append(robot)
+        return slot
+
+    def getRobots(self):
+        return self.robots
+
+    # motion control, used by RobotController
+
+    def startLinear(self,slot,speed,duration):
+        with self.lock:
+            self.speed[slot]=speed
+            self.leftSpeed[slot]=speed
+            self.rightSpeed[slot]=speed
+            self.remaining[slot]=duration
+            self.motion[slot]=LINEAR
+            self._begin(numpy.array([slot]))
+
+    def startTurn(self,slot,turnRate,duration):
+        with self.lock:
+            self.turnRate[slot]=turnRate
+            # wheels turn in opposite directions
+            self.leftSpeed[slot]=turnRate*self.size[slot]
+            self.rightSpeed[slot]=-turnRate*self.size[slot]
+            self.remaining[slot]=duration
+            self.motion[slot]=TURN
+            self._begin(numpy.array([slot]))
+
+    def startArc(self,slot,cx,cy,radius,turnRate,duration):
+        with self.lock:
+            self.cx[slot]=cx
+            self.cy[slot]=cy
+            self.radius[slot]=radius
+            self.turnRate[slot]=turnRate
+            # angle of the robot measured about the centre (see Motion.anglePoint)
+            self.arcAngle[slot]=math.atan2(self.cy[slot]-self.y[slot],self.cx[slot]-self.x[slot])+math.pi
+            self.leftSpeed[slot]=turnRate*(abs(radius)+self.size[slot])
+            self.rightSpeed[slot]=turnRate*(abs(radius)-self.size[slot])
+            self.remaining[slot]=duration
+            self.motion[slot]=ARC
+            self._begin(numpy.array([slot]))
+
+    def stopMotion(self,slot):
+        with self.lock:
+            self._stop(numpy.array([slot]))
+
+    def isMoving(self,slot):
+        return self.motion[slot]!=NOMOTION
+
+    def _stop(self,idx):
+        self.motion[idx]=NOMOTION
+        self.remaining[idx]=0
+        self.elapsed[idx]=0
+        self.leftSpeed[idx]=0
+        self.rightSpeed[idx]=0
+
+    # segments
+
+    def rebase(self,slots):
+        """
+        robots moved or turned by something other than their motion carry
+        on from where they are now. An ARC keeps its centre so the robot
+        goes back onto the circle, as it always has.
+
+        :param slots: slot or array of slots
+        """
+        with self.lock:
+            idx=numpy.atleast_1d(slots)
+            idx=idx[self.motion[idx]!=NOMOTION]
+            if len(idx):
+                self._begin(idx)
+
+    def _begin(self,idx):
+        """
+        start a new segment from the current pose and find its first wall hit
+        """
+        self.elapsed[idx]=0
+        self.x0[idx]=self.x[idx]
+        self.y0[idx]=self.y[idx]
+        self.heading0[idx]=self.heading[idx]
+        self.arcAngle0[idx]=self.arcAngle[idx]
+        self.hitTime[idx]=math.inf
+
+        for slot in idx.tolist():
+            motion=self.motion[slot]
+            if motion==LINEAR:
+                speed=self.speed[slot]
+                heading=self.heading[slot]
+                hit=lineHit(self.x[slot],self.y[slot],speed*math.cos(heading),speed*math.sin(heading),
+                            self.size[slot],self.arena,self.walls,self.remaining[slot])
+            elif motion==ARC:
+                hit=arcHit(self.cx[slot],self.cy[slot],abs(self.radius[slot]),self.arcAngle[slot],self.turnRate[slot],
+                           self.size[slot],self.arena,self.walls,self.remaining[slot])
+            else:
+                continue
+            self.hitTime[slot],self.hitNx[slot],self.hitNy[slot],self.hitEdge[slot]=hit
+
+    def poseAt(self,idx,elapsed):
+        """
+        where robots are along their segments, in closed form
+
+        :param numpy.ndarray idx: moving slots
+        :param numpy.ndarray elapsed: seconds since each segment started,
+                                      no later than its hitTime
+        :return tuple: x,y,heading,arcAngle arrays
+        """
+        kind=self.motion[idx]
+        x=self.x0[idx].copy()
+        y=self.y0[idx].copy()
+        arcAngle=self.arcAngle0[idx].copy()
+
+        # headings only change turning, a LINEAR segment has turnRate 0 in here
+        turning=numpy.where(kind==LINEAR,0,self.turnRate[idx])*elapsed
+        heading=self.heading0[idx]+turning
+
+        linear=kind==LINEAR
+        if linear.any():
+            dist=self.speed[idx[linear]]*elapsed[linear]
+            x[linear]+=dist*numpy.cos(heading[linear])
+            y[linear]+=dist*numpy.sin(heading[linear])
+
+        arc=kind==ARC
+        if arc.any():
+            a=arcAngle[arc]+turning[arc]
+            radius=numpy.abs(self.radius[idx[arc]])
+            arcAngle[arc]=a
+            x[arc]=self.cx[idx[arc]]+radius*numpy.cos(a)
+            y[arc]=self.cy[idx[arc]]+radius*numpy.sin(a)   # drawing is top to bottom
+        return x,y,heading,arcAngle
+
+    def _advance(self,idx,elapsed):
+        """
+        move robots along their segments to elapsed, counting the distance
+        """
+        x,y,heading,arcAngle=self.poseAt(idx,elapsed)
+        t=elapsed-self.elapsed[idx]
+        kind=self.motion[idx]
+        rate=numpy.where(kind==LINEAR,self.speed[idx],numpy.where(kind==ARC,self.radius[idx]*self.turnRate[idx],0))
+        self.travelled[idx]+=numpy.abs(rate*t)
+        self.remaining[idx]-=t
+        self.elapsed[idx]=elapsed
+        self.x[idx]=x
+        self.y[idx]=y
+        self.heading[idx]=heading
+        self.arcAngle[idx]=arcAngle
+
+    # interpolation for drawing
+
+    def savePrevious(self):
+        """
+        keep the positions before a step so drawing can interpolate
+        """
+        with self.lock:
+            n=self.count
+            self.previous=(n,self.x[:n].copy(),self.y[:n].copy(),self.heading[:n].copy())
+
+    def beginSweep(self):
+        """
+        keep the positions at the start of a tick, before the scripts run,
+        so collisions can be found anywhere along the path moved
+        """
+        with self.lock:
+            n=self.count
+            self.sweep=(n,self.x[:n].copy(),self.y[:n].copy())
+
+    def resetSweep(self,slot):
+        """
+        the robot was placed rather than moved (POS) so it didn't pass
+        through anything on the way
+        """
+        with self.lock:
+            if self.sweep is not None and slot<self.sweep[0]:
+                n,x,y=self.sweep
+                x[slot]=self.x[slot]
+                y[slot]=self.y[slot]
+
+    def getSweep(self):
+        """
+        :return tuple: x0,y0,x1,y1 arrays, start and end of the tick for every slot
+        """
+        with self.lock:
+            n=self.count
+            x1=self.x[:n].copy()
+            y1=self.y[:n].copy()
+            x0=x1.copy()
+            y0=y1.copy()
+            if self.sweep is not None:
+                # robots added during the tick haven't moved
+                m,sx,sy=self.sweep
+                m=min(m,n)
+                x0[:m]=sx[:m]
+                y0[:m]=sy[:m]
+        return x0,y0,x1,y1
+
+    def interpolate(self,alpha):
+        """
+        work out where to draw each robot, alpha of the way from the
+        previous step to the current one. Results are kept in self.drawn
+
+        :param float alpha: 0 to 1
+        """
+        with self.lock:
+            n=self.count
+            x=self.x[:n].copy()
+            y=self.y[:n].copy()
+            heading=self.heading[:n].copy()
+
+            if self.previous is not None and alpha<1:
+                # robots added since the previous step are drawn where they are
+                m,px,py,ph=self.previous
+                m=min(m,n)
+                x[:m]=px[:m]+alpha*(x[:m]-px[:m])
+                y[:m]=py[:m]+alpha*(y[:m]-py[:m])
+                # shortest way round, wall bumps add PI
+                turn=(heading[:m]-ph[:m]+math.pi)%(2*math.pi)-math.pi
+                heading[:m]=ph[:m]+alpha*turn
+
+                # robots whose segment started before the moment drawn are put exactly on it
+                moving=numpy.flatnonzero(self.motion[:m])
+                back=(1-alpha)*self.lastStep
+                moving=moving[self.elapsed[moving]>=back]
+                if len(moving):
+                    x[moving],y[moving],heading[moving],arcAngle=self.poseAt(moving,self.elapsed[moving]-back)
+
+            self.drawn=(x,y,heading)
+
+    def getDrawn(self,slot):
+        """
+        :return tuple: x,y,heading for drawing
+        """
+        drawn=self.drawn
+        if drawn is None or slot>=len(drawn[0]):
+            return float(self.x[slot]),float(self.y[slot]),float(self.heading[slot])
+        x,y,heading=drawn
+        return float(x[slot]),float(y[slot]),float(heading[slot])
+
+    # vectorised kinematics
+
+    def step(self,dt):
+        """
+        advance every moving robot by dt seconds, or what is left of its motion
+
+        :param float dt: seconds, normally 1/fps
+        :return: nothing
+        """
+        with self.lock:
+            self.lastStep=dt
+            n=self.count
+            moving=numpy.flatnonzero(self.motion[:n])
+            if len(moving)==0: return
+            self._travel(moving,dt,MAXHITS)
+
+    def jumpArc(self,slot,cx,cy,radius,angle):
+        """
+        ARC with no INTIME, the robot is put at the end of the arc at once.
+        It is a segment like any other ARC, lasting a nominal second, so it
+        is split and bounced at any wall in the way rather than ending up
+        inside it.
+
+        :param float angle: radians to go round, radius<0 turns left
+        """
+        self.startArc(slot,cx,cy,radius,-angle if radius<0 else angle,1.0)
+        with self.lock:
+            idx=numpy.array([slot])
+            self._travel(idx,1.0,JUMPHITS)
+            self._stop(idx)
+
+    def _travel(self,moving,dt,maxHits):
+        """
+        move robots dt seconds along their segments, or what is left of
+        their motion, splitting them at up to maxHits walls
+        """
+        # how far along its segment each robot gets
+        target=self.elapsed[moving]+numpy.minimum(self.remaining[moving],dt)
+
+        # segments which hit a wall before then are split where they hit
+        for i in range(maxHits):
+            due=self.hitTime[moving]<=target
+            if not due.any(): break
+            idx=moving[due]
+            hitTime=self.hitTime[idx]
+            self._advance(idx,hitTime)
+            self._bounce(idx)
+            target[due]-=hitTime
+        else:
+            target=numpy.minimum(target,self.hitTime[moving])
+
+        self._advance(moving,target)
+        self._stop(moving[self.remaining[moving]<=1e-9])
+
+    def _bounce(self,idx):
+        """
+        robots which have reached the wall their segment hits bounce off it
+        and start a new segment
+        """
+        nx=self.hitNx[idx]
+        ny=self.hitNy[idx]
+        self.recordWallHits(idx,nx,ny)
+        self.bumps[idx]+=1
+
+        linear=self.motion[idx]==LINEAR
+        edge=self.hitEdge[idx]==1
+
+        # for linear motion just reflect the direction 180 deg (PI radians)
+        self.heading[idx[linear&edge]]+=math.pi
+
+        # obstacles can be at any angle, bounce off them like a ball
+        off=linear&~edge
+        self.heading[idx[off]]=self.reflect(self.heading[idx[off]],nx[off],ny[off])
+
+        self.reflectArcsOff(idx[~linear],nx[~linear],ny[~linear])
+        self._begin(idx)
+
+    def reflect(self,heading,nx,ny):
+        """
+        :return array: headings mirrored in walls with normals nx,ny
+        """
+        dx=numpy.cos(heading)
+        dy=numpy.sin(heading)
+        along=dx*nx+dy*ny
+        return numpy.arctan2(dy-2*along*ny,dx-2*along*nx)
+
+    def recordWallHits(self,idx,nx,ny):
+        """
+        keep the robots which bumped a wall for the Simulator's events
+
+        :param array idx: slots which have bumped a wall
+        :param array nx: normals away from the walls
+        :param array ny:
+        """
+        self.wallHits.append((idx,self.x[idx],self.y[idx],nx,ny))
+
+    def getWallHits(self):
+        """
+        the Simulator collects these once per tick, they include any bumps
+        made by instant ARCs while the scripts ran
+
+        :return list: (slots,x,y,nx,ny) arrays for the robots which bumped a wall since the last call
+        """
+        with self.lock:
+            hits=self.wallHits
+            self.wallHits=[]
+        return hits
+
+    def reflectArcsOff(self,idx,nx,ny):
+        """
+        robots on an ARC bouncing off a wall
+
+        The heading is mirrored in the wall and the centre of rotation in the
+        line through the robot along the normal, which carries on round the
+        mirror image of the arc in the same direction of turn.
+
+        :param array idx: slots which have bumped a wall
+        :param array nx: normals away from the walls
+        :param array ny:
+        """
+        x=self.x[idx]
+        y=self.y[idx]
+        ox=self.cx[idx]-x
+        oy=self.cy[idx]-y
+        along=oy*nx-ox*ny       # component of the offset along the wall
+        self.cx[idx]=x+ox+2*along*ny
+        self.cy[idx]=y+oy-2*along*nx
+        self.heading[idx]=self.reflect(self.heading[idx],nx,ny)
+        self.arcAngle[idx]=numpy.arctan2(self.cy[idx]-y,self.cx[idx]-x)+math.pi
@@ -8,7 +8,6 @@ import sys
 import json
 from tkinter import messagebox
 from Forms import RobotConfig
-import random
 from Constants import *
 try:
     from Tkinter import *
@@ -289,12 +288,10 @@ class RobotManager:
                     # POS to reposition
                     # COMPASS or ANGLE or DIR to face the robot
 
-                    w,h=self.arena
-
-                    X = random.randint(0,w - 2*WALLMARGIN)+WALLMARGIN
-                    Y = random.randint(0, h - 2 * WALLMARGIN) + WALLMARGIN
-                    self.sim.addRobot(pos=(X, Y), arena=self.arena, size=self.size, name=name,
-                                      direction=random.randint(0,360),
+                    # from the simulator's seeded generator so a run can be repeated
+                    X,Y = self.sim.randomPosition(self.size)
+                    self.sim.addRobot(pos=(X, Y), arena=self.sim.arena, size=self.size, name=name,
+                                      direction=self.sim.random.randint(0,360),
                                       scriptPath=scriptPath, color=color, speed=1)
 
 
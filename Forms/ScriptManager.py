@@ -21,7 +21,7 @@ print("Forms.ScriptManager imports took %.6fs"%(t1-t0))
 
 class ScriptManager:
 
-    robotList=None          # smartquadtree
+    robotList=None          # SpatialGrid
     robotConfig=None        # robot.json file
     parent=None
     recentDir= ""           # last folder accessed
@@ -29,7 +29,9 @@ class ScriptManager:
     consoleSize=(600,150)
     console=None
     arena=(0,0)
+    arenaFile=None          # walls and obstacles, see Walls.py
     fps=50
+    cooperative=False       # passed to the Simulator
 
     botCount=0
     dialogVisible=False
@@ -48,7 +50,9 @@ class ScriptManager:
         if self.console is None:
             self.console = Console(consoleSize=self.consoleSize)
 
-        self.sim = Simulator(root=self.parent, arena=self.arena, fps=self.fps, console=self.console)
+        self.sim = Simulator(root=self.parent, arena=self.arena, fps=self.fps, console=self.console,
+                             cooperative=self.cooperative, arenaFile=self.arenaFile)
+        self.arena=self.sim.arena   # the arena file may give another size
         self.robotList=self.sim.getRobots()
 
         self.robotManager=RobotManager.RobotManager(robotConfig=self.robotConfig,sim=self.sim,arena=self.arena,
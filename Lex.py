@@ -2,10 +2,29 @@ import re
 import Exceptions
 import sys,traceback
 import random
+import threading
 from Constants import *
 from RobotControl import *
 from Script import *
 from ConsoleQueue import *
+from Compiler import *
+from Expression import *
+from Scheduler import *
+from Clock import *
+from Log import *
+
+
+class Frame():
+    """
+    the position reached in a block of compiled statements
+
+    loop is the WHILE or FOREVER node which owns the block or None for
+    IF blocks and the top level of the script
+    """
+    def __init__(self,block,loop=None):
+        self.block=block
+        self.index=0
+        self.loop=loop
 
 class Lex():
 
@@ -18,47 +37,17 @@ class Lex():
     terminated=False        # flag used when the script has actually stopped
     console=None
 
-    # used by DoNextStatement()
-    lastIndent=0
-    lastStatement=None
-
-    # never change, saves changing case
-    # commands may be indented AND may be followed by comments
-    # command words are terminated when a none Alpha character is encountered
-    reBreakContinue = re.compile(r"^\s*(break|continue)[^a-zA-Z]", re.IGNORECASE)
-    reBreak         = re.compile(r"^\s*(break)[^a-zA-Z]", re.IGNORECASE)
-    reContinue      = re.compile(r"^\s(continue)$", re.IGNORECASE)
-    reWhile         = re.compile(r"^\s*(while)[^a-zA-Z]", re.IGNORECASE)
-    reIf            = re.compile(r"^\s*(if)[^a-zA-Z]", re.IGNORECASE)
-    reElse          = re.compile(r"^\s*(else)$", re.IGNORECASE)
-    reForever       = re.compile(r"^\s*(forever)$", re.IGNORECASE)
-    reSet           = re.compile(r"^\s*(set)[^a-zA-Z]", re.IGNORECASE)
-    reIndent        = re.compile(r"^(\s*)(.*)$", re.IGNORECASE) # splits the indent from the rest of the line
-    rePrint         = re.compile(r"^\s*(print)[^a-zA-Z]", re.IGNORECASE)
-    rePrintln       = re.compile(r"^\s*(println)[^a-z-A-Z]", re.IGNORECASE)
-    reEnd           = re.compile(r"^\s*(end)[^a-zA-Z]", re.IGNORECASE)
-    reBegin         = re.compile(r"^\s*(begin)[^a-zA-Z]", re.IGNORECASE)
-
-    reEOF           = re.compile(r"^EOF$",re.IGNORECASE)
-
-    # extras
-
-    #reBreadcrumb    = re.compile(r"\s*(breadcrumb)")
-
-    # dynamic variables @<name>
-    reDistance      = re.compile(r".*(@distance)[^a-zA-Z]",re.IGNORECASE)
-    reRange         = re.compile(r".*(@range)[^a-zA-Z]", re.IGNORECASE)
-    reLight         = re.compile(r".*(@light)[^a-zA-Z]",re.IGNORECASE)
-    reMoving        = re.compile(r".*(@moving)[^a-zA-Z]",re.IGNORECASE)
-    reRandom        = re.compile(r".*(@random)[^a-zA-Z]",re.IGNORECASE)
-    reName          = re.compile(r".*(@name)[^a-zA-Z]",re.IGNORECASE)
-    reAngle         = re.compile(r".*(@angle)[^a-zA-Z]", re.IGNORECASE)
-    reCompass       = re.compile(r".*(@compass)[^a-zA-Z]", re.IGNORECASE)
-    reX             = re.compile(r".*(@x)[^a-zA-Z]", re.IGNORECASE)
-    reY             = re.compile(r".*(@y)[^a-zA-Z]", re.IGNORECASE)
-
-    foreverStack=[]
-    whileStack=[]
+    program=None        # compiled script, see Compiler.py
+    programSource=None  # the script lines which were compiled into program
+    frames=None         # stack of Frame() objects, the top one is being executed
+    statementCount=0    # statements since the script last gave way
+
+    scheduler=None      # Scheduler when running cooperatively, None for threads
+    ticker=None         # Ticker, lets threaded scripts sleep till the next simulator tick
+    finished=None       # threading.Event set when the script has stopped
+    clock=WALLCLOCK     # see Clock.py
+    statementsPerTick=100   # scripts which don't wait give way after this many statements
+    rng=random          # source of @random, the robot's own random.Random when in a Simulator
 
     def __init__(self,**kwargs):
         #print("Lex.__init__() starting..")
@@ -67,43 +56,55 @@ class Lex():
             setattr(self,key,value)
 
         self.globals={}
-        self.loopCount=0
-        self.beginCount=0
+        self.frames=[]
+
+        # how to execute each kind of compiled statement
+        self.executors={}
+        self.executors[COMMAND]     =   self._command
+        self.executors[PRINT]       =   self._print
+        self.executors[SET]         =   self._set
+        self.executors[IF]          =   self._if
+        self.executors[WHILE]       =   self._while
+        self.executors[FOREVER]     =   self._forever
+        self.executors[BREAK]       =   self._break
+        self.executors[CONTINUE]    =   self._continue
+
+        # values for @variables, see Expression.ATVARIABLES
+        self.atVariables={}
+        self.atVariables["distance"]=   self._distance
+        self.atVariables["range"]   =   self._range
+        self.atVariables["light"]   =   self._light
+        self.atVariables["moving"]  =   self._moving
+        self.atVariables["random"]  =   self._random
+        self.atVariables["name"]    =   self._name
+        self.atVariables["angle"]   =   self._angle
+        self.atVariables["compass"] =   self._compass
+        self.atVariables["x"]       =   self._x
+        self.atVariables["y"]       =   self._y
+        self.atVariables["collided"]=   self._collided
+        self.atVariables["bumped"]  =   self._bumped
 
         #assert self.console is not None,"A console is required."
 
         #print("Lex.__init__() adding robot controller")
-        self.machineControl=RobotController(robot=self.robot, fps=self.fps,console=self.console)
+        if self.ticker is None: self.ticker=Ticker()
+
+        self.machineControl=RobotController(robot=self.robot, fps=self.fps,console=self.console,
+                                            scheduler=self.scheduler, ticker=self.ticker, clock=self.clock)
 
         self.terminated=True
+        self.finished=threading.Event()
+        self.finished.set()
         #print("Lex.__init__() finished")
 
     def Error(self,msg):
         #print(self.robot.getName() + " ERROR:", msg, ".At line ", self.robot.script.getLineNumber())
-        console_println(self.robot.getName()+" ERROR:", msg, ".At line ", self.robot.script.getLineNumber())
+        LOG.console(self.robot.getName(),self.robot.getName()+" ERROR:", msg, ".At line ", self.robot.script.getLineNumber(),level=ERROR)
+        self.robot.scriptErrors+=1
         #exit(1)
 
     def Warn(self, msg):
-        console_println(self.robot.getName()+" WARNING:",msg, ".At line ", self.robot.script.getLineNumber())
-
-    def nextInstruction(self):
-        """
-        returns the next script instruction
-
-        if the end of script is encountered return EOF
-
-        :return: next instruction or EOF
-        """
-
-        if not self.running:
-            print("Lex.nextInstruction() Script is not running")
-            return EOF
-
-        source= self.robot.script.getNextInstruction()
-        if source is None:
-            print("Lex.nextInstruction() source is None")
-            return EOF
-        return source
+        LOG.console(self.robot.getName(),self.robot.getName()+" WARNING:",msg, ".At line ", self.robot.script.getLineNumber(),level=WARNING)
 
     def setLineNumber(self,lineNum):
         self.robot.script.setLineNumber(lineNum)
@@ -111,144 +112,91 @@ class Lex():
     def getLineNumber(self):
         return self.robot.script.getLineNumber()
 
-    def getIndent(self,sourceLine):
-
-        #print("getIndent sourceLine=",sourceLine)
-        m = self.reIndent.match(sourceLine)
-        if m:
-            g1 = m.group(1)
-            g2 = m.group(2)
-            g1 = g1.replace("\t", " " * TABLENGTH)
-            return len(g1), g2
-        else:
-            return 0, sourceLine
-
-    def Statement(self, thisIndent, statement):
+    def compileScript(self):
         """
-        All scripts are treated as non-indented statements
-        till FOREVER, WHILE, BEGIN or IF are found
+        compiles the robot script, if it hasn't changed since the last run
+        the previously compiled program is used
 
-        :param thisIndent:
-        :param statement:
-        :return:
+        :return list: compiled program or None if it would not compile
         """
-        #print("Statement=",statement)
-
-        if not self.running:
-            #print("NOT running")
-            return 0,EOF
-
-        if self.reIf.match(statement):
-            condition=statement[2:]
-            return self._if(thisIndent,condition)
-
-        elif self.reForever.match(statement):
-            return self._forever(thisIndent)
-
-        elif self.reWhile.match(statement):
-            condition=statement[5:]
-            return self._while(thisIndent,condition)
-
-        elif self.rePrint.match(statement):
-            expression=statement[5:]
-            return self._print(expression)
-
-        elif self.rePrintln.match(statement):
-            expression=statement[7:]
-            return self._println(expression)
-
-        elif self.reContinue.match(statement):
-            if self.loopCount==0:
-                self.Warn("Unexpected 'continue' ignored")
-                newIndent,statement=self.getIndent(self.nextInstruction())
-                return self.Statement(newIndent,statement)
-            return self._continue(thisIndent)
-
-        elif self.reEnd.match(statement):
-            if self.beginCount==0:
-                self.Warn("Unexpected 'end' ignored")
-                newIndent,statement=self.getIndent(self.nextInstruction())
-                return self.Statement(newIndent,statement)
-            return self._end(thisIndent)
-
-        elif self.reBreak.match(statement):
-            if self.loopCount==0:
-                self.Warn("Unexpected 'break' ignored")
-                newIndent, statement = self.getIndent(self.nextInstruction())
-                return self.Statement(newIndent,statement)
-            return self._break(thisIndent)
-
-        elif self.reSet.match(statement):
-            return self._set(thisIndent,statement[3:])
+        source=self.robot.script.getLines()
+        if self.program is not None and source is self.programSource:
+            return self.program
+
+        compiler=Compiler()
+        try:
+            program=compiler.compile(source)
+        except Exceptions.Error as e:
+            self.Error(e.args[0])
+            return None
+
+        for lineNumber,msg in compiler.warnings:
+            self.setLineNumber(lineNumber)
+            self.Warn(msg)
+
+        self.program=program
+        self.programSource=source
+        return program
+
+    def execute(self,program,frames=None):
+        """
+        walks the compiled program
 
-        elif self.reElse.match(statement):
-            return self._else(thisIndent)
+        A generator which yields a Wait (see Scheduler.py) whenever a command
+        needs time to complete. Scripts which never wait yield every
+        statementsPerTick statements so other robots get a turn.
 
-        elif self.reEOF.match(statement):
-            self.Error("EOF")
+        Finishes when the program ends or stop() is called
 
+        :param list program: top level block from compileScript()
+        :param list frames: carry on from these frames (see Snapshot.py) instead of the start
+        :return: nothing
+        """
+        if frames is None:
+            self.frames=[Frame(program)]
+            self.statementCount=0
         else:
-            # only machine instructions MOVE,ANGRY,HAPPY,SOUND etc are allowed
-            self.lastCmdDone=self.machineControl.doCommand(statement)
-            # machine control does not change the indent
-            return self.getIndent(self.nextInstruction())
+            self.frames=frames
 
-    def skipIndentedStatements(self,thisIndent):
-        newIndent,statement=self.getIndent(self.nextInstruction())
+        while self.frames and self.running:
+            frame=self.frames[-1]
 
-        while newIndent>thisIndent:
-            newIndent, statement = self.getIndent(self.nextInstruction())
+            if frame.index>=len(frame.block):
+                self.endOfBlock()
+                continue
 
-        return newIndent,statement
+            node=frame.block[frame.index]
+            frame.index+=1
+            self.setLineNumber(node.lineNumber)
+            wait=self.executors[node.kind](node)
 
-    def indentedStatement(self,thisIndent):
-        """
-        handles statements which are expected to be indented
+            self.statementCount+=1
+            if wait is None and self.statementCount>=self.statementsPerTick:
+                wait=Wait()
 
-        Terminates when an outdented statement is encountered
+            if wait is not None:
+                self.statementCount=0
+                yield wait
 
-        :param int thisIndent: current indent level
-        :return tuple: (newIndent,statement)
+    def endOfBlock(self):
         """
+        the top frame has run out of statements.
 
-        newIndent,statement=self.getIndent(self.nextInstruction())
-
-        while newIndent>thisIndent:
-
-            #print(self.robot.getName()+" indentedStatement thisIndent=",thisIndent,"newIndent=",newIndent,
-            #      "statement=",statement)
-
-            # end of script terminates an indented statement
-            if self.reEOF.match(statement):
-                return newIndent, statement
-
-            # break or continue - but may not be inside a loop
-            if self.reBreakContinue.match(statement):
-                return newIndent, statement
-
-            newIndent,statement=self.Statement(newIndent, statement)
-
-
-        # ok we've backed out of the indenting
-
-        return newIndent,statement
-
-    # break/end/continue/else
-    # simply return themselves so caller can check
-
-    def _break(self,thisIndent):
-        self.loopCount-=1
-        return thisIndent,"break"
+        FOREVER blocks start again, WHILE blocks start again if the
+        condition is still true. Anything else returns to the enclosing block.
+        """
+        frame=self.frames[-1]
+        loop=frame.loop
 
-    def _continue(self,thisIndent):
-        return thisIndent,"continue"
+        if loop is None:
+            self.frames.pop()
+            return
 
-    def _end(self,thisIndent):
-        self.beginCount-=1
-        return thisIndent,"end"
+        if loop.kind==WHILE and not self._EvalExpression(loop.condition):
+            self.frames.pop()
+            return
 
-    def _else(self,thisIndent):
-        return thisIndent,"else"
+        frame.index=0
 
     # @variables
 
@@ -262,7 +210,7 @@ class Lex():
         return 0
 
     def _random(self):
-        return random.randint(1,12)
+        return self.rng.randint(1,12)
 
     def _moving(self):
         if self.robot.getSpeed()>0: return True
@@ -299,248 +247,158 @@ class Lex():
     def _y(self):
         return int(self.robot.get_y())
 
+    def _collided(self):
+        """
+        True if the robot has touched another robot since @collided was last read
+        """
+        collided=self.robot.collided
+        self.robot.collided=False
+        return collided
+
+    def _bumped(self):
+        """
+        True if the robot has hit a wall since @bumped was last read
+        """
+        bumped=self.robot.bumped
+        self.robot.bumped=False
+        return bumped
+
     # normal statements
 
     def _EvalExpression(self,expr):
         """
-        Uses pythjon's eval() to evaluate an expression.
+        Evaluates a compiled expression (see Expression.py)
 
-        Before doing so it resolves @<varnam> variables
+        Only the @variables used by the expression are read.
 
-        :param expr:
+        :param CompiledExpression or str expr: source text is compiled (and cached) first
         :return: value of expr
         """
-
-        #print ("Lex._EvalExpression() before expr=",expr)
-
-        r = self.reX.match(expr)
-        if r:
-            expr = expr.replace(r.group(1), str(self._x()))
-
-        r = self.reY.match(expr)
-        if r:
-            expr = expr.replace(r.group(1), str(self._y()))
-
-        r = self.reAngle.match(expr)
-        if r:
-            expr = expr.replace(r.group(1), str(self._angle()))
-
-        r = self.reCompass.match(expr)
-        if r:
-            expr = expr.replace(r.group(1), str(self._compass()))
-
-        r=self.reDistance.match(expr)
-        if r:
-            expr=expr.replace(r.group(1),str(self._distance()))
-
-        r = self.reRange.match(expr)
-        if r:
-            expr = expr.replace(r.group(1), str(self._range()))
-
-        r = self.reLight.match(expr)
-        if r:
-            expr=expr.replace(r.group(1), str(self._light()))
-
-        r = self.reMoving.match(expr)
-        if r:
-            expr=expr.replace(r.group(1), str(self._moving()))
-        r = self.reRandom.match(expr)
-
-        if r:
-            expr=expr.replace(r.group(1), str(self._random()))
-
-        r = self.reName.match(expr)
-        if r:
-            expr=expr.replace(r.group(1), str(self._name()))
-
-        #print ("Lex._EvalExpression() after expr=",expr)
-
-        return eval(expr, self.globals)
-
-    def _print(self,expression):
-        console_print(self.robot.getName(), ":", self._EvalExpression(expression))
-        return self.getIndent(self.nextInstruction())
-
-    def _println(self,expression):
-        console_println(self.robot.getName(), ":", self._EvalExpression(expression))
-        return self.getIndent(self.nextInstruction())
-
-    def _begin(self,thisIndent):
-        self.beginCount+=1
-        newIndent,statement=self.getIndent(self.nextInstruction())
-        if newIndent<=thisIndent:
-            self.Error("BEGIN should be followed by an indented statement.")
-        newIndent,statement=self.Statement(newIndent, statement)
-
-        while newIndent>thisIndent:
-            newIndent,statement=self.indentedStatement(newIndent)
-
-        if not self.reEnd.match(statement):
-            self.Error("Expected END")
-
-        self.beginCount-=1
-        return newIndent,statement
-
-    def _if(self,thisIndent,condition):
-        result=self._EvalExpression(condition)
-
-        if result:
-            # do the indented 'then' statements
-            newIndent,statement=self.indentedStatement(thisIndent)
-
-            # skip the 'else' clause if there is one
-            if self.reElse.match(statement):
-                newIndent,statement=self.skipIndentedStatements(thisIndent)
-
+        if type(expr) is str:
+            expr=compileExpression(expr)
+
+        namespace={}
+        for name in expr.variables:
+            namespace[PREFIX+name]=self.atVariables[name]()
+
+        return eval(expr.code, self.globals, namespace)
+
+    def _command(self,node):
+        # only machine instructions MOVE,ANGRY,HAPPY,SOUND etc are allowed
+        # timed commands return a Wait
+        self.robot.logEvent(node.command)
+        result=self.machineControl.doCommand(node.command)
+        if isinstance(result,Wait):
+            self.lastCmdDone=False
+            return result
+        self.lastCmdDone=result
+
+    def _print(self,node):
+        value=self._EvalExpression(node.expression)
+        self.robot.logEvent(value)
+        LOG.console(self.robot.getName(),self.robot.getName(), ":", value,end="\n" if node.newline else "")
+
+    def _set(self,node):
+        self.globals[node.varname]=self._EvalExpression(node.expression)
+
+    def _if(self,node):
+        if self._EvalExpression(node.condition):
+            block=node.thenBlock
         else:
-            # skip the 'then' clause
-            newIndent,statement=self.skipIndentedStatements(thisIndent)
+            block=node.elseBlock
 
-            # process the ELSE clause if there is one
-            r=self.reElse.match(statement)
-            if r:
-                newIndent, statement = self.indentedStatement(newIndent)
+        if len(block)>0:
+            self.frames.append(Frame(block))
 
-        return newIndent,statement
+    def _while(self,node):
+        if self._EvalExpression(node.condition):
+            self.frames.append(Frame(node.body,node))
 
-    def _while(self,thisIndent,condition):
+    def _forever(self,node):
+        self.frames.append(Frame(node.body,node))
 
-        self.loopCount+=1
-        # need to know where to go back to
-        self.whileStack.append(self.getLineNumber())
-        newIndent=0
+    def _break(self,node):
+        # throw away frames up to and including the loop
+        frame=self.frames.pop()
+        while frame.loop is None:
+            frame=self.frames.pop()
 
-        while True:
-            r=eval(condition,self.globals)
-            # end of while loop
-            if not r:
-                r=self.whileStack.pop()   # throw away
-                return self.skipIndentedStatements(thisIndent)
+    def _continue(self,node):
+        # throw away frames inside the loop then go back to the start of it
+        while self.frames[-1].loop is None:
+            self.frames.pop()
+        frame=self.frames[-1]
+        frame.index=len(frame.block)
 
-            # the first statement following the while
-            newIndent,statement=self.indentedStatement(thisIndent)
-
-            while newIndent > thisIndent:
+    def stop(self,timeout=STOP_TIMEOUT):
+        """
+        stop the script
 
-                # break
-                if self.reBreak.match(statement):    #statement[:5].lower()=="break":
-                    # skip everything
-                    r=self.whileStack.pop()
-                    return self.skipIndentedStatements(newIndent)
+        Waiting commands are woken so this normally takes no time at all
 
-                #continue - back to while statement
-                elif self.reContinue.match(statement):
-                    self.setLineNumber(self.whileStack.pop())
-                    newIndent=thisIndent
-                    break
+        :param float timeout: seconds to wait for a threaded script to finish
+        :return bool: True if the script has stopped
+        """
+        self.running=False
+        self.machineControl.stop()
 
-                else:
-                    newIndent,statement=self.Statement(newIndent, statement)
+        if self.scheduler is not None:
+            # the task is closed here and now, it may not have started yet
+            self.scheduler.cancel(self.robot)
+            self.terminated=True
+            self.finished.set()
+            return True
 
-            # indented statements have been done
-            # go back to the beginning
-            self.setLineNumber(self.whileStack.pop())
-            newIndent = thisIndent
-            return thisIndent,statement
+        return self.finished.wait(timeout)
 
-    def _forever(self, thisIndent):
+    def start(self):
         """
-        statement will be FOREVER so
-        :param thisIndent:
+        Called before task() or run() so that a stop() which arrives before
+        the script thread gets going is not lost.
+
         :return:
         """
-        # need to know where to go back to
-        #print(self.robot.getName()+" FOREVER starts thisIndent=",thisIndent," at line ",self.getLineNumber())
-
-        self.foreverStack.append(self.getLineNumber())
-        self.loopCount -= 1
-
-        # this should consume all indented lines unless a break/continue/EOF occurs
-
-        newIndent, statement = self.indentedStatement(thisIndent)
-
-        #print(self.robot.getName()+" FOREVER finishes indented statements with indent",newIndent,"statement=",
-        #      statement," at line ",self.getLineNumber())
-
-        # find out what statement terminated the forever
-
-        self.loopCount-=1
-
-        if newIndent<=thisIndent:
-            self.setLineNumber(self.foreverStack.pop())
-            return thisIndent, "forever"
-
-        if self.reBreak.match(statement):
-            self.foreverStack.pop() # not looping so throw it away
-            return self.skipIndentedStatements(newIndent)
+        self.machineControl.run()
+        self.running=True
+        self.terminated=False   # used to tell when the script has stopped
+        self.finished.clear()
 
-        elif self.reContinue.match(statement):
-            # go back to start of loop
-            self.setLineNumber(self.foreverStack.pop())
-            # we need the forever code to be reinterpreted
-            #print(self.robot.getName()+"#1 FOREVER next line=", self.getLineNumber())
-            return thisIndent,"forever"
+    def task(self,frames=None):
+        """
+        Runs the robot script as a generator, see Scheduler.py
 
-        elif self.reEOF.match(statement):
-            # we have reached the end of the indented statements
-            # go back to the beginning of the loop
-            self.setLineNumber(self.foreverStack.pop())
-            #print(self.robot.getName()+" #2 FOREVER next line=",self.getLineNumber(),"statement",statement)
-            # we need the forever code to be reinterpreted
-            return thisIndent,"forever"
+        yields a Wait whenever the script has to wait
 
-        else:
-            print(self.robot.getName()+" FOREVER exit error statement=",statement)
-            self.loopCount-=1
-            self.setLineNumber(self.foreverStack.pop())
-            return thisIndent,"forever"
-
-    def _set(self,thisIndent,statement):
-        """
-        expression should be like var=,expression>
-        :param thisIndent:
-        :param expression:
+        :param list frames: resume from these frames instead of the start
         :return:
         """
-        p=re.compile("^\s*([a-zA-Z_]\w+)\s*=\s*(.*)$")
-        r=p.match(statement)
-        if r:
-            varname=r.group(1)
-            expr=r.group(2)
-            self.globals[varname]=eval(expr,self.globals)
-            return self.getIndent(self.nextInstruction())
-        else:
-            self.Error("Expected something of the form <var>=<expr>")
-
-    def stop(self):
-        self.running=False
-        self.machineControl.stop()
-        t0=time.time()
-        # flag is set by background tasks when they terminate
-        while not self.terminated:
-            # timeout waiting for 'terminated' from any background thread
-            # if no threads are running this times out
-            if time.time()-t0>0.1: break
+        LOG.debug("script",self.robot.getName()+" Lex.task() begins",robot=self.robot.getName())
+        if frames is None:
+            self.robot.script.restart()
+
+        try:
+            program=self.compileScript()
+            if program is not None:
+                yield from self.execute(program,frames)
+
+        except Exception as e:
+            # e.g. an expression using a variable which hasn't been SET
+            LOG.error("script",traceback.format_exc(),robot=self.robot.getName())
+            self.Error(repr(e))
+
+        finally:
+            LOG.debug("script",self.robot.getName()+" Lex: Script has terminated at line ",self.getLineNumber(),robot=self.robot.getName())
+            self.terminated=True
+            self.machineControl.stop()
+            self.finished.set()
 
     def run(self):
         """
-        Run's the robot script in a seperate thread
+        Run's the robot script in a seperate thread, call start() first
 
         No return till the script ends or is terminated by stop()
 
         :return:
         """
-        print(self.robot.getName()+" Lex.run() begins")
-        self.robot.script.restart()
-        self.machineControl.run()
-        indent=0
-        self.running=True
-        self.terminated=False   # used to tell when the script has stopped
-
-        instruction=self.nextInstruction()
-        while (not self.reEOF.match(instruction)) and self.running:
-            indent,instruction=self.Statement(indent,instruction)
-
-        print(self.robot.getName()+" Lex: Script has terminated with instruction ",instruction)
-        self.terminated=True
-        self.machineControl.stop()
\ No newline at end of file
+        for wait in self.task():
+            runWait(wait,self.fps,self,self.ticker)
@@ -13,14 +13,25 @@ class Line():
     collision paths
 
     y=mx+c
+
+    or x=x for vertical lines, which have no slope
     """
     slope=0
     c=0
+    vertical=False
+    x=0
 
     def __init__(self,direction,x,y):
-        self.slope=math.tan(math.radians(direction))
-        divisor=self.slope*float(x)
-        try:
-            self.c=y/divisor
-        except Exception as e:
-            print("Line.__init__() Division by zero slope=",self.slope,"x=",x)
\ No newline at end of file
+        """
+        :param float direction: degrees
+        :param float x: a point on the line
+        :param float y:
+        """
+        angle=math.radians(direction)
+        if abs(math.cos(angle))<1e-9:
+            self.vertical=True
+            self.x=x
+            return
+
+        self.slope=math.tan(angle)
+        self.c=y-self.slope*x
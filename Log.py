@@ -0,0 +1,230 @@
+"""
+Log.py
+
+One place for everything the simulator and the robot scripts have to say
+
+    LOG.debug("collision","Bot",a.getName(),"has collided with",b.getName(),robot=a.getName())
+    LOG.console(robot.getName(),":",value)       # also shown in the Console window
+
+Each message is put on a queue and nothing else - the text isn't even joined
+together. A writer thread started by the first message does the rest:
+
+    messages with console=True go to the Console (see ConsoleQueue.py)
+    messages at stdoutLevel or above are printed
+    everything is written to a json lines file if open() has been called
+
+Each line of the file is one message:
+
+    {"time":..,"level":"INFO","category":"script","robot":"Fred","msg":"Fred:hello"}
+
+The file is rotated when it gets bigger than maxBytes, keeping `backups`
+old files as path.1, path.2 ... With backups=0 the file is just truncated.
+
+Categories can be turned off with suppress() or thinned out with
+setSampling(), e.g. setSampling("collision",100) keeps one message in 100.
+
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+from Constants import *
+from ConsoleQueue import *
+
+DEBUG=10
+INFO=20
+WARNING=30
+ERROR=40
+
+LEVELNAMES={DEBUG:"DEBUG",INFO:"INFO",WARNING:"WARNING",ERROR:"ERROR"}
+
+
+class LogBus():
+    """
+    LOG.open("pixelbot.jsonl")
+    LOG.setLevel(INFO)
+    LOG.warning("wheel","rps too high",robot="Fred")
+    LOG.flush()
+    """
+    level=DEBUG                 # messages below this are ignored
+    stdoutLevel=LOG_STDOUTLEVEL # messages at this level or above are printed
+    path=None                   # json lines file, None for no file
+    maxBytes=LOG_MAXBYTES       # size the file is rotated at
+    backups=LOG_BACKUPS         # rotated files kept
+    queueSize=LOG_QUEUESIZE     # messages waiting to be written, oldest are dropped
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.queue=deque(maxlen=self.queueSize)     # append and popleft need no lock
+        self.flushes=deque()    # Events for flush() to wait on, never dropped
+        self.wake=threading.Event()
+        self.thread=None
+        self.startLock=threading.Lock()
+        self.file=None
+
+        self.suppressed=set()   # categories ignored
+        self.sampling={}        # category: keep one message in this many
+        self.counts={}          # category: messages seen, for sampling
+        self.dropped=0          # lost because the queue was full
+        self.written=0
+
+    # settings
+
+    def open(self,path):
+        """
+        start writing messages to path as well
+        """
+        self.flush()
+        self.path=path
+        self.file=open(path,"a")
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file=None
+        self.path=None
+
+    def setLevel(self,level):
+        self.level=level
+
+    def suppress(self,category,suppressed=True):
+        if suppressed:
+            self.suppressed.add(category)
+        else:
+            self.suppressed.discard(category)
+
+    def setSampling(self,category,every):
+        """
+        :param int every: keep one message in every, 1 keeps them all
+        """
+        self.sampling[category]=every
+        self.counts[category]=0
+
+    # logging
+
+    def log(self,level,category,*args,robot=None,console=False,sep=" ",end="\n"):
+        """
+        queue a message, the only work done by the caller
+
+        :param int level: DEBUG, INFO, WARNING or ERROR
+        :param str category: e.g. "collision", "script", "motion"
+        :param args: joined with sep by the writer thread, like print()
+        :param str robot: name of the robot the message is about
+        :param bool console: show it in the Console window
+        """
+        if level<self.level or category in self.suppressed:
+            return
+
+        every=self.sampling.get(category)
+        if every is not None:
+            count=self.counts[category]
+            self.counts[category]=count+1
+            if count%every!=0: return
+
+        if len(self.queue)==self.queue.maxlen:
+            self.dropped+=1
+        self.queue.append((time.time(),level,category,robot,args,sep,end,console))
+
+        if self.thread is None:
+            self._start()
+        self.wake.set()
+
+    def debug(self,category,*args,**kwargs):
+        self.log(DEBUG,category,*args,**kwargs)
+
+    def info(self,category,*args,**kwargs):
+        self.log(INFO,category,*args,**kwargs)
+
+    def warning(self,category,*args,**kwargs):
+        self.log(WARNING,category,*args,**kwargs)
+
+    def error(self,category,*args,**kwargs):
+        self.log(ERROR,category,*args,**kwargs)
+
+    def console(self,robot,*args,level=INFO,end="\n"):
+        """
+        script output for the Console window, joined without spaces like console_println()
+        """
+        self.log(level,"script",*args,robot=robot,console=True,sep="",end=end)
+
+    def flush(self,timeout=2):
+        """
+        wait till everything queued so far has been written
+
+        :return bool: False if the writer didn't catch up within timeout
+        """
+        if self.thread is None:
+            return True
+        done=threading.Event()
+        self.flushes.append(done)
+        self.wake.set()
+        return done.wait(timeout)
+
+    # the writer thread
+
+    def _start(self):
+        with self.startLock:
+            if self.thread is None:
+                self.thread=threading.Thread(target=self._run,name="LogBus",daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+
+            # anything queued before these flushes is written by the time the queue is empty
+            flushes=[]
+            while self.flushes:
+                flushes.append(self.flushes.popleft())
+
+            while self.queue:
+                self._write(self.queue.popleft())
+            if self.file is not None:
+                self.file.flush()
+
+            for done in flushes:
+                done.set()
+
+    def _write(self,entry):
+        when,level,category,robot,args,sep,end,console=entry
+        msg=sep.join(map(str,args))
+
+        if console:
+            if end=="\n":
+                console_println(msg)
+            else:
+                console_print(msg)
+
+        if level>=self.stdoutLevel:
+            print(msg)
+
+        if self.file is not None:
+            line=json.dumps({"time":round(when,6),"level":LEVELNAMES.get(level,level),"category":category,
+                             "robot":robot,"msg":msg})
+            self.file.write(line+"\n")
+            self.written+=1
+            if self.file.tell()>self.maxBytes:
+                self._rotate()
+
+    def _rotate(self):
+        """
+        path becomes path.1, path.1 becomes path.2 ... the oldest is removed.
+        With no backups path is just emptied.
+        """
+        self.file.close()
+        for i in range(self.backups,0,-1):
+            older=self.path if i==1 else "%s.%d"%(self.path,i-1)
+            if os.path.exists(older):
+                os.replace(older,"%s.%d"%(self.path,i))
+        self.file=open(self.path,"w")
+
+
+# shared by everything
+LOG=LogBus()
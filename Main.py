@@ -3,10 +3,12 @@
 """
 print("PIXELBOT SIMULATOR STARTING - PLEASE WAIT")
 import time
+import sys
 t0=time.clock()
 from tkinter import *
 from Forms import ScriptManager
 from Constants import *
+from Log import *
 t1=time.clock()
 print("Main imports took %.6fs"%(t1-t0))
 
@@ -14,13 +16,18 @@ print("Main imports took %.6fs"%(t1-t0))
 CONSOLE=(600,150)
 MANAGER=(600,800)
 FPS=50
+ARENAFILE=sys.argv[1] if len(sys.argv)>1 else None    # python Main.py maze.json
+
+# everything said by the simulator and the scripts, see Log.py
+LOG.open(LOG_FILE)
 
 root=Tk()
 
 sm=ScriptManager.ScriptManager(parent=root,size=MANAGER,arena=ARENA,consoleSize=CONSOLE ,fps=FPS,
-                               robotConfig="robot.json")
+                               robotConfig="robot.json",arenaFile=ARENAFILE)
 sm.show() # no return till program is stopped
 
 root.destroy()
 
+LOG.close()
 print("Program closed")
\ No newline at end of file
@@ -8,6 +8,7 @@ Basically this is drawn on top of the robot
 import math
 import pygame
 import time
+from Clock import *
 
 class PixelRing(object):
     # parameters expected
@@ -20,6 +21,7 @@ class PixelRing(object):
     ledColor=None               # list of Leds in the ring
     ledFlashRate=1              # flashing once per sec
     ledsOn=True
+    clock=WALLCLOCK             # see Clock.py
 
 
     def __init__(self,**kwargs):
@@ -31,7 +33,7 @@ class PixelRing(object):
 
         # build the led list
         self.ledColor=[]
-        self.nextLedChange = time.time()
+        self.nextLedChange = self.clock.time()
         self.ledsOn=True
 
         for led in range(self.numLeds):
@@ -41,23 +43,42 @@ class PixelRing(object):
         self.happy()
 
     def setLedStatus(self):
-        now=time.time()
+        now=self.clock.time()
         if now>=self.nextLedChange:
             self.ledsOn=not self.ledsOn
             self.nextLedChange=now+(1/self.ledFlashRate)
 
-    def draw(self,pos,canvas):
-        x,y=pos
-        ledAngle = 2 * math.pi / self.numLeds
+    def getLedColors(self):
+        """
+        what the LEDs are showing now, black when flashed off
 
+        Used as part of the SpriteCache key
+
+        :return tuple: one color per LED
+        """
         self.setLedStatus() # on or off
 
+        if self.ledsOn:
+            return tuple(self.ledColor)
+        return (0x000000,)*self.numLeds
+
+    def drawLeds(self,pos,canvas,colors):
+        """
+        :param tuple pos: centre of the ring
+        :param Surface canvas: to draw on
+        :param list colors: one per LED
+        """
+        x,y=pos
+        ledAngle = 2 * math.pi / self.numLeds
+
         for led in range(self.numLeds):
             ledX=x+self.ledRingRadius*math.cos(ledAngle*led)
             ledY=y+self.ledRingRadius*math.sin(ledAngle*led)
 
-            color=self.ledColor[led] if self.ledsOn else 0x000000
-            pygame.draw.circle(canvas, color, (int(ledX), int(ledY)), self.ledRadius, 0)
+            pygame.draw.circle(canvas, colors[led], (int(ledX), int(ledY)), self.ledRadius, 0)
+
+    def draw(self,pos,canvas):
+        self.drawLeds(pos,canvas,self.getLedColors())
 
     def angry(self,howAngry=3):
         # fast flashing red
@@ -0,0 +1,423 @@
+"""
+Recording.py
+
+Record a simulation run and play it back
+
+The Recorder writes the state of every robot after each physics step -
+position, heading, the LEDs showing and the sonar result - plus the script
+commands and prints. The Replayer draws it back without running any scripts
+and can jump to any tick.
+
+File layout, all integers little endian:
+
+    header  b"PXBREC" version(H) length(I) json        arena, physicsHz, seed, walls, obstacles
+    chunk   b"CHNK" firstTick(I) ticks(I) length(I) zlib data
+    ...
+    index   b"INDX" length(I) json                  [[firstTick,offset,ticks],...]
+    trailer b"TAIL" offset of index(Q)
+
+The file is only ever appended to. Each chunk holds RECORD_CHUNKTICKS ticks
+and can be decompressed on its own, so it is a keyframe. The index is
+written by close(), if the run crashed the Replayer rebuilds it by reading
+the chunk headers.
+
+Events carry the tick they happened on, the same tick as the state recorded
+at the end of it. A threaded script can log an event just after its tick
+was written so an event can be in the chunk after the one holding its tick.
+
+Decompressed chunk data is a json part holding the robots (in fleet slot
+order) and the script events, followed by one record per tick:
+
+    tick(I) time(d) count(H) then count entries of TICKDTYPE
+
+"""
+
+import json
+import struct
+import zlib
+import bisect
+import numpy
+import pygame
+from pygame.locals import *
+from Constants import *
+from Exceptions import *
+from PixelRing import *
+from UltraSound import *
+from SpriteCache import *
+from Colors import *
+from Events import *
+from Walls import *
+from Log import *
+
+MAGIC=b"PXBREC"
+VERSION=1
+
+HEADER=struct.Struct("<6sHI")
+CHUNK=struct.Struct("<4sIII")
+INDEX=struct.Struct("<4sI")
+TRAILER=struct.Struct("<4sQ")
+TICK=struct.Struct("<IdH")
+JSONLENGTH=struct.Struct("<I")
+
+# one per robot per tick
+TICKDTYPE=numpy.dtype([
+    ("x","<f4"),
+    ("y","<f4"),
+    ("heading","<f4"),
+    ("nearest","<i2"),          # fleet slot of the nearest bot in the sonar cone, -1 none
+    ("distance","<f4"),
+    ("leds","<u4",(PIXELRING_NUMLEDS,)),   # colours showing, black when flashed off
+])
+
+
+class Recorder():
+    """
+    rec=Recorder(path="run.pxb",simulator=sim)
+    sim.recorder=rec    # the Simulator calls rec.record() each physics step
+    ...
+    rec.close()
+    """
+    path=None
+    simulator=None
+    chunkTicks=RECORD_CHUNKTICKS    # ticks per compressed chunk
+    compression=6                   # zlib level
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        sim=self.simulator
+        self.file=open(self.path,"wb")
+        self.index=[]           # [firstTick,offset,ticks] per chunk
+        self.pending=[]         # encoded tick records for the current chunk
+        self.events=[]          # [tick,robot name,text] for the current chunk
+        self.firstTick=None
+        self.robots=[]          # robot descriptions for the current chunk
+        self.contacts=sim.events.subscribe(kinds=(CONTACT,WALL))
+
+        meta=json.dumps({"arena":list(sim.arena),"physicsHz":sim.physicsHz,"seed":sim.seed,
+                         "walls":[list(s) for s in sim.walls.segments],
+                         "obstacles":[[list(p) for p in poly] for poly in sim.walls.polygons]}).encode()
+        self.file.write(HEADER.pack(MAGIC,VERSION,len(meta)))
+        self.file.write(meta)
+
+    def logEvent(self,bot,text):
+        """
+        a script command or print
+
+        :param PixelBot bot: who did it
+        :param str text:
+        """
+        self.events.append([self.simulator.ticks,bot.getName(),str(text)])
+
+    def record(self,sim):
+        """
+        add the state after a physics step
+
+        :param Simulator sim:
+        """
+        fleet=sim.fleet
+        bots=fleet.getRobots()
+        n=len(bots)
+
+        state=numpy.zeros(n,dtype=TICKDTYPE)
+        state["x"]=fleet.x[:n]
+        state["y"]=fleet.y[:n]
+        state["heading"]=fleet.heading[:n]
+        state["nearest"]=-1
+        state["distance"]=OUTOFRANGE
+
+        results=sim.sensors.results
+        if results is not None:
+            m=min(n,len(results[0]))
+            state["nearest"][:m]=results[0][:m]
+            state["distance"][:m]=results[1][:m]
+
+        for slot,bot in enumerate(bots):
+            state["leds"][slot]=bot.pixelRing.getLedColors()
+
+        # bumps go in with the script events
+        for batch in self.contacts.getAll():
+            for event in batch.events.tolist():
+                kind,tick,robot,other=event[:4]
+                if kind==CONTACT:
+                    self.events.append([tick,bots[robot].getName(),"CONTACT "+bots[other].getName()])
+                elif kind==WALL:
+                    self.events.append([tick,bots[robot].getName(),"WALL"])
+
+        if self.firstTick is None:
+            self.firstTick=sim.ticks
+            self.robots=[self.describe(bot) for bot in bots]
+        elif n>len(self.robots):
+            # added since the chunk started
+            self.robots.extend(self.describe(bot) for bot in bots[len(self.robots):])
+
+        self.pending.append(TICK.pack(sim.ticks,sim.clock.time(),n)+state.tobytes())
+
+        if len(self.pending)>=self.chunkTicks:
+            self.flush()
+
+    def describe(self,bot):
+        return {"name":bot.getName(),"color":getColorByName(bot.getColor()),"size":bot.getSize()}
+
+    def flush(self):
+        """
+        compress and write the current chunk
+        """
+        if len(self.pending)==0: return
+
+        meta=json.dumps({"robots":self.robots,"events":self.events}).encode()
+        data=zlib.compress(JSONLENGTH.pack(len(meta))+meta+b"".join(self.pending),self.compression)
+
+        self.index.append([self.firstTick,self.file.tell(),len(self.pending)])
+        self.file.write(CHUNK.pack(b"CHNK",self.firstTick,len(self.pending),len(data)))
+        self.file.write(data)
+        self.file.flush()
+
+        self.pending=[]
+        self.events=[]
+        self.firstTick=None
+
+    def close(self):
+        """
+        write the last chunk and the index
+        """
+        if self.file is None: return
+
+        self.flush()
+        offset=self.file.tell()
+        index=json.dumps(self.index).encode()
+        self.file.write(INDEX.pack(b"INDX",len(index)))
+        self.file.write(index)
+        self.file.write(TRAILER.pack(b"TAIL",offset))
+        self.file.close()
+        self.simulator.events.unsubscribe(self.contacts)
+        self.file=None
+
+
+class Frame():
+    """
+    one tick of a recording
+
+    robots      list of dicts, name color and size
+    state       numpy array of TICKDTYPE, one per robot
+    events      [tick,name,text] which happened on this tick
+    """
+    tick=0
+    time=0
+    robots=None
+    state=None
+    events=None
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+
+class Replayer():
+    """
+    rep=Replayer(path="run.pxb")
+    frame=rep.getFrame(tick)
+    rep.drawFrame(canvas,tick)
+    rep.play()      # in a pygame window, left and right arrows jump 10 seconds
+    """
+    path=None
+    canvasColor=CANVASCOLOR
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.file=open(self.path,"rb")
+
+        magic,version,length=HEADER.unpack(self.file.read(HEADER.size))
+        if magic!=MAGIC:
+            raise RecordingError(self.path+" is not a simulator recording")
+        if version>VERSION:
+            raise RecordingError(self.path+" was recorded by a newer version")
+
+        meta=json.loads(self.file.read(length).decode())
+        self.arena=tuple(meta["arena"])
+        self.physicsHz=meta["physicsHz"]
+        self.seed=meta["seed"]
+        self.walls=Walls(arena=self.arena,segments=[tuple(s) for s in meta.get("walls",[])],
+                         polygons=[[tuple(p) for p in poly] for poly in meta.get("obstacles",[])])
+        self.dataStart=self.file.tell()
+
+        self.index=self.readIndex()
+        self.chunks={}          # offset: decoded chunk, only the last two are kept
+        self.lastChunk=None     # offset of the chunk used last
+
+        # used to draw with the same sprites as the simulator
+        self.ring=PixelRing(outerRadius=PIXELRING_OUTERRADIUS,numLeds=PIXELRING_NUMLEDS,
+                            ledRadius=PIXELRING_LEDRADIUS)
+        self.sensor=DistSensor()
+
+    def readIndex(self):
+        """
+        :return list: [firstTick,offset,ticks] per chunk
+        """
+        self.file.seek(0,2)
+        end=self.file.tell()
+
+        if end-self.dataStart>=TRAILER.size:
+            self.file.seek(end-TRAILER.size)
+            tag,offset=TRAILER.unpack(self.file.read(TRAILER.size))
+            if tag==b"TAIL":
+                self.file.seek(offset)
+                tag,length=INDEX.unpack(self.file.read(INDEX.size))
+                return json.loads(self.file.read(length).decode())
+
+        # no index, the run didn't finish. Read the chunk headers instead
+        chunks=[]
+        offset=self.dataStart
+        while offset+CHUNK.size<=end:
+            self.file.seek(offset)
+            tag,firstTick,ticks,length=CHUNK.unpack(self.file.read(CHUNK.size))
+            if tag!=b"CHNK" or offset+CHUNK.size+length>end: break     # a partly written chunk
+            chunks.append([firstTick,offset,ticks])
+            offset+=CHUNK.size+length
+
+        return chunks
+
+    def getTickRange(self):
+        """
+        :return tuple: first and last tick recorded, None if empty
+        """
+        if len(self.index)==0: return None
+        firstTick,offset,ticks=self.index[-1]
+        return self.index[0][0],firstTick+ticks-1
+
+    def _chunk(self,entry):
+        firstTick,offset,ticks=entry
+        chunk=self.chunks.get(offset)
+        if chunk is None:
+            tag,firstTick,ticks,length=CHUNK.unpack(self._read(offset,CHUNK.size))
+            data=zlib.decompress(self._read(offset+CHUNK.size,length))
+
+            metaLength,=JSONLENGTH.unpack_from(data)
+            meta=json.loads(data[JSONLENGTH.size:JSONLENGTH.size+metaLength].decode())
+
+            # where each tick record starts
+            records=[]
+            pos=JSONLENGTH.size+metaLength
+            for i in range(ticks):
+                tick,time,count=TICK.unpack_from(data,pos)
+                records.append((tick,time,count,pos+TICK.size))
+                pos+=TICK.size+count*TICKDTYPE.itemsize
+
+            # events by the tick they happened on
+            events={}
+            for event in meta["events"]:
+                events.setdefault(event[0],[]).append(event)
+
+            chunk=(meta,data,records,events)
+            # a frame at the end of a chunk looks in the next one as well, so keep two
+            self.chunks={key:value for key,value in self.chunks.items() if key==self.lastChunk}
+            self.chunks[offset]=chunk
+        self.lastChunk=offset
+        return chunk
+
+    def _read(self,offset,length):
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def getFrame(self,tick):
+        """
+        random access to any tick
+
+        :param int tick: clipped to the ticks recorded
+        :return Frame: or None if nothing was recorded
+        """
+        if len(self.index)==0: return None
+
+        # the chunk containing tick
+        i=max(bisect.bisect_right([entry[0] for entry in self.index],tick)-1,0)
+        meta,data,records,byTick=self._chunk(self.index[i])
+
+        first=records[0][0]
+        tick,time,count,pos=records[min(max(tick-first,0),len(records)-1)]
+        state=numpy.frombuffer(data,dtype=TICKDTYPE,count=count,offset=pos)
+        events=byTick.get(tick,[])
+        if tick==records[-1][0] and i+1<len(self.index):
+            # logged after the chunk was written
+            events=events+self._chunk(self.index[i+1])[3].get(tick,[])
+
+        return Frame(tick=tick,time=time,robots=meta["robots"][:count],state=state,events=events)
+
+    def drawFrame(self,canvas,tick):
+        """
+        draw the robots as they were at tick
+
+        :param Surface canvas: already cleared
+        :return Frame: the frame drawn
+        """
+        frame=self.getFrame(tick)
+        if frame is None: return None
+
+        state=frame.state
+        for slot,robot in enumerate(frame.robots):
+            pos=(int(state["x"][slot]),int(state["y"][slot]))
+
+            # the ring only supplies the LED colours for the sprite
+            self.ring.ledColor=[int(led) for led in state["leds"][slot]]
+            self.ring.ledsOn=True
+            self.ring.nextLedChange=float("inf")
+
+            SPRITES.getBody(robot["color"],robot["size"],self.ring).blit(canvas,pos)
+            SPRITES.getCone(self.sensor,float(state["heading"][slot])).blit(canvas,pos)
+
+            nearest=int(state["nearest"][slot])
+            if 0<=nearest<len(state):
+                self.sensor.drawLinks(canvas,pos,[],(int(state["x"][nearest]),int(state["y"][nearest])))
+
+        return frame
+
+    def play(self,tick=None,speed=1.0):
+        """
+        show the recording in a pygame window
+
+        left and right arrows jump back and forward 10 seconds, space pauses
+
+        :param int tick: where to start, defaults to the beginning
+        :param float speed: 2 is twice as fast
+        """
+        ticks=self.getTickRange()
+        if ticks is None: return
+        first,last=ticks
+        if tick is None: tick=first
+
+        pygame.init()
+        w,h=self.arena
+        canvas=pygame.display.set_mode((w,h))
+        pygame.display.set_caption('PixelBot Replay')
+        fpsClock=pygame.time.Clock()
+        paused=False
+        jump=10*self.physicsHz
+        shown=None      # tick whose events have been logged
+
+        while True:
+            for event in pygame.event.get():
+                if event.type==QUIT:
+                    pygame.quit()
+                    return
+                if event.type==KEYDOWN:
+                    if event.key==K_LEFT: tick-=jump
+                    elif event.key==K_RIGHT: tick+=jump
+                    elif event.key==K_SPACE: paused=not paused
+
+            tick=min(max(tick,first),last)
+            canvas.fill(self.canvasColor)
+            self.walls.draw(canvas)
+            frame=self.drawFrame(canvas,tick)
+            if frame.tick!=shown:
+                shown=frame.tick
+                for event in frame.events:
+                    LOG.info("replay",event[1],":",event[2],robot=event[1])
+            pygame.display.update()
+
+            if not paused and tick<last: tick+=1
+            fpsClock.tick(self.physicsHz*speed)
+
+    def close(self):
+        self.file.close()
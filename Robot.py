@@ -15,7 +15,12 @@ from Collision import *
 from Colors import *
 from Constants import *
 from ToneGenerator import *
+from Clock import *
+from Fleet import *
+from SpriteCache import *
+from Log import *
 import threading
+import random
 from tkinter import messagebox
 
 # status values defined here to stop typos
@@ -29,12 +34,24 @@ class PixelBot():
     # instance variables (see __init__
 
     name="nobody"       # name of this bot e.g. "brian"
-    pos=(0,0)           # default (x,y)
     size=30             # default diameter of the bot
-    direction=0         # radians , anti-clockwise (thanks pygame)
+
+    # pos (x,y) and direction (radians, anti-clockwise thanks pygame) are
+    # properties which read and write the Fleet arrays
+    fleet=None          # Fleet holding the state of all robots
+    slot=None           # index of this robot in the fleet arrays
 
     color=None          # used to color the robot image (Should be one of the six known colors)
-    allRobots=None      # used to detect collisions
+    allRobots=None      # SpatialGrid, used to detect collisions
+    sensors=None        # SensorSnapshot, sonar results updated by the Simulator each tick
+    rng=None            # random.Random for @random
+    collisions=0        # number of times another robot has been hit
+    contact=None        # other robot,time of impact,normal - set by the Simulator when they touched this tick
+    collided=False      # touched another robot since the script last read @collided
+    bumped=False        # hit a wall since the script last read @bumped
+    scriptErrors=0      # errors reported by the script
+    recorder=None       # Recorder, see Recording.py
+    audio=None          # where SOUND goes, WavRenderer or None for the sound card
 
     leftWheel=None      # not being used
     rightWheel=None     # not being used
@@ -46,6 +63,9 @@ class PixelBot():
     dragging=False      # being dragged to new location (not yet implemented)
 
     lex=None            # lexical analyser for scripts
+    scheduler=None      # Scheduler if scripts are run cooperatively, None for threads
+    ticker=None         # Ticker signalled by the simulator every update
+    clock=WALLCLOCK     # see Clock.py, a SimClock when headless
     fps=None            # needed by timing code in Interpreter
     lastCmdDone=True    # some commands need time
 
@@ -57,23 +77,35 @@ class PixelBot():
     script=None         # Script object() no instructions yet
 
     def __init__(self,**kwargs):
+        # the fleet slot must exist before pos or direction are set
+        self.fleet=kwargs.pop("fleet",None)
+        if self.fleet is None:
+            self.fleet=Fleet(arena=kwargs.get("arena",self.arena))
+        self.slot=self.fleet.add(self)
+
         for key,value in kwargs.items():
             setattr(self,key,value)
 
+        self.fleet.size[self.slot]=self.size
+
+        if self.rng is None:
+            self.rng=random.Random()
+
 
         self.newIndent=0    # script indent
 
         # must be setup before script is uploaded and starts running
 
-        self.lex = Lex(robot=self, console=self.console, fps=self.fps)
+        self.lex = Lex(robot=self, console=self.console, fps=self.fps, scheduler=self.scheduler,
+                       ticker=self.ticker, clock=self.clock, rng=self.rng)
 
         if self.scriptPath is None:
             # no script passed in - wait for upload
-            print(self.name,"no script supplied")
+            LOG.debug("robot",self.name,"no script supplied",robot=self.name)
             self.script=Script()
         else:
             # if the script is passed in during creation
-            print("Robot.__init__() script=",self.scriptPath)
+            LOG.debug("robot","Robot.__init__() script=",self.scriptPath,robot=self.name)
             assert type(self.scriptPath) is str,"If you pass a script directly to the robot it should be a filename."
             self.script = Script()
             self.uploadScript(self.scriptPath)    # start the script running as well
@@ -81,21 +113,21 @@ class PixelBot():
         assert self.allRobots is not None,"You must pass the allRobots parameter when creating a robot so it can " \
                                           "detect any others"
 
-        self.leftWheel=Wheel(diameter=WHEEL_DIAMETER)    # mm
-        self.rightWheel=Wheel(diameter=WHEEL_DIAMETER)
+        self.leftWheel=Wheel(diameter=WHEEL_DIAMETER,clock=self.clock)    # mm
+        self.rightWheel=Wheel(diameter=WHEEL_DIAMETER,clock=self.clock)
         self.pixelRing=PixelRing(outerRadius=PIXELRING_OUTERRADIUS,numLeds=PIXELRING_NUMLEDS,
-                                 ledRadius=PIXELRING_LEDRADIUS)
+                                 ledRadius=PIXELRING_LEDRADIUS,clock=self.clock)
 
 
         self.lastCmdDone=True
 
-        print("Adding distance sensor")
+        LOG.debug("robot","Adding distance sensor",robot=self.name)
         self.distSensor = DistSensor()
         self.status = STOPPED if self.scriptPath is None else RUNNING
         self.dragging = False  # true if being dragged to new location (not yet implemented)
         self.lastCmdDone=True
 
-        print("Robot",self.name,"created.")
+        LOG.info("robot","Robot",self.name,"created.",robot=self.name)
 
 
     def serialize(self):
@@ -119,12 +151,9 @@ class PixelBot():
         :param theScript:
         :return:
         """
-        self.stop()
-        while self.status!=STOPPED:
-            print("Waiting for robot to stop")
-            t0=time.time()
-            while (time.time()-t0)<2:
-                pass
+        # stop() waits for the script to finish
+        if not self.stop():
+            LOG.warning("robot",self.name,"script did not stop within",STOP_TIMEOUT,"seconds",robot=self.name)
 
         self.script.replaceScript(theScript)
         self.run()
@@ -143,7 +172,12 @@ class PixelBot():
         # self.run()
 
     def setColor(self,colorName):
-        self.color=getColorByName(colorName)
+        getColorByName(colorName)   # raises InvalidColor for colours it doesn't know
+        oldColor=self.color
+        # kept as the name like the robot was created with, drawing and findBotByColor() use it
+        self.color=colorName
+        if self.allRobots is not None:
+            self.allRobots.colorChanged(self,oldColor)
 
     def getColor(self):
         return self.color
@@ -161,26 +195,56 @@ class PixelBot():
     def getPos(self):
         return self.pos
 
+    @property
+    def pos(self):
+        return float(self.fleet.x[self.slot]),float(self.fleet.y[self.slot])
+
+    @pos.setter
+    def pos(self,pos):
+        self.fleet.x[self.slot],self.fleet.y[self.slot]=pos
+        self.fleet.rebase(self.slot)
+        # keep the spatial grid up to date between ticks
+        if self.allRobots is not None:
+            self.allRobots.move(self)
+
+    @property
+    def direction(self):
+        return float(self.fleet.heading[self.slot])
+
+    @direction.setter
+    def direction(self,direction):
+        self.fleet.heading[self.slot]=direction
+        self.fleet.rebase(self.slot)
+
     def getSize(self):
         return self.size
 
     def setSize(self,newSize):
         self.size=newSize
+        self.fleet.size[self.slot]=newSize
 
-    # get_x and get_y are required by smartquadtree when
-    # filtering the robot list
+    # get_x and get_y are used by SpatialGrid
 
     def get_x(self):
-        #x,y=self.pos
-        #return x
-        return self.pos[0]
+        return float(self.fleet.x[self.slot])
 
 
     def get_y(self):
-        #x,y=self.pos
-        #return y
-        return self.pos[1]
+        return float(self.fleet.y[self.slot])
+
 
+    def logEvent(self,text):
+        """
+        script commands and prints are kept if the run is being recorded
+        """
+        if self.recorder is not None:
+            self.recorder.logEvent(self,text)
+
+    def getWallBumps(self):
+        return int(self.fleet.bumps[self.slot])
+
+    def getDistanceTravelled(self):
+        return float(self.fleet.travelled[self.slot])
 
     def getId(self):
         return self.name
@@ -195,8 +259,12 @@ class PixelBot():
         self.direction=direction
 
     def getDistance(self):
+        # the Simulator scans every robot's sonar once per tick
+        if self.sensors is not None and self.sensors.hasResult(self):
+            return self.sensors.getDistance(self)
+
         if self.allRobots is None:
-            print(self.name,"allRobots is None")
+            LOG.error("robot",self.name,"allRobots is None",robot=self.name)
             return OUTOFRANGE
 
         bot=self.distSensor.getNearestBot(None,self,self.allRobots)
@@ -215,15 +283,26 @@ class PixelBot():
         for now return the average speed of each wheel
         :return float: average speed of each wheel
         """
-        lws=self.leftWheel.getSpeed()
-        rws=self.rightWheel.getSpeed()
+        lws=self.fleet.leftSpeed[self.slot]
+        rws=self.fleet.rightSpeed[self.slot]
 
-        return (rws+lws)/2
+        return float(rws+lws)/2
 
     def setSpeed(self,lws,rws):
         self.status=RUNNING
         self.leftWheel.setSpeed(lws)
         self.rightWheel.setSpeed(rws)
+        self.fleet.leftSpeed[self.slot]=lws
+        self.fleet.rightSpeed[self.slot]=rws
+
+    def isMoving(self):
+        """
+        :return bool: True while a timed MOVE, TURN or ARC is in progress
+        """
+        return self.fleet.isMoving(self.slot)
+
+    def stopMotion(self):
+        self.fleet.stopMotion(self.slot)
 
     # drag/drop is used when the user drags a robot to a new location
 
@@ -239,10 +318,16 @@ class PixelBot():
 
 
     def stop(self):
-        print("Robot.py stop() called for",self.name)
-        if self.lex is not None:
-            self.lex.stop()
-            self.status = STOPPED
+        """
+        stop the script and wait for it to finish
+        :return bool: True if the script has stopped
+        """
+        LOG.debug("robot","Robot.py stop() called for",self.name,robot=self.name)
+        if self.lex is None: return True
+
+        stopped=self.lex.stop()
+        self.status = STOPPED
+        return stopped
 
     def run(self):
 
@@ -251,16 +336,50 @@ class PixelBot():
 
         This (hopefully) prevents scripts stalling.
 
+        If the simulator has a Scheduler the script is added to it instead
+        and no thread is started.
+
         :return: Nothing
         """
         if self.lex is None:
-            self.lex = Lex(robot=self, console=self.console, fps=self.fps)
+            self.lex = Lex(robot=self, console=self.console, fps=self.fps, scheduler=self.scheduler,
+                       ticker=self.ticker, clock=self.clock, rng=self.rng)
+
+        # only one copy of the script may run
+        if not self.lex.finished.is_set():
+            self.stop()
 
         self.status = RUNNING
+        self.lex.start()
+
+        if self.scheduler is not None:
+            self.scheduler.spawn(self,self._scriptTask())
+            return
+
         t=threading.Thread(target=self._runScript)
         t.start()
 
 
+    def resume(self,frames,wait=None):
+        """
+        carry on running the script from part way through, used by Snapshot.py
+
+        Only for cooperative simulators
+
+        :param list frames: Lex frames to continue from
+        :param Wait wait: what the script was waiting for, None to carry on at the next tick
+        :return: Nothing
+        """
+        assert self.scheduler is not None,"Only cooperative scripts can be resumed"
+
+        if not self.lex.finished.is_set():
+            self.stop()
+
+        self.status = RUNNING
+        self.lex.start()
+        task=self.scheduler.spawn(self,self._scriptTask(frames))
+        task.wait=wait
+
     def avertCollision(self):
         """
         if a collision is about to occur veer 45 degrees right
@@ -271,20 +390,61 @@ class PixelBot():
         self.direction+=math.pi/4   # 45 degrees for now
 
 
-    def draw(self,canvas):
+    def getDrawState(self):
+        """
+        everything draw() needs. If it hasn't changed since the last frame
+        the robot doesn't need redrawing (see Simulator dirtyRects)
+
+        :return tuple: body sprite, cone sprite, position, in range positions, nearest position
+        """
+        x,y,direction=self.fleet.getDrawn(self.slot)     # can be float values
+        pos=(int(x),int(y))
+        botColor=getColorByName(self.color)
+
+        # body and pixel ring are one pre-rendered sprite, see SpriteCache.py
+        body=SPRITES.getBody(botColor,self.size,self.pixelRing)
+        cone=SPRITES.getCone(self.distSensor,direction)
+
+        inRange=()
+        nearest=None
+        if self.sensors is not None and self.sensors.hasResult(self):
+            inRange=tuple(self._drawPos(n) for n in self.sensors.getInRange(self))
+            bot=self.sensors.getNearestBot(self)
+            if bot is not None: nearest=self._drawPos(bot)
+
+        return body,cone,pos,inRange,nearest
+
+    def _drawPos(self,bot):
+        x,y,direction=self.fleet.getDrawn(bot.slot)
+        return int(x),int(y)
+
+    def getDrawRect(self,state):
+        """
+        :param tuple state: from getDrawState()
+        :return pygame.Rect: area draw() covers
+        """
+        body,cone,pos,inRange,nearest=state
+        rect=body.getRect(pos).union(cone.getRect(pos))
+        links=self.distSensor.getLinksRect(pos,inRange,nearest)
+        if links is not None: rect.union_ip(links)
+        return rect
+
+    def draw(self,canvas,state=None):
         """
         Draws the robot in it's current position in the arena (canvas)
 
-        It is called from update()
+        It is called from update() or by the Simulator when only drawing what has changed
 
         :param Surface canvas: pygame surface
+        :param tuple state: from getDrawState(), worked out if None
         :return: nothing
         """
-        x,y=self.pos    # can be float values
-        botColor=getColorByName(self.color)
-        pygame.draw.circle(canvas, botColor,(int(x),int(y)), self.size, 0)
-        self.pixelRing.draw(self.pos,canvas)
-        self.distSensor.draw(canvas,self)
+        if state is None: state=self.getDrawState()
+        body,cone,pos,inRange,nearest=state
+
+        body.blit(canvas,pos)
+        cone.blit(canvas,pos)
+        self.distSensor.drawLinks(canvas,pos,inRange,nearest)
 
     def update(self,canvas,robots):
         """
@@ -292,28 +452,43 @@ class PixelBot():
 
         The robot should progress it's next/current instruction
         :param pygame.surface canvas: for drawing on
-        :param Quadtree robots: list of active robots
+        :param SpatialGrid robots: all active robots
         :return:
         """
         self.allRobots=robots   # needed for getDistance() to work
-        self.draw(canvas)
+
+        # canvas is None when running headless without rendering
+        if canvas is not None:
+            self.draw(canvas)
 
         # TODO add dragging capability
         #if self.dragging:
         #    # don't progress movement till dropped
         #    return
 
-        # check for collision between me and another bot
-        nearestBot=self.distSensor.getNearestBot(canvas,self,robots)
-
-        if nearestBot is not None:
-            if nearestBot.getName()!=self.getName():
-                print("nearestBot name=", nearestBot.getName())
+        # the Simulator found any robot touched along the path moved, see Collision.findContacts()
+        if self.contact is not None:
+            other,toi,normal=self.contact
+            self.contact=None
+            LOG.debug("collision","Bot",self.getName(),"has collided with",other.getName(),
+                      "at %.2f of the tick"%toi,robot=self.name)
+            self.collisions+=1
+            self.collided=True
+            self.avertCollision()
+
+        elif self.sensors is None:
+            # not in a Simulator, check the nearest bot where it is now
+            nearestBot=self.distSensor.getNearestBot(canvas,self,robots)
+            if nearestBot is not None and nearestBot.getName()!=self.getName():
+                LOG.debug("sensor","nearestBot name=",nearestBot.getName(),robot=self.name)
                 if haveCollided(self,nearestBot):
+                    self.collisions+=1
+                    self.collided=True
                     self.avertCollision()
 
-        # check for collision with canvas walls
-        checkWallBump(self)
+            # in a Simulator the Fleet bounces robots off the walls and WALL events set bumped
+            bump,hMovement,vMovement=checkWallBump(self)
+            if bump: self.bumped=True
 
     def _runScript(self):
         """
@@ -326,12 +501,13 @@ class PixelBot():
 
         :return: Nothing.
         """
-        print(self.getName() + " Robot._runScript() starting")
+        LOG.debug("robot",self.getName()+" Robot._runScript() starting",robot=self.name)
         self.status=RUNNING
 
         # make sure we have created a Lex object to interpret commands
         if self.lex is None:
-            self.lex = Lex(robot=self, console=self.console, fps=self.fps)
+            self.lex = Lex(robot=self, console=self.console, fps=self.fps, scheduler=self.scheduler,
+                       ticker=self.ticker, clock=self.clock, rng=self.rng)
 
         if self.script is None:
             res,msg=self.script.uploadScript(self.scriptPath)
@@ -342,4 +518,17 @@ class PixelBot():
         self.lex.run()
 
         self.status=STOPPED
-        print(self.getName()+" Robot._runScript() has terminated")
\ No newline at end of file
+        LOG.debug("robot",self.getName()+" Robot._runScript() has terminated",robot=self.name)
+
+    def _scriptTask(self,frames=None):
+        """
+        cooperative version of _runScript()
+
+        A generator run by the Scheduler, see Scheduler.py
+
+        :param list frames: Lex frames to resume from, None starts at the beginning
+        :return: Nothing.
+        """
+        yield from self.lex.task(frames)
+        self.status=STOPPED
+        LOG.debug("robot",self.getName()+" Robot._scriptTask() has terminated",robot=self.name)
@@ -6,11 +6,12 @@ Called from Lex.py when Lex cannot resolve the script statement.
 Handles commands which control the robot
 
 
-Commands return True if the command is fully compelete
-and False if the command needs more ticks to finish (timed movements)
+Commands return FINISHED if the command is fully compelete
+or a Wait (see Scheduler.py) if the command needs more ticks to finish (timed movements,
+DELAY and SOUND ... WAIT)
 
-TODO: some commands WILL need to be threaded to allow other commands to continue
-TODO: thats would allow the WAIT/BACKGROUND options to work
+Timed movements are carried out by the Simulator (see Fleet.py) so
+BACKGROUND movements need no thread or task of their own.
 """
 
 from Exceptions import *
@@ -23,6 +24,9 @@ from Constants import *
 import re
 from Collision import *
 from ConsoleQueue import *
+from Scheduler import *
+from Clock import *
+from Log import *
 
 class RobotController(object):
 
@@ -37,6 +41,9 @@ class RobotController(object):
     arena=(0,0)
     running=True
     console=None
+    scheduler=None      # Scheduler when running cooperatively, None for threads
+    ticker=None         # Ticker used by threads waiting for the next tick
+    clock=WALLCLOCK     # see Clock.py
 
     def __init__(self,**kwargs):
 
@@ -67,12 +74,12 @@ class RobotController(object):
         self.running=True
 
         # controls for intime/delay
-        self.delayTill = time.time()
+        self.delayTill = self.clock.time()
         self.delaySet = False
         self.wasDelayed = False
         self.arena=self.robot.getArena()
 
-        self.sound=Note()   # used for playing sound tones
+        self.sound=Note(target=self.robot.audio)   # used for playing sound tones
 
     def syntaxError(self,*args):
         """
@@ -81,7 +88,8 @@ class RobotController(object):
         :param args: arguments for printing
         :return: FINISHED to allow other scripts to continue running
         """
-        console_println(self.robot.getName()," - Syntax Error:",args,"at line ",self.robot.script.getLineNumber())
+        LOG.console(self.robot.getName(),self.robot.getName()," - Syntax Error:",args,"at line ",self.robot.script.getLineNumber(),level=ERROR)
+        self.robot.scriptErrors+=1
         return FINISHED
 
     def doCommand(self,command):
@@ -112,55 +120,38 @@ class RobotController(object):
 
     def stop(self):
         """
-        Stop sets a flag so that any BACKGROUND commands terminate
+        Stop sets a flag so that any waiting commands terminate
+        and stops any timed movement
 
         :return:
         """
-        print("RobotControl stop() called.")
+        LOG.debug("script","RobotControl stop() called.",robot=self.robot.getName())
         self.running=False  # threads will terminate when ready
+        self.robot.stopMotion()
+
+        # wake threads waiting on the ticker so they see it now
+        if self.ticker is not None:
+            self.ticker.wake()
 
     def run(self):
         """
         Used to set a flag to allow BACKGROUND  threads to terminate
         :return:
         """
-        print("RobotControl.run() called.")
+        LOG.debug("script","RobotControl.run() called.",robot=self.robot.getName())
         self.running=True  # threads will terminate when ready
 
-    def _stepper(self,duration,func):
+    def waitForMotion(self,background):
         """
-        provides calls to func at fps for duration
-
-        To be used for commands like MOVE 100 INTIME 10
-
-        When BACKGROUND is specified this is run in a separate thread
+        timed MOVE, TURN and ARC commands set the robot moving. The Simulator
+        then moves it every tick, see Fleet.py
 
-        :param func: function to call
-        :return: nothing when finished
+        :param bool background: if True the script continues whilst the robot moves
+        :return: FINISHED for BACKGROUND moves otherwise a WaitMotion for the script to wait on
         """
-        t0=time.time()
-        while (time.time()-t0)<duration:
-            func()
-
-            if not self.running:
-                #print("_stepper robot not running")
-                break
-
-            t1=time.time()
-            while (time.time()-t1)<(1/self.fps):
-                #print("_stepper delay")
-                pass
-
-        #print("_stepper done in",time.time()-t0)
-
-    def runMover(self,background,intime,mover):
         if background:
-            t = threading.Thread(target=self._stepper, args=(intime, mover))
-            t.start()
             return FINISHED
-
-        else:
-            self._stepper(intime,mover)
+        return WaitMotion(robot=self.robot)
 
 
     # commands
@@ -212,21 +203,8 @@ class RobotController(object):
 
         speed = distance / intime
 
-        # the robot update is called fps times a second
-        # calc deltaDistance to move
-        deltaDist = speed / self.fps
-
-        def mover():
-            # for linear motion just reflect the direction 180 deg (PI radians)
-            bump,hMotion,vMotion=checkWallBump(self.robot)
-            if bump:
-                # reverse
-                self.robot.setDirection(self.robot.getDirection()+math.pi)
-            linearMove(self.robot, deltaDist)
-
-        self.runMover(background,intime,mover)
-
-        return FINISHED
+        self.robot.fleet.startLinear(self.robot.slot,speed,intime)
+        return self.waitForMotion(background)
 
     def _turn(self,param=None):
         """
@@ -269,15 +247,9 @@ class RobotController(object):
             background=True
 
         speed=theAngle/intime
-        deltaAngle= speed/self.fps  # proportion per tick to chnage
 
-        def mover():
-            # turning about it's centre - should not bump into walls
-            self.robot.setDirection(self.robot.getDirection() + deltaAngle)
-
-        self.runMover(background,intime,mover)
-
-        return FINISHED
+        self.robot.fleet.startTurn(self.robot.slot,speed,intime)
+        return self.waitForMotion(background)
 
     def _arc(self,param=None):
         """
@@ -311,7 +283,7 @@ class RobotController(object):
         angle=math.radians(abs(float(param[3])))
 
         # nothing to do?
-        if angle==0: return
+        if angle==0: return FINISHED
 
         # cx/cy are at 90 degrees to the current robot direction
         self.cx,self.cy=arcCentre(robotX,robotY,self.radius,robotDirection)
@@ -321,46 +293,24 @@ class RobotController(object):
             intime=int(param[5])*0.1
 
         if intime==0:
-            # instant move along arc
-            # TODO  needs to check wall bump
-            ang=math.radians(angle)
-            robotX=self.cx+self.radius*math.cos(ang)
-            robotY=self.cy+self.radius*math.sin(ang) # drawing is top to bottom
-            self.robot.setDirection(robotDirection+ang)
-            self.robot.setPos((robotX,robotY))
-            return
+            # instant move along arc, bouncing off any wall in the way
+            self.robot.fleet.jumpArc(self.robot.slot,self.cx,self.cy,self.radius,angle)
+            # keep the spatial grid up to date between ticks, as setPos() does
+            if self.robot.allRobots is not None:
+                self.robot.allRobots.move(self.robot)
+            return FINISHED
 
         if paramLen>6: return self.syntaxError(syntax)
         if paramLen==6 and param[5].lower()=="background":
             background=True
 
-        deltaAngle=angle/(intime*self.fps)
+        turnRate=angle/intime
         if self.radius<0:
             # reverse direction
-            deltaAngle=-deltaAngle
-
-        robotX, robotY = self.robot.getPos()
-        self.turnAngle=math.radians(anglePoint(robotX, robotY, self.cx, self.cy))
-
-        def mover():
-            newDir,newCx,newCy,turnAngle=checkArcWallBump(self.robot,self.arena,self.cx,self.cy)
-            if newDir is not None:
-                self.robot.setDirection(newDir)
-                self.cx=newCx
-                self.cy=newCy
-                self.turnAngle=turnAngle
+            turnRate=-turnRate
 
-            self.turnAngle= self.turnAngle + deltaAngle
-
-            robotX = self.cx + abs(self.radius) * math.cos(self.turnAngle)
-            robotY = self.cy + abs(self.radius) * math.sin(self.turnAngle) # drawing is top to bottom
-
-            self.robot.setDirection(self.robot.getDirection() + deltaAngle)
-            self.robot.setPos((robotX, robotY))
-
-        self.runMover(background, intime, mover)
-
-        return FINISHED
+        self.robot.fleet.startArc(self.robot.slot,self.cx,self.cy,self.radius,turnRate,intime)
+        return self.waitForMotion(background)
 
     def _sound(self,param=None):
         """
@@ -397,7 +347,7 @@ class RobotController(object):
         self.sound.playNote(freq, duration=duration, type="square")  # arduino can only turn speaker on/off
 
         if paramCount == 4 and param[3].lower() == "wait":
-            time.sleep(duration/1000)
+            return WaitUntil(deadline=self.clock.time()+duration/1000)
 
         return FINISHED
 
@@ -420,8 +370,7 @@ class RobotController(object):
         """
 
         delay=float(param[1])*0.1
-        time.sleep(delay)
-        return FINISHED
+        return WaitUntil(deadline=self.clock.time()+delay)
 
 
     def _color(self,param=None):
@@ -439,6 +388,7 @@ class RobotController(object):
         ry=int(param[2])
         #print("Placing robot at ",rx,ry)
         self.robot.setPos((rx,ry))
+        self.robot.fleet.resetSweep(self.robot.slot)
         return FINISHED
 
     def _dir(self,param=None):
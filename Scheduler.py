@@ -0,0 +1,218 @@
+"""
+Scheduler.py
+
+Cooperative scheduler for robot scripts
+
+Lex.task() is a generator which yields a Wait object whenever the script has
+to wait - for a timed MOVE, TURN or ARC, a DELAY or a SOUND ... WAIT.
+
+In the default (threaded) mode each robot script runs in its own thread and
+runWait() polls the wait. Between polls the thread sleeps on the Simulator's
+Ticker so idle robots use no CPU and wake as soon as they are stopped.
+
+In cooperative mode the Simulator owns a Scheduler and calls tick() once per
+update. Every robot task is advanced in the order it was added so no threads
+are needed and runs are repeatable.
+
+"""
+
+import time
+import threading
+from Constants import *
+
+
+class Wait():
+    """
+    Base class for things a script waits for.
+
+    poll() is called once per tick and returns True when the wait is over.
+    This one is over at the next tick.
+    """
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+    def poll(self,now):
+        return True
+
+    def timeout(self,now):
+        """
+        :return float: seconds before the wait could be over or None for the next tick
+        """
+        return None
+
+
+class WaitUntil(Wait):
+    """
+    DELAY and SOUND ... WAIT
+
+    deadline is in seconds, from the robot's clock (see Clock.py)
+    """
+    deadline=0
+
+    def poll(self,now):
+        # the deadline was worked out by adding floats so it can be a rounding error past the tick it falls on
+        return now>=self.deadline-TIME_RESOLUTION
+
+    def timeout(self,now):
+        return max(0,self.deadline-now)
+
+
+class WaitMotion(Wait):
+    """
+    timed MOVE, TURN and ARC commands
+
+    The Simulator moves the robot each tick (see Fleet.py), the wait
+    is over when the robot stops moving.
+    """
+    robot=None          # PixelBot
+
+    def poll(self,now):
+        return not self.robot.isMoving()
+
+
+class Ticker():
+    """
+    Lets threaded scripts sleep till the next simulator tick
+
+    The Simulator calls tick() once per update. wake() is called when a
+    robot is stopped so waiting threads notice straight away.
+    """
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.condition=threading.Condition()
+        self.count=0
+
+    def tick(self):
+        with self.condition:
+            self.count+=1
+            self.condition.notify_all()
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify_all()
+
+    def wait(self,timeout):
+        """
+        block till the next tick, a wake() or timeout seconds
+
+        :param float timeout: seconds
+        """
+        with self.condition:
+            self.condition.wait(timeout)
+
+
+def runWait(wait,fps,owner,ticker):
+    """
+    threaded equivalent of the Scheduler for a single wait
+
+    :param Wait wait: what we are waiting for
+    :param int fps: ticks per second, the longest we sleep between ticks
+    :param owner: Lex or RobotController, the wait is abandoned if owner.running becomes False
+    :param Ticker ticker: signalled by the simulator every tick
+    :return: nothing when finished
+    """
+    now=owner.clock.time()
+    while owner.running and not wait.poll(now):
+        timeout=wait.timeout(now)
+        if timeout is None:
+            # next tick, but a stalled or missing simulator must not stall the script
+            timeout=1/fps
+        ticker.wait(timeout)
+        now=owner.clock.time()
+
+
+class Task():
+    """
+    a generator being run by the Scheduler
+    """
+    owner=None      # the PixelBot the task belongs to
+    gen=None        # generator which yields Wait objects
+    wait=None       # current wait, None if ready to continue
+    done=False
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+    def step(self,now):
+        """
+        advance the task if it isn't waiting
+        """
+        if self.wait is not None and not self.wait.poll(now):
+            return
+
+        try:
+            self.wait=next(self.gen)
+        except StopIteration:
+            self.done=True
+
+    def close(self):
+        self.gen.close()
+        self.done=True
+
+
+class Scheduler():
+    """
+    s=Scheduler()
+    s.spawn(robot,robot.lex.task())
+    s.tick()    # once per simulator update
+    """
+    tasks=None
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.tasks=[]
+
+    def spawn(self,owner,gen):
+        """
+        add a task, it starts on the next tick
+
+        :param PixelBot owner: used by cancel()
+        :param generator gen: yields Wait objects
+        :return Task:
+        """
+        task=Task(owner=owner,gen=gen)
+        self.tasks.append(task)
+        return task
+
+    def cancel(self,owner):
+        """
+        stop all tasks belonging to owner
+        """
+        for task in self.tasks:
+            if task.owner is owner and not task.done:
+                task.close()
+        self.tasks=[task for task in self.tasks if not task.done]
+
+    def tick(self,now=None):
+        """
+        advance every task once, in the order they were added
+
+        :param float now: time from the simulator clock, defaults to the wall clock
+        """
+        if now is None: now=time.time()
+
+        for task in list(self.tasks):
+            if not task.done:
+                task.step(now)
+
+        self.tasks=[task for task in self.tasks if not task.done]
+
+    def getTask(self,owner):
+        """
+        :return Task: owner's unfinished task or None
+        """
+        for task in self.tasks:
+            if task.owner is owner and not task.done:
+                return task
+        return None
+
+    def getTaskCount(self):
+        return len(self.tasks)
@@ -11,6 +11,7 @@ Handles retrieving of script commands.
 import time
 import re
 from Constants import *
+from Log import *
 
 
 class Script():
@@ -47,7 +48,7 @@ class Script():
             return True, "Ok"
 
         except Exception as e:
-            print("Script.uploadScript() exception",e.args)
+            LOG.error("script","Script.uploadScript() exception",e.args)
             return False, "Unable to load script "+fname+" are you sure the path is correct?"
 
     def replaceScript(self,theScript=None):
@@ -59,11 +60,19 @@ class Script():
         self.theScript=theScript
         self.restart()
 
+    def getLines(self):
+        """
+        used by Compiler to compile the whole script in one go
+        :return list: script lines with trailing newlines removed
+        """
+        if self.theScript is None: return []
+        return self.theScript
+
     def getNextInstruction(self):
         self.lineNumber+=1
 
         if self.theScript is None:
-            print("Script.getNextInstruction() theScript is None")
+            LOG.error("script","Script.getNextInstruction() theScript is None")
             return EOF
         if self.lineNumber>=len(self.theScript):
             #print("Script.getNextInstruction() step beyond end of script")
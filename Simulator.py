@@ -10,16 +10,20 @@ NOTE: Robot scripts are automatically run when the Robot is created
 from Robot import *
 from Exceptions import *
 import threading
-
-# I don't know why PyCharm doesn't like this
-# the module shows in the installed list
-# AND it isn't highlighted in the previous demo
-
-from smartquadtree import Quadtree
-
+import random
+import numpy
 import pygame,sys
 from pygame.locals import *
 from ConsoleQueue import *
+from Scheduler import *
+from Clock import *
+from Fleet import *
+from SpatialGrid import *
+from Log import *
+from Events import *
+from Walls import *
+from Collision import *
+from SweepAndPrune import *
 
 
 class Simulator():
@@ -32,16 +36,54 @@ class Simulator():
 
     s.addRobot(bot1)
 
+    Simulator(...,cooperative=True) runs every robot script from update()
+    using a Scheduler instead of a thread per robot.
+
+    Simulator(...,headless=True) needs no display or sound device. Each update
+    advances a simulated clock by 1/physicsHz so run(seconds) goes as fast as the CPU
+    allows. Headless simulators are always cooperative.
+
+    Simulator(...,physicsHz=200,renderHz=30) moves the robots in 200 steps a second
+    but only draws 30 frames a second. Both default to fps.
+
+    Simulator(...,arenaFile="maze.json") adds the walls and obstacles in the
+    file (see Walls.py). If the file gives a size it replaces arena.
+
     """
 
-    fps=100                  # rate at which robot update() methods are called
-    robots=None             # Quadtree - robots are added using ID (name?)
+    fps=100                  # default for physicsHz and renderHz
+    physicsHz=None          # physics steps per second - robot motion, collisions, scripts
+    renderHz=None           # frames drawn per second
+    maxCatchUp=0.25         # seconds, more physics than this behind is dropped
+    robots=None             # SpatialGrid - robots are found by position, name or color
+    sensors=None            # SensorSnapshot - sonar results for every robot, once per update
+    broadphase=None         # SweepAndPrune - pairs of robots which might have collided
+    events=None             # EventStream - contacts, wall bumps and sonar changes, one batch per tick
+    fleet=None              # Fleet - position and motion arrays for all robots
     arena=None              # tuple (width,height)
+    arenaFile=None          # walls and obstacles, see Walls.py
+    walls=None              # Walls - the arena edges and anything loaded from arenaFile
     running=True
     canvas=None             # pygame canvas for drawing everything on
     canvasColor=CANVASCOLOR
     sound=Note()            # use sound.playNote(...)
     console=None
+    cooperative=False       # True runs all robot scripts from update() without threads
+    scheduler=None          # Scheduler used when cooperative
+    ticker=None             # Ticker signalled each update, threaded scripts sleep on it
+    headless=False          # True - no display or sound, simulated time runs as fast as possible
+    render=False            # headless only - draw onto an offscreen canvas anyway
+    dirtyRects=True         # only redraw robots which change and only update those parts of the display
+    background=None         # the empty arena, used to erase robots
+    clock=None              # Clock or SimClock (headless) see Clock.py
+    seed=None               # seeds all randomness so runs can be repeated, chosen at random if None
+    random=None             # random.Random used for start positions and robot @random values
+    recorder=None           # Recorder, see Recording.py
+    audio=None              # WavRenderer to record SOUND commands, see ToneGenerator.py
+    ticks=0                 # number of physics steps so far
+    frames=0                # number of frames drawn so far
+    skippedFrames=0
+    droppedTime=0
 
     params=None
 
@@ -53,6 +95,10 @@ class Simulator():
         for k,v in kwargs.items():
             setattr(self,k,v)
 
+        if self.arenaFile is not None:
+            self.walls=Walls.load(self.arenaFile,arena=self.arena or ARENA)
+            self.arena=self.walls.arena
+
         assert self.arena is not None, "You must specify an arena (x0,y0,x1,y1) for the robots to operate in."
         assert type(self.arena) is tuple,"Arena must be a tuple (x0,y0,x1,y1)."
 
@@ -63,16 +109,60 @@ class Simulator():
             raise ArenaTooSmall("The arena seems a bit small. There would be trouble ahead... Make it bigger than "
                                 "100x100")
 
+        if self.physicsHz is None: self.physicsHz=self.fps
+        if self.renderHz is None: self.renderHz=self.fps
+
+        if self.headless:
+            # threads would not keep in step with simulated time
+            self.cooperative=True
+            self.clock=SimClock(hz=self.physicsHz)
+        else:
+            self.clock=WALLCLOCK
+
+        if self.cooperative:
+            self.scheduler=Scheduler()
+
+        if self.seed is None:
+            self.seed=random.SystemRandom().getrandbits(32)
+        self.random=random.Random(self.seed)
+
+        self.accumulator=0      # seconds of physics due
+        self.lastUpdate=None    # clock time of the last update()
+        self.nextFrame=0        # headless, simulated time of the next frame
+        self.frames=0
+        self.skippedFrames=0
+        self.droppedTime=0
+
+        self.ticker=Ticker()
+        self.ticks=0
+
+        if self.walls is None:
+            self.walls=Walls(arena=self.arena)
+        self.fleet=Fleet(arena=self.arena,walls=self.walls)
+
         # create the moving object tracker
-        self.robots=Quadtree(0,0,width,height)
+        self.robots=SpatialGrid(arena=self.arena,fleet=self.fleet)
+        self.sensors=SensorSnapshot(grid=self.robots,walls=self.walls)
+        self.broadphase=SweepAndPrune(fleet=self.fleet)
+        self.events=EventStream()
+        self.robotEvents=self.events.subscribe(kinds=(CONTACT,WALL))     # passed on to the robots each tick
 
-        # required for sound mixer, must be called before pygame.init()
-        #
-        pygame.mixer.pre_init(44100, -16, 8, 1024)  # 8 channels (guesswork)
-        pygame.init()
+        if self.headless:
+            # no display or mixer, rendering is optional
+            self.canvas=pygame.Surface((width, height)) if self.render else None
 
-        self.canvas = pygame.display.set_mode((width, height),pygame.DOUBLEBUF,32)
-        pygame.display.set_caption('PixelBot Simulator!')
+        else:
+            # required for sound mixer, must be called before pygame.init()
+            #
+            pygame.mixer.pre_init(44100, -16, 8, 1024)  # 8 channels (guesswork)
+            pygame.init()
+
+            self.canvas = pygame.display.set_mode((width, height),pygame.DOUBLEBUF,32)
+            pygame.display.set_caption('PixelBot Simulator!')
+
+        if self.canvas is not None:
+            self.background=self.drawBackground()
+        self.drawn=None     # robot: (draw state,rect) from the last frame
 
 
         # kick the simulator off in a background thread
@@ -88,14 +178,12 @@ class Simulator():
     def setSpeed(self,botId,lws,rws):
         bot=self.findBotById(botId)
         if bot is not None:
-            console_println("Setting speed for ",bot.getName())
+            LOG.info("sim","Setting speed for ",bot.getName(),sep="",console=True)
             bot.setSpeed(lws,rws)
 
     def findBotById(self,botId):
-        for bot in self.robots.elements():
-            if bot.getId() == botId:
-                return bot
-        return None
+        # the id is the name
+        return self.robots.findByName(botId)
 
 
     def getRobots(self):
@@ -122,39 +210,43 @@ class Simulator():
 
         # also needed if not passed in
 
-        kwargs["fps"]=self.fps
+        kwargs["fps"]=self.physicsHz
         kwargs["console"] = self.console
         kwargs["allRobots"]=self.robots
-
-        PixBot=PixelBot(**kwargs)
-
-        bot=self.findBotByName(PixBot.getName())
+        kwargs["scheduler"]=self.scheduler
+        kwargs["ticker"]=self.ticker
+        kwargs["clock"]=self.clock
+        kwargs["fleet"]=self.fleet
+        kwargs["sensors"]=self.sensors
+        kwargs["recorder"]=self.recorder
+        kwargs["audio"]=self.audio
+        # each robot has its own generator so script timing can't change the numbers
+        kwargs["rng"]=random.Random(self.random.getrandbits(32))
+
+        # checked before the robot is created so a rejected robot
+        # doesn't take a slot in the fleet
+        bot=self.findBotByName(kwargs.get("name",PixelBot.name))
         if bot is not None:
-            print(bot.getName()+"already exists. Please try again")
+            LOG.warning("sim",bot.getName()+" already exists. Please try again",console=True)
             return
 
-        bot=self.findBotByColor(PixBot.getColor())
+        bot=self.findBotByColor(kwargs.get("color",PixelBot.color))
         if bot is not None:
-            print(bot.getName()+"is the same color. This could get confusing. Please try again.")
+            LOG.warning("sim",bot.getName()+" is the same color. This could get confusing. Please try again.",console=True)
             return
 
+        PixBot=PixelBot(**kwargs)
+
         self.robots.insert(PixBot)
 
         PixBot.run()
 
 
     def findBotByName(self,name):
-        name=name.lower()
-        for bot in self.robots.elements():
-            if bot.getName().lower()==name.lower():
-                return bot
-        return None
+        return self.robots.findByName(name)
 
     def findBotByColor(self,color):
-        for bot in self.robots.elements():
-            if bot.getColor()==color:
-                return bot
-        return None
+        return self.robots.findByColor(color)
 
     def uploadScript(self,botName,script):
         """
@@ -168,10 +260,10 @@ class Simulator():
         """
         bot=self.findBotByName(botName)
         if bot is None:
-            console_println("Simulator cannot locate bot with name=",botName)
+            LOG.warning("sim","Simulator cannot locate bot with name=",botName,sep="",console=True)
             return
 
-        console_println("Uploading script for bot with name=",botName)
+        LOG.info("sim","Uploading script for bot with name=",botName,sep="",console=True)
         bot.uploadScript(script)
 
     def stop(self):
@@ -185,6 +277,14 @@ class Simulator():
         for bot in self.robots.elements():
            bot.stop()
 
+        AUDIO.stopAll()
+
+        if self.recorder is not None:
+            self.recorder.close()
+
+        if self.audio is not None:
+            self.audio.close()
+
 
     def update(self):
         """
@@ -192,40 +292,302 @@ class Simulator():
 
         caller is responsible for calling tkinter update()
 
+        Physics runs in fixed steps of 1/physicsHz. The wall clock time since
+        the last call decides how many steps are due, if drawing falls behind
+        the extra steps are run and the missed frames are counted (see
+        getMetrics()) so motion is the same however fast the display is.
+
+        Headless, each call is one physics step. Frames are drawn (if render
+        is True) renderHz times per simulated second.
+
         :return: Nothing
         """
 
+        if self.headless:
+            self.step()
+
+            # no waiting, simulated time moves on a fixed step
+            if self.canvas is not None and self.clock.time()>=self.nextFrame:
+                self.nextFrame+=1/self.renderHz
+                self.drawFrame(1)
+            return
+
         for event in pygame.event.get():
             if event.type == QUIT:
                 pygame.quit()
                 self.running = False
-                console_println("Quitting Simulation")
+                LOG.info("sim","Quitting Simulation",console=True)
                 for bot in self.robots.elements():
                     bot.stop()
                 sys.exit()
 
-        self.canvas.fill(self.canvasColor)
+        dt=1/self.physicsHz
+        now=self.clock.time()
+        if self.lastUpdate is None:
+            self.lastUpdate=now-dt
+        elapsed=now-self.lastUpdate
+        self.lastUpdate=now
 
-        w, h = self.arena
-        pygame.draw.lines(self.canvas, (255, 255, 255), False, [(0, h / 2), (w, h / 2)], 1)
-        pygame.draw.lines(self.canvas, (255, 255, 255), False, [(w / 2, 0), (w / 2, h)], 1)
+        # frames which should have been drawn since the last one
+        missed=int(elapsed*self.renderHz)-1
+        if missed>0: self.skippedFrames+=missed
+
+        self.accumulator+=elapsed
+        if self.accumulator>self.maxCatchUp:
+            # too far behind to catch up, give up on some simulated time
+            self.droppedTime+=self.accumulator-self.maxCatchUp
+            self.accumulator=self.maxCatchUp
+
+        while self.accumulator>=dt:
+            self.step()
+            self.accumulator-=dt
+
+        # draw the robots part way between the last two steps
+        changed=self.drawFrame(self.accumulator/dt)
+
+        # this regulates the display update speed
+        if changed is None:
+            pygame.display.update()
+        else:
+            pygame.display.update(changed)
+        if self.console is not None:
+            self.console.update()
+        self.fpsClock.tick(self.renderHz)
+
+    def step(self):
+        """
+        one physics step of 1/physicsHz seconds
+        """
+        # where every robot starts the tick, scripts can hyperjump them
+        self.fleet.beginSweep()
+        self.events.begin(self.ticks)
+
+        # advance robot scripts one tick
+        if self.scheduler is not None:
+            self.scheduler.tick(self.clock.time())
+
+        # move every robot with a timed MOVE, TURN or ARC in progress
+        self.fleet.savePrevious()
+        self.fleet.step(1/self.physicsHz)
+        for slots,x,y,nx,ny in self.fleet.getWallHits():
+            self.events.add(WALL,slots,-1,x,y,nx,ny)
 
+        # re-file robots which have moved into another grid cell
+        self.robots.refresh()
 
-        # make sure the active list contains all robots
-        self.robots.set_mask(None)
+        # robots which touched anywhere along the path they moved are put back where they touched
+        self.resolveContacts()
+
+        # sonar for every robot in one go, read by update() and @distance
+        self.sensors.update(self.ticks)
+        nearest,distance,me,him=self.sensors.results
+        self.events.addSonar(self.fleet,me,him)
+
+        self.events.publish()
+        self.deliverContacts()
+
+        # wake threaded scripts waiting for the next tick, once this tick's sensors and events are ready
+        self.ticker.tick()
 
         # the bots are responsible for avoiding collisions
         for bot in self.robots.elements():
-            bot.update(self.canvas, self.robots)
+            bot.update(None, self.robots)
 
-        # this regulates the display update speed
-        pygame.display.update()
-        self.console.update()
-        self.fpsClock.tick(self.fps)
+        # before the tick is counted, so the state is stamped with the same tick as its events
+        if self.recorder is not None:
+            self.recorder.record(self)
 
-    def getBotCount(self):
-        count=0
+        self.ticks+=1
+
+        if self.headless:
+            self.clock.advance(1/self.physicsHz)
+
+        if self.audio is not None:
+            self.audio.advance(self.clock.time())
+
+    def resolveContacts(self):
+        """
+        find every pair of robots which touched during the tick (see
+        Collision.findContacts) and stop each robot at its first contact.
+        A CONTACT event is added for each robot stopped.
+        """
+        a,b,toi,nx,ny=findContacts(self.broadphase,self.fleet)
+        if len(a)==0: return
+
+        x0,y0,x1,y1=self.fleet.getSweep()
+        done={}     # slot: other,toi,nx,ny
+        # earliest first, a robot only stops once
+        for i in range(len(a)):
+            t=float(toi[i])
+            for me,him,sign in ((int(a[i]),int(b[i]),1),(int(b[i]),int(a[i]),-1)):
+                if me in done: continue
+                done[me]=(him,t,sign*float(nx[i]),sign*float(ny[i]))
+                with self.fleet.lock:
+                    self.fleet.x[me]=x0[me]+t*(x1[me]-x0[me])
+                    self.fleet.y[me]=y0[me]+t*(y1[me]-y0[me])
+
+        slots=numpy.fromiter(done.keys(),dtype=int,count=len(done))
+        other,t,cx,cy=numpy.array(list(done.values())).T
+        self.events.add(CONTACT,slots,other,self.fleet.x[slots],self.fleet.y[slots],cx,cy,t)
+
+        # what is left of their motion carries on from there
+        self.fleet.rebase(slots)
+
+        self.robots.refresh()
+
+    def deliverContacts(self):
+        """
+        the robots react to their contacts in update(), see PixelBot.contact,
+        and scripts see them as @collided and @bumped
+        """
+        bots=self.fleet.getRobots()
+        for batch in self.robotEvents.getAll():
+            for event in batch.events.tolist():
+                kind,tick,robot,other,x,y,nx,ny,toi=event
+                if kind==CONTACT:
+                    bots[robot].contact=(bots[other],toi,(nx,ny))
+                elif kind==WALL:
+                    bots[robot].bumped=True
+
+    def drawFrame(self,alpha):
+        """
+        draw the robots
+
+        :param float alpha: 0 to 1, how far between the last two physics steps to draw them
+        :return list: Rects of the canvas which have changed or None if it all has
+        """
+        self.frames+=1
+        self.fleet.interpolate(alpha)
+
+        if self.dirtyRects:
+            return self.drawChanged()
+
+        self.canvas.blit(self.background,(0,0))
         for bot in self.robots.elements():
-            count+=1
+            bot.draw(self.canvas)
+        return None
 
-        return count
\ No newline at end of file
+    def getMetrics(self):
+        """
+        :return dict: counts for checking the simulator keeps up
+        """
+        return {"physicsHz":self.physicsHz,
+                "renderHz":self.renderHz,
+                "ticks":self.ticks,                 # physics steps
+                "frames":self.frames,               # frames drawn
+                "skippedFrames":self.skippedFrames, # frames not drawn because we were behind
+                "droppedTime":self.droppedTime,     # seconds of simulation given up when too far behind
+                "events":self.events.getTotals()}   # events published by kind
+
+    def drawBackground(self):
+        """
+        the arena without any robots, drawn once and used to erase them
+
+        :return Surface:
+        """
+        w, h = self.arena
+        background=pygame.Surface((w,h))
+        if not self.headless:
+            background=background.convert()
+
+        background.fill(self.canvasColor)
+        pygame.draw.lines(background, (255, 255, 255), False, [(0, h / 2), (w, h / 2)], 1)
+        pygame.draw.lines(background, (255, 255, 255), False, [(w / 2, 0), (w / 2, h)], 1)
+        self.walls.draw(background)
+        return background
+
+    def drawChanged(self):
+        """
+        dirtyRects mode - only redraw robots which look different from the
+        last frame, and any robots they overlap
+
+        The area each robot covered last frame and covers now is restored
+        from the background then the robots are drawn in the usual order.
+
+        :return list: Rects of the canvas which have changed or None if it all has
+        """
+        bots=self.robots.elements()
+        everything=self.drawn is None
+        if everything:
+            self.canvas.blit(self.background,(0,0))
+            self.drawn={}
+
+        states={}
+        rects={}
+        dirty=[]
+        redraw=set()
+        for bot in bots:
+            states[bot]=bot.getDrawState()
+            rects[bot]=bot.getDrawRect(states[bot])
+            last=self.drawn.get(bot)        # (state,rect)
+            if last is None or last[0]!=states[bot]:
+                redraw.add(bot)
+                dirty.append(rects[bot])
+                if last is not None: dirty.append(last[1])
+
+        # robots overlapping a dirty area get erased so they must be redrawn too
+        grown=True
+        while grown:
+            grown=False
+            for bot in bots:
+                if bot not in redraw and rects[bot].collidelist(dirty)!=-1:
+                    redraw.add(bot)
+                    dirty.append(rects[bot])
+                    grown=True
+
+        for rect in dirty:
+            self.canvas.blit(self.background,rect,rect)
+
+        for bot in bots:
+            if bot in redraw:
+                bot.draw(self.canvas,states[bot])
+
+        self.drawn={bot:(states[bot],rects[bot]) for bot in bots}
+
+        if everything: return None
+        return dirty
+
+    def run(self,duration):
+        """
+        headless only - run the simulation for duration simulated seconds
+        as fast as possible
+
+        Stops early if all robot scripts have finished.
+
+        :param float duration: seconds of simulated time
+        :return int: number of updates done
+        """
+        assert self.headless,"run() is for headless simulators, otherwise call update() renderHz times a second."
+
+        ticks=self.ticks
+        endTime=self.clock.time()+duration
+        while self.running and self.clock.time()<endTime:
+            self.update()
+            if self.scheduler.getTaskCount()==0:
+                break
+
+        return self.ticks-ticks
+
+    def getTime(self):
+        """
+        :return float: seconds, simulated time when headless
+        """
+        return self.clock.time()
+
+    def randomPosition(self,size,tries=100):
+        """
+        somewhere for a new robot, inside the wall margin and clear of the
+        obstacles, from the seeded generator so a run can be repeated
+
+        :param float size: robot radius
+        :return tuple: X,Y
+        """
+        w,h=self.arena
+        for attempt in range(tries):
+            X=self.random.randint(0,w-2*WALLMARGIN)+WALLMARGIN
+            Y=self.random.randint(0,h-2*WALLMARGIN)+WALLMARGIN
+            if self.walls.isClear(X,Y,size): break
+        return X,Y
+
+    def getBotCount(self):
+        return len(self.robots)
@@ -0,0 +1,384 @@
+"""
+Snapshot.py
+
+Save the whole simulator state and carry on from it later
+
+snap=Snapshot.capture(sim)     # between updates
+data=snap.toBytes()
+...
+Snapshot.fromBytes(data).restore(otherSim)
+
+Everything needed to carry on exactly where the run left off is saved - the
+fleet arrays, sonar results and who is in whose sonar cone, wheels, pixel
+rings, script variables, random number generators and where each script
+had got to.
+
+The arena is not rebuilt, a snapshot only restores into a simulator with
+the same size of arena and the same walls and obstacles (see Walls.py).
+
+A running script is saved as its stack of Lex frames. Each frame is the path
+to its block in the compiled program (see Compiler.py) plus the index of
+the next statement. What the script was waiting for is saved as well.
+
+Only cooperative (or headless) simulators can be saved, threaded scripts
+can be part way through a statement.
+
+The data is zlib compressed json, numpy arrays are base64. The schema
+number is bumped whenever the layout changes.
+
+"""
+
+import json
+import zlib
+import base64
+import inspect
+import struct
+import numpy
+from Constants import *
+from Exceptions import *
+from Scheduler import *
+from Compiler import *
+from Fleet import *
+from Clock import *
+from Lex import *
+
+MAGIC=b"PXBSNAP"
+SCHEMA=5
+
+HEADER=struct.Struct("<7sH")
+
+# compiled node attributes which hold a block
+BLOCKS=("thenBlock","elseBlock","body")
+
+
+def _array(a):
+    return {"dtype":str(a.dtype),"data":base64.b64encode(numpy.ascontiguousarray(a).tobytes()).decode()}
+
+
+def _fromArray(d):
+    return numpy.frombuffer(base64.b64decode(d["data"]),dtype=d["dtype"]).copy()
+
+
+def _walls(walls):
+    """
+    :return dict: wall segments and obstacle polygons, as json would give them back
+    """
+    return {"walls":[[float(v) for v in s] for s in walls.segments],
+            "obstacles":[[[float(v) for v in p] for p in poly] for poly in walls.polygons]}
+
+
+def _randomState(rng):
+    version,state,gauss=rng.getstate()
+    return [version,list(state),gauss]
+
+
+def _setRandomState(rng,state):
+    version,internal,gauss=state
+    rng.setstate((version,tuple(internal),gauss))
+
+
+def blockPath(program,block):
+    """
+    where a block is in the compiled program
+
+    :param list program: top level block
+    :param list block: a block within it
+    :return list: [[node index,attribute],...] empty for the top level, None if not found
+    """
+    if block is program: return []
+
+    for i,node in enumerate(program):
+        for name in BLOCKS:
+            child=getattr(node,name,None)
+            if child is None: continue
+            if child is block: return [[i,name]]
+            path=blockPath(child,block)
+            if path is not None: return [[i,name]]+path
+    return None
+
+
+def findBlock(program,path):
+    """
+    :return tuple: block,loop - loop is the WHILE or FOREVER node owning the block or None
+    """
+    block=program
+    loop=None
+    for i,name in path:
+        node=block[i]
+        block=getattr(node,name)
+        loop=node if name=="body" else None
+    return block,loop
+
+
+class Snapshot():
+    """
+    state       dict of everything saved, see capture()
+    """
+    state=None
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+    # saving
+
+    @staticmethod
+    def capture(sim):
+        """
+        :param Simulator sim: cooperative, not in the middle of update()
+        :return Snapshot:
+        """
+        if sim.scheduler is None:
+            raise SnapshotError("Only cooperative or headless simulators can be saved")
+
+        fleet=sim.fleet
+        n=fleet.count
+        now=sim.clock.time()
+
+        arrays={name:_array(getattr(fleet,name)[:n]) for name in FIELDS+("motion",)}
+
+        tick,results,wallDistance=sim.sensors.scan
+        sensors=None if results is None else [_array(a) for a in results]
+
+        # the scheduler runs tasks in this order
+        order=[task.owner.getName() for task in sim.scheduler.tasks if not task.done]
+
+        state={
+            "schema":SCHEMA,
+            "arena":list(sim.arena),
+            "walls":_walls(sim.walls),
+            "physicsHz":sim.physicsHz,
+            "ticks":sim.ticks,
+            "time":now if isinstance(sim.clock,SimClock) else None,
+            "nextFrame":sim.nextFrame-now,
+            "seed":sim.seed,
+            "random":_randomState(sim.random),
+            "fleet":arrays,
+            "sensors":sensors,
+            "sensorTick":tick,
+            "wallDistance":None if wallDistance is None else _array(wallDistance),
+            "sonar":_array(sim.events.sonar),        # pairs in sonar cones, for SONARENTER and SONAREXIT
+            "sonarSize":sim.events.sonarSize,
+            "taskOrder":order,
+            "robots":[Snapshot._robot(sim,bot,now) for bot in fleet.getRobots()],
+        }
+        return Snapshot(state=state)
+
+    @staticmethod
+    def _robot(sim,bot,now):
+        ring=bot.pixelRing
+        lex=bot.lex
+
+        # eval() adds __builtins__
+        variables={name:value for name,value in lex.globals.items() if not name.startswith("__")}
+        for name,value in variables.items():
+            if value is not None and type(value) not in (int,float,str,bool):
+                raise SnapshotError(bot.getName()+" variable "+name+" can't be saved")
+
+        return {
+            "name":bot.getName(),
+            "color":bot.getColor(),
+            "size":bot.getSize(),
+            "status":bot.status,
+            "collisions":bot.collisions,
+            "scriptErrors":bot.scriptErrors,
+            "collided":bot.collided,
+            "bumped":bot.bumped,
+            "script":list(bot.script.getLines()),
+            "lineNumber":bot.script.lineNumber,
+            "random":_randomState(bot.rng),
+            "ring":{"ledColor":list(ring.ledColor),"ledFlashRate":ring.ledFlashRate,
+                    "ledsOn":ring.ledsOn,"nextLedChange":ring.nextLedChange-now},
+            "wheels":[Snapshot._wheel(wheel,now) for wheel in (bot.leftWheel,bot.rightWheel)],
+            "globals":variables,
+            "lastCmdDone":lex.lastCmdDone,
+            "task":Snapshot._task(sim,bot,now),
+        }
+
+    @staticmethod
+    def _wheel(wheel,now):
+        return {"rps":wheel.rps,"startTime":None if wheel.startTime is None else wheel.startTime-now,
+                "distMoved":wheel.distMoved,"totalDistMoved":wheel.totalDistMoved,"moving":wheel.moving}
+
+    @staticmethod
+    def _task(sim,bot,now):
+        """
+        :return dict: where the script has got to or None if it isn't running
+        """
+        task=sim.scheduler.getTask(bot)
+        if task is None:
+            return None
+
+        if inspect.getgeneratorstate(task.gen)==inspect.GEN_CREATED:
+            # not started yet, it will start from the beginning
+            return {"started":False}
+
+        lex=bot.lex
+        frames=[]
+        for frame in lex.frames:
+            path=blockPath(lex.program,frame.block)
+            if path is None:
+                raise SnapshotError(bot.getName()+" script is not in its compiled program")
+            frames.append([path,frame.index])
+
+        wait=task.wait
+        if wait is None:
+            waitState=None
+        elif isinstance(wait,WaitUntil):
+            waitState={"kind":"until","remaining":wait.deadline-now}
+        elif isinstance(wait,WaitMotion):
+            waitState={"kind":"motion"}
+        else:
+            waitState={"kind":"tick"}
+
+        return {"started":True,"frames":frames,"wait":waitState,"statementCount":lex.statementCount}
+
+    def toBytes(self):
+        return HEADER.pack(MAGIC,SCHEMA)+zlib.compress(json.dumps(self.state).encode())
+
+    @staticmethod
+    def fromBytes(data):
+        magic,schema=HEADER.unpack_from(data)
+        if magic!=MAGIC:
+            raise SnapshotError("Not a simulator snapshot")
+        if schema!=SCHEMA:
+            raise SnapshotError("Snapshot schema %d can't be read, expected %d"%(schema,SCHEMA))
+        return Snapshot(state=json.loads(zlib.decompress(data[HEADER.size:]).decode()))
+
+    def save(self,path):
+        with open(path,"wb") as f:
+            f.write(self.toBytes())
+
+    @staticmethod
+    def load(path):
+        with open(path,"rb") as f:
+            return Snapshot.fromBytes(f.read())
+
+    # restoring
+
+    def restore(self,sim):
+        """
+        put sim into the saved state
+
+        sim must be cooperative with the same arena and either have no robots or
+        the same robots in the same order. Missing robots are created.
+
+        :param Simulator sim:
+        """
+        state=self.state
+        if sim.scheduler is None:
+            raise SnapshotError("Only cooperative or headless simulators can be restored")
+        if tuple(state["arena"])!=tuple(sim.arena):
+            raise SnapshotError("The arena is not the same size")
+        if state["walls"]!=_walls(sim.walls):
+            raise SnapshotError("The arena does not have the same walls and obstacles")
+
+        existing=sim.fleet.getRobots()
+        names=[robot["name"] for robot in state["robots"]]
+        if [bot.getName() for bot in existing]!=names[:len(existing)]:
+            raise SnapshotError("The simulator has different robots")
+
+        for robot in state["robots"][len(existing):]:
+            sim.addRobot(name=robot["name"],color=robot["color"],size=robot["size"],arena=sim.arena)
+
+        # stop every script before the fleet is restored, stopping also stops motion
+        bots=sim.fleet.getRobots()
+        for bot in bots:
+            bot.stop()
+
+        if state["time"] is not None:
+            sim.clock.setTime(state["time"])
+        now=sim.clock.time()
+
+        sim.ticks=state["ticks"]
+        sim.nextFrame=now+state["nextFrame"]
+        sim.seed=state["seed"]
+        _setRandomState(sim.random,state["random"])
+
+        fleet=sim.fleet
+        with fleet.lock:
+            for name,array in state["fleet"].items():
+                values=_fromArray(array)
+                getattr(fleet,name)[:len(values)]=values
+        fleet.previous=None
+        sim.robots.refresh()
+
+        if state["sensors"] is not None:
+            wallDistance=state["wallDistance"]
+            sim.sensors.publish(state["sensorTick"],tuple(_fromArray(a) for a in state["sensors"]),
+                                None if wallDistance is None else _fromArray(wallDistance))
+
+        sim.events.sonar=_fromArray(state["sonar"])
+        sim.events.sonarSize=state["sonarSize"]
+
+        for bot,robot in zip(bots,state["robots"]):
+            self._restoreRobot(bot,robot,now)
+
+        # start the scripts in the order the scheduler had them
+        byName={bot.getName():(bot,robot) for bot,robot in zip(bots,state["robots"])}
+        for name in state["taskOrder"]:
+            bot,robot=byName[name]
+            self._restoreTask(bot,robot,now)
+
+        sim.drawn=None      # redraw everything
+
+    def _restoreRobot(self,bot,robot,now):
+        bot.setColor(robot["color"])     # keeps the simulator's colour index up to date
+        bot.size=robot["size"]
+        bot.status=robot["status"]
+        bot.collisions=robot["collisions"]
+        bot.scriptErrors=robot["scriptErrors"]
+        bot.collided=robot.get("collided",False)
+        bot.bumped=robot.get("bumped",False)
+        bot.script.replaceScript(robot["script"])
+        bot.script.lineNumber=robot["lineNumber"]
+        _setRandomState(bot.rng,robot["random"])
+
+        ring=bot.pixelRing
+        ring.ledColor=list(robot["ring"]["ledColor"])
+        ring.ledFlashRate=robot["ring"]["ledFlashRate"]
+        ring.ledsOn=robot["ring"]["ledsOn"]
+        ring.nextLedChange=now+robot["ring"]["nextLedChange"]
+
+        for wheel,saved in zip((bot.leftWheel,bot.rightWheel),robot["wheels"]):
+            for k,v in saved.items():
+                setattr(wheel,k,v)
+            if wheel.startTime is not None:
+                wheel.startTime+=now
+
+        bot.lex.globals=dict(robot["globals"])
+        bot.lex.lastCmdDone=robot["lastCmdDone"]
+
+    def _restoreTask(self,bot,robot,now):
+        task=robot["task"]
+        if task is None:
+            return
+
+        if not task["started"]:
+            bot.run()
+            return
+
+        program=bot.lex.compileScript()
+        if program is None:
+            raise SnapshotError(bot.getName()+" script no longer compiles")
+
+        frames=[]
+        for path,index in task["frames"]:
+            block,loop=findBlock(program,path)
+            frame=Frame(block,loop)
+            frame.index=index
+            frames.append(frame)
+
+        wait=task["wait"]
+        if wait is None:
+            resumeWait=None
+        elif wait["kind"]=="until":
+            resumeWait=WaitUntil(deadline=now+wait["remaining"])
+        elif wait["kind"]=="motion":
+            resumeWait=WaitMotion(robot=bot)
+        else:
+            resumeWait=Wait()
+
+        bot.resume(frames,resumeWait)
+        bot.lex.statementCount=task["statementCount"]
+        bot.status=robot["status"]
@@ -0,0 +1,251 @@
+"""
+SpatialGrid.py
+
+Uniform grid spatial index for the robots in the arena
+
+Replaces smartquadtree. The arena is divided into square cells, each cell
+holds a list of the robots whose centre lies in it. Neighbour and sonar
+queries only look at the cells which overlap the search circle.
+
+Robots move every tick so refresh() is called by the Simulator after the
+Fleet has moved them. Only robots which have changed cell are re-filed.
+
+Names and colours are held in dicts so lookups don't scan every robot.
+
+"""
+
+import math
+import threading
+import numpy
+from Constants import *
+
+
+class SpatialGrid():
+    """
+    grid=SpatialGrid(arena=(800,800),fleet=fleet)
+    grid.insert(bot)
+    grid.refresh()      # after robots have moved
+    grid.querySector(x,y,heading,spread,range,exclude=bot)
+    """
+    arena=(0,0)             # width and height
+    cellSize=GRIDCELLSIZE
+    fleet=None              # Fleet holding robot positions
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        w,h=self.arena
+        self.columns=int(math.ceil(w/self.cellSize))+1
+        self.rows=int(math.ceil(h/self.cellSize))+1
+
+        self.cells={}           # cell number: list of robots
+        self.cellOf={}          # fleet slot: cell number
+        self.robots=[]          # in the order they were added
+        self.byName={}          # lower case name: robot
+        self.byColor={}         # color: robot
+        self.lock=threading.Lock()
+        self.version=0          # bumped whenever a robot changes cell
+        self.pairs=None         # version,me,him from candidatePairs()
+
+    def cellNumber(self,x,y):
+        column=min(max(int(x//self.cellSize),0),self.columns-1)
+        row=min(max(int(y//self.cellSize),0),self.rows-1)
+        return row*self.columns+column
+
+    def insert(self,bot):
+        with self.lock:
+            cell=self.cellNumber(bot.get_x(),bot.get_y())
+            self.cells.setdefault(cell,[]).append(bot)
+            self.cellOf[bot.slot]=cell
+            self.version+=1
+            self.robots.append(bot)
+            self.byName[bot.getName().lower()]=bot
+            self.byColor[bot.getColor()]=bot
+
+    def remove(self,bot):
+        with self.lock:
+            if bot.slot not in self.cellOf: return
+            self.cells[self.cellOf.pop(bot.slot)].remove(bot)
+            self.version+=1
+            self.robots.remove(bot)
+            self.byName.pop(bot.getName().lower(),None)
+            if self.byColor.get(bot.getColor()) is bot:
+                del self.byColor[bot.getColor()]
+
+    def _refile(self,bot,cell):
+        old=self.cellOf[bot.slot]
+        if old==cell: return
+        self.cells[old].remove(bot)
+        self.cells.setdefault(cell,[]).append(bot)
+        self.cellOf[bot.slot]=cell
+        self.version+=1
+
+    def move(self,bot):
+        """
+        call when a single robot has been moved, e.g. by POS
+        """
+        with self.lock:
+            if bot.slot in self.cellOf:
+                self._refile(bot,self.cellNumber(bot.get_x(),bot.get_y()))
+
+    def refresh(self):
+        """
+        re-file robots which have changed cell since the last refresh
+
+        The cell of every robot is calculated in one go from the fleet arrays.
+        """
+        fleet=self.fleet
+        n=fleet.count
+        if n==0: return
+
+        columns=numpy.clip((fleet.x[:n]//self.cellSize).astype(int),0,self.columns-1)
+        rows=numpy.clip((fleet.y[:n]//self.cellSize).astype(int),0,self.rows-1)
+        cells=rows*self.columns+columns
+
+        with self.lock:
+            for slot,cell in self.cellOf.items():
+                if cells[slot]!=cell:
+                    self._refile(fleet.robots[slot],int(cells[slot]))
+
+    def colorChanged(self,bot,oldColor):
+        with self.lock:
+            if self.byColor.get(oldColor) is bot:
+                del self.byColor[oldColor]
+            self.byColor[bot.getColor()]=bot
+
+    # lookups
+
+    def elements(self):
+        """
+        :return list: all robots in the order they were added
+        """
+        return list(self.robots)
+
+    def __len__(self):
+        return len(self.robots)
+
+    def findByName(self,name):
+        return self.byName.get(name.lower())
+
+    def findByColor(self,color):
+        return self.byColor.get(color)
+
+    # spatial queries
+
+    def candidates(self,x,y,radius):
+        """
+        robots in the cells overlapping the square around the circle
+
+        :return list: robots which might be within radius of x,y
+        """
+        c0=max(int((x-radius)//self.cellSize),0)
+        c1=min(int((x+radius)//self.cellSize),self.columns-1)
+        r0=max(int((y-radius)//self.cellSize),0)
+        r1=min(int((y+radius)//self.cellSize),self.rows-1)
+
+        found=[]
+        with self.lock:
+            for row in range(r0,r1+1):
+                for column in range(c0,c1+1):
+                    cell=self.cells.get(row*self.columns+column)
+                    if cell: found.extend(cell)
+        return found
+
+    def candidatePairs(self):
+        """
+        every pair of robots in the same or neighbouring cells, worked out
+        with numpy rather than a loop per robot
+
+        Pairs within cellSize of each other are always included. The pairs
+        are kept till a robot changes cell.
+
+        :return tuple: arrays me,him of fleet slots, both orders are included
+        """
+        pairs=self.pairs
+        if pairs is not None and pairs[0]==self.version:
+            return pairs[1],pairs[2]
+
+        with self.lock:
+            version=self.version
+            slots=numpy.fromiter(self.cellOf.keys(),dtype=int,count=len(self.cellOf))
+            cells=numpy.fromiter(self.cellOf.values(),dtype=int,count=len(self.cellOf))
+
+        empty=numpy.zeros(0,dtype=int)
+        if len(slots)<2:
+            self.pairs=(version,empty,empty)
+            return empty,empty
+
+        # sort by cell so each cell's robots are a contiguous run
+        order=numpy.argsort(cells,kind="stable")
+        slots=slots[order]
+        cells=cells[order]
+        rows,columns=numpy.divmod(cells,self.columns)
+
+        me=[]
+        him=[]
+        for dr in (-1,0,1):
+            for dc in (-1,0,1):
+                r=rows+dr
+                c=columns+dc
+                valid=(r>=0)&(r<self.rows)&(c>=0)&(c<self.columns)
+                neighbour=r*self.columns+c
+
+                start=numpy.searchsorted(cells,neighbour,"left")
+                counts=numpy.where(valid,numpy.searchsorted(cells,neighbour,"right")-start,0)
+                total=counts.sum()
+                if total==0: continue
+
+                # expand each robot into one entry per robot in the neighbouring cell
+                first=numpy.cumsum(counts)-counts
+                index=numpy.arange(total)-numpy.repeat(first,counts)+numpy.repeat(start,counts)
+
+                me.append(numpy.repeat(slots,counts))
+                him.append(slots[index])
+
+        if len(me)==0:
+            self.pairs=(version,empty,empty)
+            return empty,empty
+
+        me=numpy.concatenate(me)
+        him=numpy.concatenate(him)
+        other=me!=him
+        self.pairs=(version,me[other],him[other])
+        return me[other],him[other]
+
+    def queryRadius(self,x,y,radius,exclude=None):
+        """
+        :return list: robots whose centre is within radius of x,y
+        """
+        found=[]
+        r2=radius*radius
+        for bot in self.candidates(x,y,radius):
+            if bot is exclude: continue
+            bx,by=bot.getPos()
+            if (bx-x)*(bx-x)+(by-y)*(by-y)<=r2:
+                found.append(bot)
+        return found
+
+    def querySector(self,x,y,heading,spread,radius,exclude=None):
+        """
+        robots whose centre is inside the cone radius long and spread degrees
+        wide pointing along heading from x,y
+
+        :param float heading: radians
+        :param float spread: degrees, total width of the cone
+        :return list: robots in the sector
+        """
+        ux=math.cos(heading)
+        uy=math.sin(heading)
+        cosHalf=math.cos(math.radians(spread)/2)
+
+        found=[]
+        for bot in self.queryRadius(x,y,radius,exclude):
+            bx,by=bot.getPos()
+            dx=bx-x
+            dy=by-y
+            dist=math.sqrt(dx*dx+dy*dy)
+            # inside the cone if the angle to the bot is within spread/2 of heading
+            if dist>0 and dx*ux+dy*uy>=dist*cosHalf:
+                found.append(bot)
+        return found
@@ -0,0 +1,126 @@
+"""
+SpriteCache.py
+
+Pre-rendered robot images
+
+Drawing each robot used to take a circle for the body, one for each LED
+and a polygon for the sonar cone, every frame. The images only change when
+the robot's colour, size or LEDs change so they are drawn once onto
+transparent surfaces and kept here. The sonar cone is cached for each
+CONEANGLESTEP degrees of heading.
+
+A robot is then drawn with two blits, see PixelBot.draw()
+
+"""
+
+import math
+import pygame
+from Constants import *
+
+
+def _rgb(color):
+    """
+    :param int color: 0xRRGGBB as used throughout the simulator
+    :return pygame.Color: opaque colour for drawing on alpha surfaces
+    """
+    return pygame.Color((color>>16)&0xFF,(color>>8)&0xFF,color&0xFF)
+
+
+class Sprite():
+    """
+    surface     transparent pygame surface
+    centre      offset of the robot's position within the surface
+    """
+    surface=None
+    centre=0
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+    def blit(self,canvas,pos):
+        x,y=pos
+        canvas.blit(self.surface,(int(x)-self.centre,int(y)-self.centre))
+
+    def getRect(self,pos):
+        """
+        :return pygame.Rect: area blit() covers
+        """
+        x,y=pos
+        return self.surface.get_rect(topleft=(int(x)-self.centre,int(y)-self.centre))
+
+
+class SpriteCache():
+    """
+    sprites=SpriteCache()
+    sprites.getBody(color,size,pixelRing).blit(canvas,pos)
+    sprites.getCone(distSensor,direction).blit(canvas,pos)
+    """
+    angleStep=CONEANGLESTEP     # degrees between cached cone headings
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.bodies={}      # (color,size,ring layout,led colors): Sprite
+        self.cones={}       # (color,spread,range,arcSteps,heading step): Sprite
+
+    def _newSurface(self,centre):
+        surface=pygame.Surface((2*centre+1,2*centre+1),pygame.SRCALPHA)
+        if pygame.display.get_surface() is not None:
+            # faster blits in the display's pixel format
+            surface=surface.convert_alpha()
+        surface.fill((0,0,0,0))
+        return surface
+
+    def getBody(self,color,size,ring):
+        """
+        the robot body with its pixel ring on top
+
+        :param int color: body colour 0xRRGGBB
+        :param int size: body radius
+        :param PixelRing ring: supplies the layout and the LED colours showing now
+        :return Sprite:
+        """
+        leds=ring.getLedColors()
+        key=(color,size,ring.numLeds,ring.ledRingRadius,ring.ledRadius,leds)
+        sprite=self.bodies.get(key)
+        if sprite is None:
+            centre=int(math.ceil(max(size,ring.ledRingRadius+ring.ledRadius)))+1
+            surface=self._newSurface(centre)
+            pygame.draw.circle(surface,_rgb(color),(centre,centre),size,0)
+            ring.drawLeds((centre,centre),surface,[_rgb(led) for led in leds])
+            sprite=Sprite(surface=surface,centre=centre)
+            self.bodies[key]=sprite
+        return sprite
+
+    def getCone(self,sensor,direction):
+        """
+        the sonar cone, rotated to the nearest angleStep
+
+        :param DistSensor sensor: supplies spread, range and colour
+        :param float direction: robot heading in radians
+        :return Sprite:
+        """
+        steps=int(round(360/self.angleStep))
+        step=int(round(math.degrees(direction)/self.angleStep))%steps
+        key=(sensor.roiColor,sensor.spread,sensor.range,sensor.arcSteps,step)
+        sprite=self.cones.get(key)
+        if sprite is None:
+            centre=int(sensor.range)+1
+            surface=self._newSurface(centre)
+            roi=sensor.getCone((centre,centre),math.radians(step*self.angleStep))
+            pygame.draw.polygon(surface,_rgb(sensor.roiColor),roi,0)
+            sprite=Sprite(surface=surface,centre=centre)
+            self.cones[key]=sprite
+        return sprite
+
+    def getSize(self):
+        """
+        :return int: number of cached sprites
+        """
+        return len(self.bodies)+len(self.cones)
+
+
+# shared by all robots
+SPRITES=SpriteCache()
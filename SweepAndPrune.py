@@ -0,0 +1,112 @@
+"""
+SweepAndPrune.py
+
+Broadphase for robot to robot collisions
+
+Each robot's bounding box for the tick (the box round its circle at the
+start and end of the tick, so fast robots can't be missed) is projected
+onto the x axis. The robots are kept in order of the left edge of their box.
+Robots only move a little each tick so the order hardly changes and an
+insertion sort puts it right in about one pass.
+
+Any two robots whose x intervals overlap are neighbours in that order, so
+the pairs are found by looking along the list from each robot till the left
+edges pass its right edge. Pairs whose y intervals don't overlap are
+dropped. The cost goes up with the number of robots plus the number of
+overlapping intervals, not the square of the number of robots.
+
+See Collision.findContacts() for the narrowphase.
+
+"""
+
+import numpy
+from Constants import *
+
+
+class SweepAndPrune():
+    """
+    sap=SweepAndPrune(fleet=fleet)
+    sap.update(x0,y0,x1,y1)     # once per tick
+    a,b=sap.getPairs()
+    """
+    fleet=None          # Fleet, supplies the robot sizes
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.order=[]       # fleet slots sorted by the left edge of their box
+        self.swaps=0        # insertion sort moves in the last update, 0 when nothing overtook
+        self.bounds=None    # minX,maxX,minY,maxY arrays by slot
+
+    def update(self,x0,y0,x1,y1):
+        """
+        work out the boxes and bring the order up to date
+
+        :param numpy.ndarray x0: start of tick positions for every slot
+        :param numpy.ndarray y0:
+        :param numpy.ndarray x1: end of tick positions
+        :param numpy.ndarray y1:
+        """
+        n=len(x0)
+        r=self.fleet.size[:n]
+        minX=numpy.minimum(x0,x1)-r
+        maxX=numpy.maximum(x0,x1)+r
+        minY=numpy.minimum(y0,y1)-r
+        maxY=numpy.maximum(y0,y1)+r
+        self.bounds=(minX,maxX,minY,maxY)
+
+        # robots added since the last update go on the end and get sorted in
+        order=self.order
+        order.extend(range(len(order),n))
+
+        keys=minX.tolist()
+        swaps=0
+        for i in range(1,n):
+            slot=order[i]
+            key=keys[slot]
+            j=i-1
+            while j>=0 and keys[order[j]]>key:
+                order[j+1]=order[j]
+                j-=1
+            if j!=i-1:
+                order[j+1]=slot
+                swaps+=i-1-j
+        self.swaps=swaps
+
+    def getPairs(self):
+        """
+        every pair of robots whose boxes overlap
+
+        :return tuple: arrays a,b of fleet slots, a<b, sorted so the result
+                       doesn't depend on the order the robots were sorted in
+        """
+        empty=numpy.zeros(0,dtype=int)
+        n=len(self.order)
+        if n<2: return empty,empty
+
+        minX,maxX,minY,maxY=self.bounds
+        order=numpy.array(self.order)
+        left=minX[order]
+        right=maxX[order]
+
+        # the robots after i in the order whose left edge is inside i's box
+        end=numpy.searchsorted(left,right,"right")
+        counts=numpy.maximum(end-numpy.arange(n)-1,0)
+        total=counts.sum()
+        if total==0: return empty,empty
+
+        first=numpy.cumsum(counts)-counts
+        i=numpy.repeat(numpy.arange(n),counts)
+        j=i+1+numpy.arange(total)-numpy.repeat(first,counts)
+
+        a=order[i]
+        b=order[j]
+        overlap=(minY[a]<=maxY[b])&(minY[b]<=maxY[a])
+        a=a[overlap]
+        b=b[overlap]
+
+        low=numpy.minimum(a,b)
+        high=numpy.maximum(a,b)
+        keys=numpy.sort(low*n+high)
+        return keys//n,keys%n
@@ -9,31 +9,422 @@
 #
 # PyGame supports 8 mixer channels
 
-from array import array
+from collections import OrderedDict
+import queue
+import heapq
+import itertools
+import wave
 from time import sleep
 import sys
+import math
 import numpy
 import pygame
 import threading
 import time
 from Exceptions import *
+from Constants import *
 
 from pygame.mixer import Sound, get_init, pre_init
 
 
-class Note(Sound):
+def build_samples(frequency,type,sample_rate,size,channels):
+    """
+    one period of the waveform, all samples worked out in one go
+
+    :param float frequency: Hz
+    :param str type: "sine" or "square"
+    :param int sample_rate: from get_init()
+    :param int size: bits per sample, negative for signed, from get_init()
+    :param int channels: from get_init(), stereo gets the same samples in both
+    :return numpy.ndarray: int16 of shape (period,channels)
+    """
+    period = max(int(round(sample_rate / frequency)),1)
+    amplitude = 2 ** (abs(size) - 1) - 1
+    t = numpy.arange(period)
+
+    if type=="sine":
+        samples = amplitude * numpy.sin(2.0 * numpy.pi * frequency * t / sample_rate)
+    else:
+        samples = numpy.where(t < period / 2, amplitude, -amplitude)
+
+    samples = samples.astype(numpy.int16)
+    return numpy.repeat(samples[:,numpy.newaxis],channels,axis=1)
+
+
+class SoundCache():
+    """
+    ready made Sounds, least recently used ones are dropped when the
+    samples held come to more than maxBytes
+
+    sound=SOUNDS.getSound(440,"square",0.1)
+    """
+    maxBytes=SOUNDCACHE_BYTES
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.sounds=OrderedDict()   # (frequency,type,sample rate,volume): (Sound,bytes)
+        self.size=0                 # bytes held
+        self.hits=0
+        self.misses=0
+        self.lock=threading.Lock()  # threaded robot scripts all play notes
+
+    def getSound(self,frequency,type,volume):
+        """
+        :return Sound: or None if the mixer isn't running
+        """
+        mixer=get_init()
+        if mixer is None: return None
+        sample_rate,size,channels=mixer
+
+        key=(frequency,type,sample_rate,volume)
+        with self.lock:
+            entry=self.sounds.get(key)
+            if entry is not None:
+                self.sounds.move_to_end(key)
+                self.hits+=1
+                return entry[0]
+            self.misses+=1
+
+        samples=build_samples(frequency,type,sample_rate,size,channels)
+        sound=Sound(buffer=samples.tobytes())
+        sound.set_volume(volume)
+
+        with self.lock:
+            self.sounds[key]=(sound,samples.nbytes)
+            self.size+=samples.nbytes
+            while self.size>self.maxBytes and len(self.sounds)>1:
+                oldKey,(oldSound,nbytes)=self.sounds.popitem(last=False)
+                self.size-=nbytes
+        return sound
+
+    def clear(self):
+        with self.lock:
+            self.sounds.clear()
+            self.size=0
+
+
+# shared by all notes
+SOUNDS=SoundCache()
+
+
+def build_mix(voices,sample_rate,size,channels,count):
+    """
+    several notes added together, for robots which didn't get a mixer channel
+
+    Frequencies are rounded so each note fits a whole number of cycles into
+    count samples, then the block loops without clicks.
+
+    :param list voices: (frequency,type,volume)
+    :param int count: samples in the block
+    :return numpy.ndarray: int16 of shape (count,channels)
+    """
+    amplitude = 2 ** (abs(size) - 1) - 1
+    t = numpy.arange(count)
+    mix = numpy.zeros(count)
+
+    for frequency,type,volume in voices:
+        cycles = max(int(round(frequency * count / sample_rate)),1)
+        phase = (cycles * t / count) % 1.0
+        if type=="sine":
+            mix += volume * numpy.sin(2.0 * numpy.pi * phase)
+        else:
+            mix += volume * numpy.where(phase < 0.5, 1.0, -1.0)
+
+    samples = numpy.clip(mix * amplitude, -amplitude, amplitude).astype(numpy.int16)
+    return numpy.repeat(samples[:,numpy.newaxis],channels,axis=1)
+
+
+class AudioEngine():
+    """
+    a thread which owns the mixer
+
+    Notes are sent to it as timestamped events so playing a note never waits.
+    Each Note (one per robot) gets a mixer channel of its own while it has
+    one playing. When every channel is busy the note is added to a software
+    mix played on the reserved channel 0.
+
+    AUDIO.play(note,440,500,"square",0.1)
+    AUDIO.stop(note)
+    """
+    numChannels=AUDIO_CHANNELS  # mixer channels to ask for, channel 0 is the software mix
+    mixMs=AUDIO_MIXMS           # length of the looped software mix block
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.events=queue.SimpleQueue()     # (time,sequence,kind,note,args)
+        self.sequence=itertools.count()     # keeps events at the same time in order
+        self.thread=None
+        self.startLock=threading.Lock()
+
+        # only used by the engine thread
+        self.pending=[]         # heap of events not yet due
+        self.channels=[]        # mixer Channels robots can have
+        self.channelOf={}       # note: channel index
+        self.voices={}          # note: (frequency,type,volume,end time) in the software mix
+        self.mixChannel=None
+        self.played=0
+        self.mixed=0            # notes which went into the software mix
+
+    def _post(self,when,kind,note,args=None):
+        if get_init() is None:
+            return      # no mixer when running headless - sound is optional
+
+        if self.thread is None or not self.thread.is_alive():
+            with self.startLock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread=threading.Thread(target=self._run,name="AudioEngine",daemon=True)
+                    self.thread.start()
+
+        self.events.put((when,next(self.sequence),kind,note,args))
+
+    def play(self,note,frequency,duration,type="sine",volume=.1,when=None):
+        """
+        returns immediately
+
+        :param Note note: who is playing, a note replaces the previous one
+        :param float duration: millisecs
+        :param float when: time.time() to start, default now
+        """
+        self._post(time.time() if when is None else when,"play",note,(frequency,duration,type,volume))
+
+    def stop(self,note):
+        self._post(time.time(),"stop",note)
+
+    def stopAll(self):
+        self._post(time.time(),"stopAll",None)
+
+    def time(self):
+        """
+        :return float: the clock notes are timed by
+        """
+        return time.time()
+
+    # the engine thread
+
+    def _run(self):
+        sample_rate,size,channels=get_init()
+        if pygame.mixer.get_num_channels()<self.numChannels:
+            pygame.mixer.set_num_channels(self.numChannels)
+        pygame.mixer.set_reserved(pygame.mixer.get_num_channels())     # find_channel() mustn't take them
+        self.mixChannel=pygame.mixer.Channel(0)
+        self.channels=[pygame.mixer.Channel(i) for i in range(1,pygame.mixer.get_num_channels())]
+
+        while get_init() is not None:
+            # sleep till the next event is due or a software voice ends
+            due=[event[0] for event in self.pending[:1]]+[voice[3] for voice in self.voices.values()]
+            timeout=max(min(due)-time.time(),0) if due else None
+            try:
+                event=self.events.get(timeout=timeout)
+                heapq.heappush(self.pending,event)
+            except queue.Empty:
+                pass
+
+            now=time.time()
+            changed=False
+            while self.pending and self.pending[0][0]<=now:
+                when,sequence,kind,note,args=heapq.heappop(self.pending)
+                changed|=self._apply(kind,note,args,when)
+
+            for note,voice in list(self.voices.items()):
+                if voice[3]<=now:
+                    del self.voices[note]
+                    changed=True
+
+            if changed:
+                self._remix(sample_rate,size,channels)
+
+    def _apply(self,kind,note,args,when):
+        """
+        :return bool: True if the software mix has changed
+        """
+        if kind=="stopAll":
+            for channel in self.channels: channel.stop()
+            self.channelOf={}
+            changed=len(self.voices)>0
+            self.voices={}
+            return changed
+
+        # a robot's new note replaces whatever it was playing
+        changed=self.voices.pop(note,None) is not None
+        channel=self._ownChannel(note)
+        if channel is not None: channel.stop()
+
+        if kind=="stop":
+            return changed
+
+        frequency,duration,type,volume=args
+        self.played+=1
+        if channel is None:
+            channel=self._freeChannel(note)
+        if channel is None:
+            self.mixed+=1
+            self.voices[note]=(frequency,type,volume,when+duration/1000)
+            return True
+
+        channel.play(SOUNDS.getSound(frequency,type,volume),loops=-1,maxtime=int(duration))
+        return changed
+
+    def _ownChannel(self,note):
+        index=self.channelOf.get(note)
+        return None if index is None else self.channels[index]
+
+    def _freeChannel(self,note):
+        """
+        a channel which isn't playing, taken from whoever had it last
+        """
+        for index,channel in enumerate(self.channels):
+            if not channel.get_busy():
+                for other,i in list(self.channelOf.items()):
+                    if i==index: del self.channelOf[other]
+                self.channelOf[note]=index
+                return channel
+        return None
+
+    def _remix(self,sample_rate,size,channels):
+        if len(self.voices)==0:
+            self.mixChannel.stop()
+            return
+        voices=[(frequency,type,volume) for frequency,type,volume,end in self.voices.values()]
+        samples=build_mix(voices,sample_rate,size,channels,int(sample_rate*self.mixMs/1000))
+        self.mixChannel.play(Sound(buffer=samples.tobytes()),loops=-1)
+
+
+# the one and only, started by the first note played
+AUDIO=AudioEngine()
+
+
+class WavRenderer():
+    """
+    a stand in for AUDIO which needs no sound device
+
+    Every note is mixed into a WAV file at the simulated time it was played
+    so a headless run can be listened to afterwards.
+
+    wav=WavRenderer(path="run.wav",clock=sim.clock)
+    sim.audio=wav       # before adding robots, the Simulator calls wav.advance() each step
+    ...
+    wav.close()
+    """
+    path=None
+    clock=None                  # Clock or SimClock, see Clock.py
+    sampleRate=22050
+    chunkSeconds=1              # samples are mixed and written this often
+    amplitude=2**15-1
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.file=wave.open(self.path,"wb")
+        self.file.setnchannels(1)
+        self.file.setsampwidth(2)
+        self.file.setframerate(self.sampleRate)
+
+        self.startTime=self.clock.time()
+        self.written=0          # samples written so far
+        self.voices=[]          # [frequency,type,volume,start,end] not yet fully written
+        self.current={}         # note: its latest voice
+        self.notes=0
+
+    def time(self):
+        return self.clock.time()
+
+    def play(self,note,frequency,duration,type="sine",volume=.1,when=None):
+        if when is None: when=self.clock.time()
+        self.stop(note,when)
+
+        voice=[frequency,type,volume,when-self.startTime,when-self.startTime+duration/1000]
+        self.voices.append(voice)
+        self.current[note]=voice
+        self.notes+=1
+
+    def stop(self,note,when=None):
+        # a robot's new note replaces whatever it was playing
+        if when is None: when=self.clock.time()
+        voice=self.current.pop(note,None)
+        if voice is not None:
+            voice[4]=min(voice[4],max(when-self.startTime,voice[3]))
+
+    def stopAll(self):
+        for note in list(self.current):
+            self.stop(note)
+
+    def advance(self,now):
+        """
+        write every whole chunk up to now
+
+        :param float now: clock time
+        """
+        due=int((now-self.startTime)*self.sampleRate)
+        chunk=int(self.chunkSeconds*self.sampleRate)
+        while due-self.written>=chunk:
+            self.render(self.written+chunk)
+
+    def render(self,end):
+        """
+        mix and write the samples up to sample number end
+        """
+        start=self.written
+        if end<=start: return
+
+        rate=self.sampleRate
+        mix=numpy.zeros(end-start)
+        for frequency,type,volume,t0,t1 in self.voices:
+            i0=max(start,int(math.ceil(t0*rate)))
+            i1=min(end,int(math.ceil(t1*rate)))
+            if i0>=i1: continue
+
+            phase=(frequency*(numpy.arange(i0,i1)/rate-t0))%1.0
+            if type=="sine":
+                mix[i0-start:i1-start]+=volume*numpy.sin(2.0*numpy.pi*phase)
+            else:
+                mix[i0-start:i1-start]+=volume*numpy.where(phase<0.5,1.0,-1.0)
+
+        # finished voices aren't needed again
+        self.voices=[voice for voice in self.voices if voice[4]*rate>end]
+
+        samples=numpy.clip(mix*self.amplitude,-self.amplitude,self.amplitude).astype("<i2")
+        self.file.writeframes(samples.tobytes())
+        self.written=end
+
+    def close(self):
+        """
+        write the rest, including notes still sounding
+        """
+        if self.file is None: return
+
+        end=(self.clock.time()-self.startTime)*self.sampleRate
+        for voice in self.voices:
+            end=max(end,voice[4]*self.sampleRate)
+        self.render(int(math.ceil(end)))
+        self.file.close()
+        self.file=None
+
+
+class Note():
+    """
+    one per robot, plays through AUDIO so nothing here waits for a note to finish
+
+    Note(target=wavRenderer) sends the notes to a WavRenderer instead
+    """
     frequency=10
     duration=1000   # millisec
     sampler=None
     volume=0.1
-    queue=None        # sequence of notes to play one after the other
-    queuePlaying=False
+    queue=None          # sequence of notes to play one after the other
+    busyUntil=0         # target time when the last note sent will have finished
+    target=None         # AUDIO or a WavRenderer
+
+    quiet=threading.Condition()     # notified when a note is stopped
 
-    def __init__(self):
-        #pygame.mixer.Sound.__init__(self, buffer=self.build_square_samples())
-        #super().__init__(self,*args)
+    def __init__(self,target=None):
         self.queue=[]
-        self.queuePlaying=False
+        self.busyUntil=0
+        self.target=AUDIO if target is None else target
         self.volume = 0 # keep quiet till ready
 
     def addToQueue(self,freq,duration):
@@ -48,60 +439,48 @@ class Note(Sound):
         self.queue.append((freq,duration))
 
     def playQueue(self):
-        while self.queuePlaying:
-            pass
-        t=threading.Thread(target=self._playQueue)
-        t.start()
+        """
+        send the queued notes to the audio engine, each timed to start as
+        the one before ends
+        """
+        start=max(self.target.time(),self.busyUntil)
+        for freq,duration in self.queue:
+            self.target.play(self,freq,duration,when=start)
+            start+=duration/1000
+        self.queue=[]
+        self.busyUntil=start
 
-    def _playQueue(self):
-        self.queuePlaying=True
-        while len(self.queue)>0:
-            n,d=self.queue[0]
-            self.queue=self.queue[1:]
-            self.playNote(n,d)
-        self.queuePlaying=False
+    def waitTillQuiet(self):
+        """
+        block (without using the CPU) till the last note sent has finished
 
+        only for AUDIO, simulated time doesn't move while waiting
+        """
+        with Note.quiet:
+            remaining=self.busyUntil-time.time()
+            while remaining>0:
+                Note.quiet.wait(remaining)
+                remaining=self.busyUntil-time.time()
 
     def playNote(self, frequency, duration=1000,type="sine", volume=.1):
+        # no mixer when running headless - sound is optional
+        if self.target is AUDIO and get_init() is None:
+            return
+
         self.volume=volume
         self.frequency = frequency
-        # wait till previous sound has finished??
-        while pygame.mixer.get_busy():
-            pass
-
-        if type=="sine":
-            pygame.mixer.Sound.__init__(self, buffer=self.build_sine_samples())
-        else:
-            pygame.mixer.Sound.__init__(self, buffer=self.build_square_samples())
 
         # duration should be in millisecs
-        # loop until duration has expired otherwise you get a short burst
-        self.play(loops=-1,maxtime=int(duration))
-        self.set_volume(self.volume)
-
-    def build_square_samples(self):
-        period = int(round(get_init()[0] / self.frequency))
-        samples = array("h", [0] * period)
-        amplitude = 2 ** (abs(get_init()[1]) - 1) - 1
-        for time in range(period):
-            if time < period / 2:
-                samples[time] = amplitude
-            else:
-                samples[time] = -amplitude
-        return samples
-
-    def build_sine_samples(self):
-        sample_rate = pygame.mixer.get_init()[0]
-        period = int(round(sample_rate / self.frequency))
-        amplitude = 2 ** (abs(pygame.mixer.get_init()[1]) - 1) - 1
-
-        def frame_value(i):
-            return amplitude * numpy.sin(2.0 * numpy.pi * self.frequency * i / sample_rate)
-
-        return numpy.array([frame_value(x) for x in range(0, period)]).astype(numpy.int16)
+        self.target.play(self,frequency,duration,type,volume)
+        self.busyUntil=self.target.time()+duration/1000
 
     def stop(self):
-        pygame.mixer.Sound.stop()
+        self.target.stop(self)
+
+        # let anyone waiting go ahead
+        with Note.quiet:
+            self.busyUntil=self.target.time()
+            Note.quiet.notify_all()
 
 if __name__ == "__main__":
     pre_init(44100, -16, 1, 1024)
@@ -109,7 +488,9 @@ if __name__ == "__main__":
     pygame.display.set_mode((100,100))
     print("Should be playing a note")
     t0=time.time()
-    N=Note(440,duration=5,type="sine")
+    N=Note()
+    N.playNote(440,duration=5000,type="sine")
+    N.waitTillQuiet()
     t1=time.time()
     print("Note stopped after",t1-t0,"secs")
     sleep(7)
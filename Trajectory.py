@@ -0,0 +1,214 @@
+"""
+Trajectory.py
+
+When a robot moving along a line or an arc first hits a wall
+
+A timed MOVE or ARC is a segment of path (see Fleet.py) whose pose at any
+time is worked out directly from where it started:
+
+    LINEAR  p(t) = p0 + v*t
+    ARC     p(t) = c + R*(cos a,sin a)     a = a0 + w*t
+
+The functions here find the first time along a segment that the robot
+reaches a wall heading into it. The Fleet splits the segment there and
+bounces the robot, so walls are not looked for tick by tick.
+
+    arena edges     the robot's centre comes within WALLMARGIN+size/2 of an edge,
+                    the same rule as Collision.checkWallBump()
+    obstacles       the robot's circle touches a segment of Walls.py, which is
+                    when its centre reaches the capsule of radius size round it
+
+Both return t,nx,ny,edge - seconds from the start of the segment (inf if
+nothing is hit before duration), the normal pointing away from the wall
+and True for an arena edge. A robot already touching a wall and heading
+into it hits it at t=0.
+
+"""
+
+import math
+import numpy
+from Constants import *
+
+NOHIT=(math.inf,0.0,0.0,False)
+
+
+def _edges(size,arena):
+    """
+    :return tuple: left,right,top,bottom - the lines the robot's centre bounces at
+    """
+    w,h=arena
+    nearest=WALLMARGIN+size/2
+    return nearest,w-nearest,nearest,h-nearest
+
+
+def _earliest(t,nx,ny):
+    """
+    :return tuple: t,nx,ny of the first candidate hit, or None
+    """
+    if len(t)==0: return None
+    i=int(numpy.argmin(t))
+    return float(t[i]),float(nx[i]),float(ny[i])
+
+
+def _obstacleHits(walls,segment,t,px,py,vx,vy,radius):
+    """
+    the candidate hits which are real, where the robot is on the edge of
+    a segment's capsule (or inside it at t=0) and heading into it
+
+    :param numpy.ndarray segment: the obstacle segment of each candidate
+    :param numpy.ndarray t: candidate times, nan for no solution
+    :param numpy.ndarray px: robot position at each t
+    :param numpy.ndarray vx: direction of travel at each t, any length
+    :return tuple: t,nx,ny of the first real hit, or None
+    """
+    qx,qy,d=walls._closest(px,py,segment)
+    with numpy.errstate(divide="ignore",invalid="ignore"):
+        nx=(px-qx)/d
+        ny=(py-qy)/d
+        # candidates on an offset line past the end of a segment are further away,
+        # ones on an end circle beside the segment are inside
+        real=(t>=0)&((numpy.abs(d-radius)<=radius*1e-6)|((t==0)&(d<=radius)))&(nx*vx+ny*vy<0)
+    return _earliest(t[real],nx[real],ny[real])
+
+
+def lineHit(x,y,vx,vy,size,arena,walls,duration):
+    """
+    first wall hit moving from x,y at vx,vy pixels a second
+
+    :param float size: robot radius
+    :param tuple arena: width,height
+    :param Walls walls: or None for just the arena edges
+    :param float duration: seconds the segment lasts
+    :return tuple: t,nx,ny,edge
+    """
+    best=NOHIT
+    left,right,top,bottom=_edges(size,arena)
+
+    # arena edges, a robot already past one is bounced straight away
+    for p,v,lo,hi,axis in ((x,vx,left,right,0),(y,vy,top,bottom,1)):
+        if v==0: continue
+        t,normal=(max((lo-p)/v,0.0),1.0) if v<0 else (max((hi-p)/v,0.0),-1.0)
+        if t<best[0]:
+            best=(t,normal,0.0,True) if axis==0 else (t,0.0,normal,True)
+
+    if walls is not None and walls.getCount()>0 and (vx or vy):
+        hit=_lineObstacles(walls,x,y,vx,vy,size)
+        if hit is not None and hit[0]<best[0]:
+            best=hit+(False,)
+
+    return best if best[0]<=duration else NOHIT
+
+
+def _lineObstacles(walls,x,y,vx,vy,radius):
+    segment=numpy.flatnonzero(walls.obstacle)
+    x0=walls.x0[segment]
+    y0=walls.y0[segment]
+    length=numpy.sqrt(walls.lengthSq[segment])
+    nx=-walls.dy[segment]/length
+    ny=walls.dx[segment]/length
+    speedSq=vx*vx+vy*vy
+
+    with numpy.errstate(divide="ignore",invalid="ignore"):
+        # the line radius away on the robot's side of each segment
+        d=(x-x0)*nx+(y-y0)*ny
+        times=[(d-numpy.sign(d)*radius)/-(vx*nx+vy*ny)]
+
+        # the circles of radius round each end, the first of the two roots
+        for ex,ey in ((x0,y0),(walls.x1[segment],walls.y1[segment])):
+            fx=x-ex
+            fy=y-ey
+            b=fx*vx+fy*vy
+            times.append((-b-numpy.sqrt(b*b-speedSq*(fx*fx+fy*fy-radius*radius)))/speedSq)
+
+    # touching already
+    qx,qy,dist=walls._closest(x,y,segment)
+    times.append(numpy.where(dist<=radius,0.0,numpy.nan))
+
+    t=numpy.concatenate(times)
+    t[~numpy.isfinite(t)]=numpy.nan
+    s=numpy.nan_to_num(t)
+    return _obstacleHits(walls,numpy.tile(segment,4),t,x+vx*s,y+vy*s,vx,vy,radius)
+
+
+def _angleTimes(A,B,C,a0,w):
+    """
+    times when A*cos(a)+B*sin(a)=C, where a=a0+w*t, within one turn from t=0
+
+    :return numpy.ndarray: the two solutions for each equation, nan where there are none
+    """
+    with numpy.errstate(divide="ignore",invalid="ignore"):
+        spread=numpy.arccos(C/numpy.hypot(A,B))
+    phi=numpy.arctan2(B,A)
+    angles=numpy.concatenate((phi+spread,phi-spread))
+    # how far round from a0 in the direction of turn
+    return ((angles-a0)*math.copysign(1,w))%(2*math.pi)/abs(w)
+
+
+def arcHit(cx,cy,radius,a0,w,size,arena,walls,duration):
+    """
+    first wall hit going round cx,cy from angle a0 at w radians a second
+
+    :param float radius: of the path, positive
+    :return tuple: t,nx,ny,edge
+    """
+    if w==0 or radius==0: return NOHIT
+    best=NOHIT
+    left,right,top,bottom=_edges(size,arena)
+    x=cx+radius*math.cos(a0)
+    y=cy+radius*math.sin(a0)
+    vx=-w*math.sin(a0)
+    vy=w*math.cos(a0)
+
+    # already past an edge and heading further out
+    if (x<=left and vx<0) or (x>=right and vx>0):
+        return (0.0,math.copysign(1.0,-vx),0.0,True)
+    if (y<=top and vy<0) or (y>=bottom and vy>0):
+        return (0.0,0.0,math.copysign(1.0,-vy),True)
+
+    # crossing the edge lines, cx+R*cos(a)=left etc.
+    normalX=numpy.array([1.0,-1.0,0.0,0.0]*2)
+    normalY=numpy.array([0.0,0.0,1.0,-1.0]*2)
+    t=_angleTimes(numpy.array([radius,radius,0,0]),numpy.array([0,0,radius,radius]),
+                  numpy.array([left-cx,right-cx,top-cy,bottom-cy]),a0,w)
+    a=a0+w*numpy.nan_to_num(t)
+    into=(normalY*numpy.cos(a)-normalX*numpy.sin(a))*w<0
+    into&=~numpy.isnan(t)
+    hit=_earliest(t[into],normalX[into],normalY[into])
+    if hit is not None:
+        best=hit+(True,)
+
+    if walls is not None and walls.getCount()>0:
+        hit=_arcObstacles(walls,cx,cy,radius,a0,w,size)
+        if hit is not None and hit[0]<best[0]:
+            best=hit+(False,)
+
+    return best if best[0]<=duration else NOHIT
+
+
+def _arcObstacles(walls,cx,cy,radius,a0,w,size):
+    segment=numpy.flatnonzero(walls.obstacle)
+    x0=walls.x0[segment]
+    y0=walls.y0[segment]
+    length=numpy.sqrt(walls.lengthSq[segment])
+    nx=-walls.dy[segment]/length
+    ny=walls.dx[segment]/length
+
+    # the lines size either side, (c-p0).n + R*(cos a,sin a).n = +-size
+    d=(cx-x0)*nx+(cy-y0)*ny
+    times=[_angleTimes(radius*nx,radius*ny,side*size-d,a0,w) for side in (1,-1)]
+
+    # the circles round each end, (c-e).(cos a,sin a) = (size^2-|c-e|^2-R^2)/2R
+    for ex,ey in ((x0,y0),(walls.x1[segment],walls.y1[segment])):
+        fx=cx-ex
+        fy=cy-ey
+        times.append(_angleTimes(fx,fy,(size*size-fx*fx-fy*fy-radius*radius)/(2*radius),a0,w))
+
+    # touching already
+    qx,qy,dist=walls._closest(cx+radius*math.cos(a0),cy+radius*math.sin(a0),segment)
+    times.append(numpy.where(dist<=size,0.0,numpy.nan))
+
+    t=numpy.concatenate(times)
+    a=a0+w*numpy.nan_to_num(t)
+    cos=numpy.cos(a)
+    sin=numpy.sin(a)
+    return _obstacleHits(walls,numpy.tile(segment,9),t,cx+radius*cos,cy+radius*sin,-w*sin,w*cos,size)
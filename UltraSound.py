@@ -7,17 +7,19 @@ Ultrasonic sensor simulator for PixelBot simulator
 
 import pygame,sys
 from pygame.locals import *
-from smartquadtree import Quadtree
 import random
 import math
+import numpy
 from Robot import *
+from SpriteCache import *
+from Log import *
 
 class DistSensor():
     """
-    sensor operation uses a Quadtree (see smartquadtree) with masking to create a list
+    sensor operation uses a SpatialGrid sector query to create a list
     of bots within the sensor range (if any).
 
-    This requires that bots are added to the quadtree by the controller.
+    This requires that bots are added to the grid by the controller.
 
     When another bot enters the sensor area a (red) line is drawn from this bot to that bot.
 
@@ -40,13 +42,14 @@ class DistSensor():
     drawLines=True          # draw lines joining bots within the sensor range
     lineColor=INRANGECOLOR      # red lines connect robots in range
     nearestColor=NEARESTCOLOR   # blue line conencts to nearest
+    lineWidth=5
 
     def __init__(self,**kwargs): #botList,canvas,thisBot,drawLine=True,lineColor=0xFF0000):
         """
         initialise the ultrasonic sensor.
 
-        :param Quadtree botList: the list of active robots (pointers)
-        :param Quadtree thisBot: pointer
+        :param SpatialGrid botList: the list of active robots (pointers)
+        :param PixelBot thisBot: pointer
         :param surface canvas: pygame surface to draw on if drawLine=True
         :param int lineColor: hex color for line (0xRRGGBB)
         """
@@ -65,10 +68,11 @@ class DistSensor():
     def draw(self,canvas,thisBot):
         """
         Draw the region of interest in front of the bot.
+
+        The cone is pre-rendered, see SpriteCache.py
         :return None:
         """
-        lines=self.getROI(thisBot)
-        pygame.draw.polygon(canvas,self.roiColor,lines,0)
+        SPRITES.getCone(self,thisBot.getDirection()).blit(canvas,thisBot.getPos())
 
 
     def getROI(self,thisBot):
@@ -77,19 +81,23 @@ class DistSensor():
 
         calculate the poly coords for the space covered by the ultrasonic sensor
 
-        This is used to draw the sensor's region of interest (a cone) and to provide
-        a mask which excludes bots outside that cone
+        This is used to draw the sensor's region of interest (a cone)
 
         ROI is a list of XY tuples
 
         :return list: e.g. [(x0,y0),...(xn,yn)]
         """
 
+        return self.getCone(thisBot.getPos(),thisBot.getDirection())
+
+    def getCone(self,pos,direction):
+        """
+        ROI for a bot at pos heading in direction (radians)
+
+        :return list: e.g. [(x0,y0),...(xn,yn)]
+        """
         # start point
-        # add 1 to current X&Y to try to exclude self from
-        # list which Quadtree produces using this roi as a mask
-        bot_x=thisBot.get_x()+1
-        bot_y=thisBot.get_y()+1
+        bot_x,bot_y=pos
         roi=[(int(bot_x),int(bot_y))]
 
         # number of steps to give a reasonably smooth search light arc
@@ -99,7 +107,7 @@ class DistSensor():
         for curvePoint in range(self.arcSteps+1):        # gives 0 to arcSteps
             curvePoint=curvePoint-(self.arcSteps/2)      # make it go - to +
 
-            angle=thisBot.getDirection()+curvePoint*angleStep
+            angle=direction+curvePoint*angleStep
 
             x = int(bot_x + self.range * math.cos(angle))
             y = int(bot_y + self.range * math.sin(angle))
@@ -132,27 +140,27 @@ class DistSensor():
     def getNearestBot(self,canvas,me,activeBots):
         """
 
-        Applies the ROI to the list of activeBots
+        Asks activeBots for the bots inside the sensor cone
         then finds the nearest distance
 
         :param pygame.Surface canvas: Used to draw connecting lines. None is no lines to draw.
         :param Robot element me: this bot
-        :param Quadtree activeBots: list of active bots
+        :param SpatialGrid activeBots: list of active bots
         :return Robot: nearest bot or None
         """
 
         if activeBots is None:
-            print("UltraSound.getNearestBot() activeBots is None")
+            LOG.error("sensor","UltraSound.getNearestBot() activeBots is None",robot=me.getName())
             return
 
         nearest=None    # distance to a bot
         bot=None        # the bot
 
         # only select those in the ROI of the sensor
-        activeBots.set_mask( self.getROI(me))
+        inRange=activeBots.querySector(me.get_x(),me.get_y(),me.getDirection(),self.spread,self.range,exclude=me)
 
         # look for nearest
-        for n in activeBots.elements():
+        for n in inRange:
             # calculate the distance
             dist=self.getDistance(me,n)
             if nearest is None:
@@ -162,15 +170,209 @@ class DistSensor():
                 nearest=dist
                 bot=n
 
-            # draw a red line connecting me and the 'inrange' bots as they move
-            if canvas is not None and self.drawLines and n.getName()!=me.getName():
-                pygame.draw.line(canvas, self.lineColor,(me.get_x(),me.get_y()),(n.get_x(),n.get_y()),5)
+        if canvas is not None:
+            self.drawLinks(canvas,me.getPos(),[n.getPos() for n in inRange],None if bot is None else bot.getPos())
+
+        return bot
+
+    def drawLinks(self,canvas,pos,inRange,nearest):
+        """
+        draw a red line connecting me and the 'inrange' bots as they move
+        and a blue line to the nearest
+
+        :param pygame.Surface canvas: to draw on
+        :param tuple pos: my position
+        :param list inRange: positions of the bots in the sensor cone
+        :param tuple nearest: position of the nearest bot or None
+        """
+        if not self.drawLines: return
+
+        for n in inRange:
+            pygame.draw.line(canvas, self.lineColor,pos,n,self.lineWidth)
+
+        if nearest is not None:
+            pygame.draw.line(canvas, self.nearestColor, pos, nearest, self.lineWidth)
+
+    def getLinksRect(self,pos,inRange,nearest):
+        """
+        area drawLinks() would draw on
+
+        :return pygame.Rect: or None if there are no lines
+        """
+        points=list(inRange)
+        if nearest is not None: points.append(nearest)
+        if not self.drawLines or len(points)==0: return None
+
+        xs=[p[0] for p in points]+[pos[0]]
+        ys=[p[1] for p in points]+[pos[1]]
+        rect=pygame.Rect(min(xs),min(ys),max(xs)-min(xs)+1,max(ys)-min(ys)+1)
+        return rect.inflate(2*self.lineWidth,2*self.lineWidth)
+
+
+def scanSectors(grid,spread=DistSensor.spread,maxRange=DistSensor.range):
+    """
+    batch version of DistSensor.getNearestBot() for every robot at once
+
+    Candidate pairs come from the grid's neighbouring cells. A bot is in range
+    if it is no further than maxRange away and the angle between my heading
+    and the line to him is no more than spread/2. That is tested with a dot
+    product so no angles are calculated.
+
+    :param SpatialGrid grid: all active robots
+    :param float spread: degrees, total width of the sonar cone
+    :param float maxRange: length of the cone, no bigger than grid.cellSize
+    :return tuple: nearest,distance,me,him
+        nearest[slot]   fleet slot of the nearest bot in the cone or -1
+        distance[slot]  distance to it or OUTOFRANGE
+        me,him          slots of every pair where him is in my cone
+    """
+    assert maxRange<=grid.cellSize,"The sonar range must not be more than the grid cell size"
+
+    fleet=grid.fleet
+    n=fleet.count
+    nearest=numpy.full(n,-1,dtype=int)
+    distance=numpy.full(n,float(OUTOFRANGE))
+
+    me,him=grid.candidatePairs()
+    if len(me)==0: return nearest,distance,me,him
 
-        # remove the mask
-        activeBots.set_mask(None)
+    dx=fleet.x[him]-fleet.x[me]
+    dy=fleet.y[him]-fleet.y[me]
+    dist=numpy.sqrt(dx*dx+dy*dy)
+    heading=fleet.heading[me]
+    along=dx*numpy.cos(heading)+dy*numpy.sin(heading)
 
-        # draw a blue line to nearest
-        if canvas is not None and self.drawLines and bot is not None:
-            pygame.draw.line(canvas, self.nearestColor, (me.get_x(), me.get_y()), (bot.get_x(), bot.get_y()), 5)
+    inCone=(dist>0)&(dist<=maxRange)&(along>=dist*math.cos(math.radians(spread)/2))
+    me=me[inCone]
+    him=him[inCone]
+    dist=dist[inCone]
+
+    # sort by me then distance, the first entry for each of me is the nearest
+    order=numpy.lexsort((dist,me))
+    me=me[order]
+    him=him[order]
+    dist=dist[order]
+    first=numpy.ones(len(me),dtype=bool)
+    first[1:]=me[1:]!=me[:-1]
+    nearest[me[first]]=him[first]
+    distance[me[first]]=dist[first]
+
+    return nearest,distance,me,him
+
+
+class SensorSnapshot():
+    """
+    sonar results for every robot, worked out once per simulator tick
+
+    The Simulator calls update() after the robots have moved. Drawing,
+    collision checks and @distance then read the results instead of each
+    doing their own query, so polling @distance in a tight loop costs nothing.
+
+    sensors=SensorSnapshot(grid=simulator.robots,walls=simulator.walls)
+    sensors.update(tick)
+    bot=sensors.getNearestBot(me)
+    """
+    grid=None           # SpatialGrid of all active robots
+    walls=None          # Walls, the sonar sees these too
 
-        return bot
\ No newline at end of file
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        self.scan=(-1,None,None)    # tick,results,wallDistance - see publish()
+        self.inRange=None           # scan,{slot: list of bots} built when first needed
+
+    @property
+    def tick(self):
+        """
+        simulator tick the results are for
+        """
+        return self.scan[0]
+
+    @property
+    def results(self):
+        """
+        nearest,distance,me,him from scanSectors()
+        """
+        return self.scan[1]
+
+    @property
+    def wallDistance(self):
+        """
+        distance to the nearest wall in each sonar cone, None without walls
+        """
+        return self.scan[2]
+
+    def update(self,tick):
+        """
+        scan every robot's sonar
+
+        :param int tick: simulator tick number
+        """
+        wallDistance=None
+        if self.walls is not None:
+            fleet=self.grid.fleet
+            n=fleet.count
+            wallDistance=self.walls.castSectors(fleet.x[:n],fleet.y[:n],fleet.heading[:n],
+                                                DistSensor.spread,DistSensor.range)
+        self.publish(tick,scanSectors(self.grid),wallDistance)
+
+    def publish(self,tick,results,wallDistance):
+        """
+        replace the results in one assignment so script threads never see
+        half an update. Readers take self.scan once and use that.
+        """
+        self.scan=(tick,results,wallDistance)
+
+    def hasResult(self,bot):
+        """
+        :return bool: False before the first scan or for robots added since
+        """
+        results=self.scan[1]
+        return results is not None and bot.slot<len(results[0])
+
+    def getNearestBot(self,bot):
+        """
+        :param PixelBot bot:
+        :return PixelBot: nearest bot in the sonar cone or None
+        """
+        slot=self.scan[1][0][bot.slot]
+        if slot<0: return None
+        return self.grid.fleet.robots[slot]
+
+    def getDistance(self,bot):
+        """
+        :return float: distance to the nearest bot or wall in the sonar cone or OUTOFRANGE
+        """
+        tick,results,wallDistance=self.scan
+        distance=float(results[1][bot.slot])
+        if wallDistance is not None and bot.slot<len(wallDistance):
+            distance=min(distance,float(wallDistance[bot.slot]))
+        return distance
+
+    def getWallDistance(self,bot):
+        """
+        :return float: distance to the nearest wall in the sonar cone or OUTOFRANGE
+        """
+        wallDistance=self.wallDistance
+        if wallDistance is None or bot.slot>=len(wallDistance): return float(OUTOFRANGE)
+        return float(wallDistance[bot.slot])
+
+    def getInRange(self,bot):
+        """
+        :return list: bots in the sonar cone
+        """
+        scan=self.scan
+        cached=self.inRange
+        if cached is not None and cached[0] is scan:
+            inRange=cached[1]
+        else:
+            # grouped on first use, only drawing needs it
+            nearest,distance,me,him=scan[1]
+            robots=self.grid.fleet.robots
+            inRange={}
+            for a,b in zip(me.tolist(),him.tolist()):
+                inRange.setdefault(a,[]).append(robots[b])
+            self.inRange=(scan,inRange)
+
+        return inRange.get(bot.slot,[])
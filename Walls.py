@@ -0,0 +1,351 @@
+"""
+Walls.py
+
+Fixed walls and obstacles in the arena
+
+An arena file is json:
+
+    {
+        "size":      [800,800],                     optional, arena width and height
+        "walls":     [[x0,y0,x1,y1],...],           single wall segments
+        "obstacles": [[[x,y],[x,y],[x,y]],...]      closed polygons, e.g. boxes
+    }
+
+walls=Walls.load("maze.json",arena=(800,800))
+
+The edges of the arena are always walls as well, the sonar sees them but
+the Fleet keeps robots WALLMARGIN away from them as it always has.
+
+Every segment is filed once, when the walls are loaded, in the cells of a
+uniform grid it passes within cellSize of. So everything within cellSize of
+a point is found by looking in the one cell the point is in. The sonar and
+wall bump queries for all the robots are then done together with numpy.
+Moving robots find the walls they will hit in Trajectory.py instead.
+
+    castSectors()   distance to the nearest wall in each robot's sonar cone
+    findBumps()     robots touching a wall and heading into it, see Collision.checkWallBump()
+    castRays()      distance along a few rays, any length
+
+"""
+
+import math
+import json
+import numpy
+import pygame
+from Constants import *
+
+
+def _cross(ax,ay,bx,by):
+    return ax*by-ay*bx
+
+
+def _firstOf(me,key):
+    """
+    :return numpy.ndarray: index of the entry with the smallest key for each robot in me
+    """
+    order=numpy.lexsort((key,me))
+    first=numpy.ones(len(order),dtype=bool)
+    first[1:]=me[order][1:]!=me[order][:-1]
+    return order[first]
+
+
+class Walls():
+    """
+    walls=Walls(arena=(800,800),segments=[(x0,y0,x1,y1),...],polygons=[[(x,y),...],...])
+    distance=walls.castSectors(x,y,heading,spread,maxRange)
+    """
+    arena=(0,0)             # width and height
+    segments=()             # (x0,y0,x1,y1) single walls
+    polygons=()             # lists of (x,y) corners, obstacles
+    cellSize=GRIDCELLSIZE   # also the furthest castSectors() and findBumps() can look
+
+    @classmethod
+    def load(cls,path,arena=ARENA):
+        """
+        :param str path: arena file, see the module docstring
+        :param tuple arena: size used if the file doesn't give one
+        :return Walls:
+        """
+        with open(path) as f:
+            spec=json.load(f)
+
+        return cls(arena=tuple(spec.get("size",arena)),
+                   segments=[tuple(s) for s in spec.get("walls",[])],
+                   polygons=[[tuple(p) for p in poly] for poly in spec.get("obstacles",[])])
+
+    def __init__(self,**kwargs):
+        for k,v in kwargs.items():
+            setattr(self,k,v)
+
+        w,h=self.arena
+        edges=[(0,0,w,0),(w,0,w,h),(w,h,0,h),(0,h,0,0)]
+        sides=[]
+        for poly in self.polygons:
+            for i in range(len(poly)):
+                (ax,ay),(bx,by)=poly[i],poly[(i+1)%len(poly)]
+                sides.append((ax,ay,bx,by))
+
+        everything=numpy.array(edges+list(self.segments)+sides,dtype=float).reshape(-1,4)
+        self.x0,self.y0,self.x1,self.y1=everything.T.copy()
+        self.dx=self.x1-self.x0
+        self.dy=self.y1-self.y0
+        self.lengthSq=numpy.maximum(self.dx*self.dx+self.dy*self.dy,1e-12)
+
+        count=len(everything)
+        self.obstacle=numpy.ones(count,dtype=bool)     # robots bump into these, not the edges
+        self.obstacle[:len(edges)]=False
+        self.side=numpy.zeros(count,dtype=bool)        # polygon sides, for isClear()
+        self.side[len(edges)+len(self.segments):]=True
+        self.obstacles=count-len(edges)
+
+        self._buildIndex()
+
+    def getCount(self):
+        """
+        :return int: number of obstacle segments, not counting the arena edges
+        """
+        return self.obstacles
+
+    def _buildIndex(self):
+        """
+        file each segment in every cell it passes within cellSize of, so
+        anything within cellSize of a point is in the point's own cell
+        """
+        w,h=self.arena
+        size=self.cellSize
+        self.columns=int(math.ceil(w/size))+1
+        self.rows=int(math.ceil(h/size))+1
+
+        cells=[[] for i in range(self.columns*self.rows)]
+        for s in range(len(self.x0)):
+            c0=max(int((min(self.x0[s],self.x1[s])-size)//size),0)
+            c1=min(int((max(self.x0[s],self.x1[s])+size)//size),self.columns-1)
+            r0=max(int((min(self.y0[s],self.y1[s])-size)//size),0)
+            r1=min(int((max(self.y0[s],self.y1[s])+size)//size),self.rows-1)
+
+            columns,rows=numpy.meshgrid(numpy.arange(c0,c1+1),numpy.arange(r0,r1+1))
+            columns=columns.ravel()
+            rows=rows.ravel()
+            for cell in (rows*self.columns+columns)[self._cellDistance(s,columns,rows)<=size].tolist():
+                cells[cell].append(s)
+
+        # one row per cell padded with -1, so a query is a single lookup
+        width=max(len(c) for c in cells)
+        self.table=numpy.full((len(cells),width),-1,dtype=int)
+        for cell,segments in enumerate(cells):
+            self.table[cell,:len(segments)]=segments
+
+    def _cellDistance(self,s,columns,rows):
+        """
+        the nearest two convex shapes get is at a corner of one of them, so
+        it is the least of the cell corners to the segment and the segment
+        ends to the cell. A segment crossing a cell passes within half a
+        diagonal of a corner, which is less than cellSize anyway.
+
+        :return numpy.ndarray: distance from segment s to each cell
+        """
+        size=self.cellSize
+        left=columns*size
+        top=rows*size
+
+        distance=numpy.full(len(columns),numpy.inf)
+        for cx in (left,left+size):
+            for cy in (top,top+size):
+                distance=numpy.minimum(distance,self._closest(cx,cy,s)[2])
+
+        for ex,ey in ((self.x0[s],self.y0[s]),(self.x1[s],self.y1[s])):
+            dx=numpy.maximum(numpy.maximum(left-ex,ex-left-size),0)
+            dy=numpy.maximum(numpy.maximum(top-ey,ey-top-size),0)
+            distance=numpy.minimum(distance,numpy.hypot(dx,dy))
+        return distance
+
+    def candidates(self,x,y):
+        """
+        every segment which could be within cellSize of each point
+
+        :param numpy.ndarray x: points
+        :param numpy.ndarray y:
+        :return tuple: arrays point,segment - one entry per pair
+        """
+        # numpy.minimum and maximum cost less than numpy.clip on small arrays
+        columns=numpy.minimum(numpy.maximum((x//self.cellSize).astype(int),0),self.columns-1)
+        rows=numpy.minimum(numpy.maximum((y//self.cellSize).astype(int),0),self.rows-1)
+
+        segments=self.table[rows*self.columns+columns]
+        point,column=numpy.nonzero(segments>=0)
+        return point,segments[point,column]
+
+    def _closest(self,x,y,segment):
+        """
+        :return tuple: closest point on each segment to each x,y and the distance to it
+        """
+        u=((x-self.x0[segment])*self.dx[segment]+(y-self.y0[segment])*self.dy[segment])/self.lengthSq[segment]
+        u=numpy.minimum(numpy.maximum(u,0),1)
+        qx=self.x0[segment]+u*self.dx[segment]
+        qy=self.y0[segment]+u*self.dy[segment]
+        return qx,qy,numpy.hypot(x-qx,y-qy)
+
+    def _rayHits(self,ox,oy,cos,sin,segment):
+        """
+        :return numpy.ndarray: distance along each ray to its segment, inf if it misses
+        """
+        px=self.x0[segment]-ox
+        py=self.y0[segment]-oy
+        ex=self.dx[segment]
+        ey=self.dy[segment]
+        denom=_cross(cos,sin,ex,ey)
+        parallel=denom==0
+        denom=numpy.where(parallel,1,denom)    # cheaper than numpy.errstate
+        t=_cross(px,py,ex,ey)/denom
+        u=_cross(px,py,cos,sin)/denom
+        hit=~parallel&(t>=0)&(u>=0)&(u<=1)
+        return numpy.where(hit,t,numpy.inf)
+
+    # queries for every robot at once
+
+    def castSectors(self,x,y,heading,spread,maxRange):
+        """
+        sonar, the distance to the nearest point of any wall inside each cone
+
+        Along the part of a segment inside a cone the nearest point is an end
+        of the segment, where it crosses an edge of the cone or the foot of
+        the perpendicular from the robot, so only those are looked at.
+
+        :param numpy.ndarray x: robot positions
+        :param numpy.ndarray y:
+        :param numpy.ndarray heading: radians, clockwise from East
+        :param float spread: degrees, total width of the cones
+        :param float maxRange: length of the cones, no bigger than cellSize
+        :return numpy.ndarray: distance for each robot or OUTOFRANGE
+        """
+        assert maxRange<=self.cellSize,"The sonar range must not be more than the walls cell size"
+
+        distance=numpy.full(len(x),float(OUTOFRANGE))
+        me,segment=self.candidates(x,y)
+
+        # nothing in a cone is nearer than the nearest point of the segment
+        qx,qy,foot=self._closest(x[me],y[me],segment)
+        near=numpy.flatnonzero(foot<=maxRange)
+        if len(near)==0: return distance
+
+        me=me[near]
+        segment=segment[near]
+        ox=x[me]
+        oy=y[me]
+        h=heading[me]
+        half=math.radians(spread)/2
+
+        # the foot and both ends, a row each, if they are in the cone
+        dx=numpy.array((qx[near],self.x0[segment],self.x1[segment]))-ox
+        dy=numpy.array((qy[near],self.y0[segment],self.y1[segment]))-oy
+        d=numpy.hypot(dx,dy)
+        inCone=dx*numpy.cos(h)+dy*numpy.sin(h)>=d*math.cos(half)-1e-9
+        best=numpy.where(inCone,d,numpy.inf).min(axis=0)
+
+        # where the edges of the cone cross the segment, a row for each edge
+        edges=numpy.array((h-half,h+half))
+        best=numpy.minimum(best,self._rayHits(ox,oy,numpy.cos(edges),numpy.sin(edges),segment).min(axis=0))
+
+        best[best>maxRange]=OUTOFRANGE
+        numpy.minimum.at(distance,me,best)
+        return distance
+
+    def castRays(self,x,y,angle,maxRange=OUTOFRANGE):
+        """
+        distance along rays to the first wall they hit, every segment is
+        tried so it is meant for a few rays of any length
+
+        :param numpy.ndarray x: ray starts
+        :param numpy.ndarray y:
+        :param numpy.ndarray angle: radians, clockwise from East
+        :return numpy.ndarray: distance for each ray or OUTOFRANGE
+        """
+        x=numpy.asarray(x,dtype=float)[:,None]
+        y=numpy.asarray(y,dtype=float)[:,None]
+        angle=numpy.asarray(angle,dtype=float)[:,None]
+        segment=numpy.arange(len(self.x0))[None,:]
+
+        distance=self._rayHits(x,y,numpy.cos(angle),numpy.sin(angle),segment).min(axis=1)
+        distance[distance>maxRange]=OUTOFRANGE
+        return distance
+
+    def findBumps(self,x,y,radius,heading):
+        """
+        vectorised Collision.checkWallBump() for the obstacles
+
+        :param numpy.ndarray x: robot positions
+        :param numpy.ndarray y:
+        :param numpy.ndarray radius: robot radius, no bigger than cellSize
+        :param numpy.ndarray heading: radians
+        :return tuple: bump,nx,ny - True where the robot touches an obstacle and is
+                       heading into it, the normal points away from the nearest one touched
+        """
+        n=len(x)
+        bump=numpy.zeros(n,dtype=bool)
+        nx=numpy.zeros(n)
+        ny=numpy.zeros(n)
+
+        me,segment,qx,qy,dist=self._touching(x,y,radius)
+        if len(me)==0: return bump,nx,ny
+
+        with numpy.errstate(divide="ignore",invalid="ignore"):
+            ux=numpy.where(dist>0,(x[me]-qx)/dist,0)
+            uy=numpy.where(dist>0,(y[me]-qy)/dist,0)
+        into=numpy.flatnonzero(numpy.cos(heading[me])*ux+numpy.sin(heading[me])*uy<0)
+        if len(into)==0: return bump,nx,ny
+
+        # the nearest segment for each robot
+        nearest=into[_firstOf(me[into],dist[into])]
+        bump[me[nearest]]=True
+        nx[me[nearest]]=ux[nearest]
+        ny[me[nearest]]=uy[nearest]
+        return bump,nx,ny
+
+    def _touching(self,x,y,radius):
+        """
+        :return tuple: me,segment,qx,qy,dist for obstacle segments within radius of a robot
+        """
+        if self.obstacles==0:
+            empty=numpy.zeros(0,dtype=int)
+            return empty,empty,x[:0],y[:0],x[:0]
+
+        me,segment=self.candidates(x,y)
+        keep=self.obstacle[segment]
+        me=me[keep]
+        segment=segment[keep]
+        qx,qy,dist=self._closest(x[me],y[me],segment)
+        near=dist<=radius[me]
+        return me[near],segment[near],qx[near],qy[near],dist[near]
+
+    def isClear(self,x,y,radius):
+        """
+        is there room for a robot here, clear of every obstacle and not inside one
+
+        :param float x:
+        :param float y:
+        :param float radius:
+        :return bool:
+        """
+        if self.obstacles==0: return True
+        obstacle=numpy.flatnonzero(self.obstacle)
+        if (self._closest(x,y,obstacle)[2]<=radius).any(): return False
+
+        # inside a polygon if a ray to the right crosses its sides an odd number of times
+        side=numpy.flatnonzero(self.side)
+        y0=self.y0[side]
+        y1=self.y1[side]
+        straddles=(y0>y)!=(y1>y)
+        with numpy.errstate(divide="ignore",invalid="ignore"):
+            crossX=self.x0[side]+(y-y0)*self.dx[side]/self.dy[side]
+        return int((straddles&(crossX>x)).sum())%2==0
+
+    def draw(self,surface,color=WALLCOLOR,width=WALLWIDTH):
+        """
+        draw the walls and obstacles, the arena edges are left to the border of the window
+
+        :param pygame.Surface surface:
+        """
+        for poly in self.polygons:
+            pygame.draw.polygon(surface,color,poly)
+        for x0,y0,x1,y1 in self.segments:
+            pygame.draw.line(surface,color,(x0,y0),(x1,y1),width)
@@ -6,6 +6,8 @@ A wheel - the robot has two
 import time
 import math
 from Constants import *
+from Clock import *
+from Log import *
 
 class Wheel():
     """
@@ -21,6 +23,7 @@ class Wheel():
     totalDistMoved=0    # since last start
 
     moving=False
+    clock=WALLCLOCK     # see Clock.py
 
     def __init__(self,**kwargs):
         for key in kwargs:
@@ -38,27 +41,27 @@ class Wheel():
         timeElapsed=0
 
         if rps>WHEEL_MAXRPS:
-            print("Wheel.setRPS() rps requested=%.3f but max RPS is %.3f"%(rps,WHEEL_MAXRPS))
+            LOG.warning("motion","Wheel.setRPS() rps requested=%.3f but max RPS is %.3f"%(rps,WHEEL_MAXRPS))
 
         rps=min(rps,WHEEL_MAXRPS)
 
         if rps!=0:
             if not self.moving:
-                self.startTime=time.time()
+                self.startTime=self.clock.time()
                 self.distMoved=0
                 self.totalDistMoved=0
                 self.moving=True
             else:
                 # change of speed?
                 # accumulate distance travelled since startTime
-                now=time.time()
+                now=self.clock.time()
                 timeElapsed=now-self.startTime
                 self.distMoved= timeElapsed * self.rps * 2 * math.pi * self.diameter / 2
                 self.totalDistMoved+=self.distMoved
                 self.startTime=now
         else:
-            if self.startTime is None: self.startTime=time.time()
-            timeElapsed = time.time() - self.startTime
+            if self.startTime is None: self.startTime=self.clock.time()
+            timeElapsed = self.clock.time() - self.startTime
             self.distMoved = timeElapsed * self.rps * 2 * math.pi * self.diameter / 2
             self.totalDistMoved += self.distMoved
             self.moving=False
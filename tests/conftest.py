@@ -0,0 +1,11 @@
+"""
+pytest setup, the simulator modules live in the folder above and pygame
+runs without a window or sound card
+"""
+
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER","dummy")
+os.environ.setdefault("SDL_AUDIODRIVER","dummy")
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
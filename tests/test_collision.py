@@ -0,0 +1,79 @@
+"""
+Collision.timeOfImpact() against sampling the distance between the robots
+along the tick
+"""
+
+import math
+import random
+import numpy
+import pytest
+from Collision import timeOfImpact
+
+STEPS=100000    # samples along the tick, the sampled time of impact is this close
+
+
+def firstTouch(ax0,ay0,ax1,ay1,bx0,by0,bx1,by1,radius):
+    """
+    :return float: first sampled fraction of the tick when the robots are radius apart, nan if never
+    """
+    t=numpy.linspace(0,1,STEPS+1)
+    dx=(bx0-ax0)+t*((bx1-bx0)-(ax1-ax0))
+    dy=(by0-ay0)+t*((by1-by0)-(ay1-ay0))
+    touching=numpy.flatnonzero(dx*dx+dy*dy<=radius*radius)
+    return t[touching[0]] if len(touching) else math.nan
+
+
+def test_matchesSampling():
+    rng=random.Random(3)
+    hits=0
+    for i in range(300):
+        a=[rng.uniform(0,200) for k in range(4)]
+        b=[rng.uniform(0,200) for k in range(4)]
+        radius=rng.uniform(10,60)
+        if math.hypot(b[0]-a[0],b[1]-a[1])<=radius*1.001: continue
+
+        toi,nx,ny=timeOfImpact(*a,*b,radius)
+        expected=firstTouch(*a,*b,radius)
+        if math.isnan(expected):
+            assert math.isnan(toi)
+            continue
+
+        hits+=1
+        assert toi==pytest.approx(expected,abs=1/STEPS)
+        # the normal runs from A to B where they touch
+        cx=(b[0]+toi*(b[2]-b[0]))-(a[0]+toi*(a[2]-a[0]))
+        cy=(b[1]+toi*(b[3]-b[1]))-(a[1]+toi*(a[3]-a[1]))
+        assert math.hypot(cx,cy)==pytest.approx(radius)
+        assert (nx,ny)==pytest.approx((cx/radius,cy/radius))
+    assert hits>20
+
+
+def test_arrays():
+    # a head on pair, a pair which misses and one moving apart, all at once
+    ax0=numpy.array([0.0,0.0,0.0])
+    ay0=numpy.array([0.0,0.0,0.0])
+    ax1=numpy.array([50.0,50.0,-10.0])
+    ay1=numpy.array([0.0,0.0,0.0])
+    bx0=numpy.array([100.0,100.0,30.0])
+    by0=numpy.array([0.0,50.0,0.0])
+    bx1=numpy.array([50.0,50.0,40.0])
+    by1=numpy.array([0.0,50.0,0.0])
+    toi,nx,ny=timeOfImpact(ax0,ay0,ax1,ay1,bx0,by0,bx1,by1,20.0)
+    assert toi[0]==pytest.approx(0.8)
+    assert (nx[0],ny[0])==pytest.approx((1,0))
+    assert numpy.isnan(toi[1:]).all()
+
+
+def test_touchingAtStartIsNotNew():
+    # robots stopped where they touched last tick can part, or sit there, without touching again
+    for bx1 in (25.0,20.0,15.0):
+        toi,nx,ny=timeOfImpact(0.0,0.0,0.0,0.0,20.0,0.0,bx1,0.0,20.0)
+        assert math.isnan(toi)
+
+
+def test_stoppedAtTheEnd():
+    # a robot which only just reaches the other at the end of the tick touches at 1
+    toi,nx,ny=timeOfImpact(0.0,0.0,0.0,0.0,50.0,0.0,20.0,0.0,20.0)
+    assert toi==pytest.approx(1.0)
+    toi,nx,ny=timeOfImpact(0.0,0.0,0.0,0.0,50.0,0.0,21.0,0.0,20.0)
+    assert math.isnan(toi)
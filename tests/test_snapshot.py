@@ -0,0 +1,70 @@
+"""
+Snapshot.py round trips - a restored simulator carries on exactly as the original
+"""
+
+import os
+import numpy
+from Simulator import Simulator
+from Snapshot import Snapshot
+from Fleet import FIELDS
+
+SCRIPTS=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"Scripts")
+ROBOTS=(("A","red","Brian.dat"),("B","blue","RobMiles.dat"),("C","green","Kevin.dat"))
+
+
+def makeSim(seed=7):
+    sim=Simulator(arena=(800,800),fps=50,headless=True,seed=seed)
+    for name,color,script in ROBOTS:
+        sim.addRobot(name=name,color=color,pos=(sim.random.randint(50,750),sim.random.randint(50,750)),
+                     arena=(800,800),size=20,direction=0,scriptPath=os.path.join(SCRIPTS,script))
+    return sim
+
+
+def runTo(sim,tick):
+    while sim.ticks<tick:
+        sim.update()
+
+
+def assertSame(a,b):
+    assert a.ticks==b.ticks
+    n=a.fleet.count
+    for name in FIELDS+("motion",):
+        assert numpy.array_equal(getattr(a.fleet,name)[:n],getattr(b.fleet,name)[:n]),name
+    for name,color,script in ROBOTS:
+        assert a.findBotByColor(color).getName()==name
+        assert b.findBotByColor(color).getName()==name
+
+
+def test_restoreIntoFreshSimulator():
+    sim=makeSim()
+    runTo(sim,300)
+    data=Snapshot.capture(sim).toBytes()
+
+    fresh=Simulator(arena=(800,800),fps=50,headless=True,seed=1)
+    Snapshot.fromBytes(data).restore(fresh)
+    assertSame(sim,fresh)
+
+    runTo(sim,900)
+    runTo(fresh,900)
+    assertSame(sim,fresh)
+
+
+def test_restoreUndoesColorChange():
+    sim=makeSim()
+    runTo(sim,300)
+    data=Snapshot.capture(sim).toBytes()
+    runTo(sim,600)
+
+    reference=makeSim()
+    Snapshot.fromBytes(data).restore(reference)
+
+    # A changes colour after the snapshot, restoring puts it back
+    sim.findBotByColor("red").setColor("yellow")
+    assert sim.findBotByColor("red") is None
+    Snapshot.fromBytes(data).restore(sim)
+    assert sim.findBotByColor("yellow") is None
+    assertSame(sim,reference)
+
+    runTo(sim,900)
+    runTo(reference,900)
+    assertSame(sim,reference)
@@ -0,0 +1,76 @@
+"""
+SweepAndPrune.getPairs() against checking every pair of boxes
+"""
+
+import random
+import numpy
+from Fleet import Fleet
+from SweepAndPrune import SweepAndPrune
+
+
+def bruteForce(x0,y0,x1,y1,size):
+    """
+    :return list: (a,b) for every pair whose boxes for the tick overlap, a<b
+    """
+    minX=numpy.minimum(x0,x1)-size
+    maxX=numpy.maximum(x0,x1)+size
+    minY=numpy.minimum(y0,y1)-size
+    maxY=numpy.maximum(y0,y1)+size
+    pairs=[]
+    for a in range(len(x0)):
+        for b in range(a+1,len(x0)):
+            if minX[a]<=maxX[b] and minX[b]<=maxX[a] and minY[a]<=maxY[b] and minY[b]<=maxY[a]:
+                pairs.append((a,b))
+    return pairs
+
+
+def makeFleet(count,rng):
+    fleet=Fleet(arena=(800,800))
+    for i in range(count):
+        fleet.add(None)
+        fleet.size[i]=rng.uniform(5,25)
+    return fleet
+
+
+def test_matchesBruteForce():
+    rng=random.Random(4)
+    fleet=makeFleet(60,rng)
+    sap=SweepAndPrune(fleet=fleet)
+    x=numpy.array([rng.uniform(0,800) for i in range(60)])
+    y=numpy.array([rng.uniform(0,800) for i in range(60)])
+
+    # robots wander about so the order has to be put right between ticks
+    for tick in range(50):
+        nx=x+numpy.array([rng.uniform(-30,30) for i in range(60)])
+        ny=y+numpy.array([rng.uniform(-30,30) for i in range(60)])
+        sap.update(x,y,nx,ny)
+        a,b=sap.getPairs()
+        assert list(zip(a.tolist(),b.tolist()))==bruteForce(x,y,nx,ny,fleet.size[:60])
+        x,y=nx,ny
+
+
+def test_robotsAdded():
+    rng=random.Random(5)
+    fleet=makeFleet(10,rng)
+    sap=SweepAndPrune(fleet=fleet)
+    for count in (10,11,25,40):
+        while fleet.count<count:
+            slot=fleet.add(None)
+            fleet.size[slot]=rng.uniform(5,25)
+        x=numpy.array([rng.uniform(0,300) for i in range(count)])
+        y=numpy.array([rng.uniform(0,300) for i in range(count)])
+        sap.update(x,y,x,y)
+        a,b=sap.getPairs()
+        assert list(zip(a.tolist(),b.tolist()))==bruteForce(x,y,x,y,fleet.size[:count])
+
+
+def test_touchingBoxesPair():
+    # boxes which only share an edge still overlap, as do robots on the same spot
+    fleet=makeFleet(3,random.Random(6))
+    fleet.size[:3]=10
+    sap=SweepAndPrune(fleet=fleet)
+    x=numpy.array([0.0,20.0,20.0])
+    y=numpy.array([0.0,0.0,0.0])
+    sap.update(x,y,x,y)
+    a,b=sap.getPairs()
+    assert list(zip(a.tolist(),b.tolist()))==[(0,1),(0,2),(1,2)]
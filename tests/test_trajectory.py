@@ -0,0 +1,241 @@
+"""
+Fleet segments and Trajectory.py wall hits against the old way of moving a
+robot, adding a small step each tick and checking for a wall bump after it
+"""
+
+import math
+import random
+import numpy
+import pytest
+from Constants import *
+from Fleet import *
+from Trajectory import *
+from Walls import Walls
+
+ARENA=(800,600)
+SIZE=15
+DT=1e-4         # reference step, the hit times found by stepping are this close
+
+# a box in the middle and a wall across one corner
+WALLS=Walls(arena=ARENA,segments=[(550,100,700,250)],polygons=[[(300,250),(450,250),(450,350),(300,350)]])
+
+
+def makeFleet(x,y,heading,walls=None):
+    fleet=Fleet(arena=ARENA,walls=walls)
+    slot=fleet.add(None)
+    fleet.x[slot]=x
+    fleet.y[slot]=y
+    fleet.heading[slot]=heading
+    fleet.size[slot]=SIZE
+    return fleet,slot
+
+
+def stepped(kind,x,y,heading,rate,duration,cx=0,cy=0,radius=0,bounce=False):
+    """
+    the old incremental integration, a little at a time from x,y
+
+    With bounce a LINEAR motion turns round at the arena edges and an ARC
+    carries on round the mirror image of its circle, as Collision.checkWallBump()
+    and the old ARC task did.
+
+    :param float rate: pixels a second for LINEAR, radians a second otherwise
+    :return tuple: x,y,heading,bumps at the end
+    """
+    left,right,top,bottom=WALLMARGIN+SIZE/2,ARENA[0]-WALLMARGIN-SIZE/2,WALLMARGIN+SIZE/2,ARENA[1]-WALLMARGIN-SIZE/2
+    angle=math.atan2(y-cy,x-cx)
+    bumps=0
+    for i in range(int(round(duration/DT))):
+        if kind==LINEAR:
+            x+=rate*math.cos(heading)*DT
+            y+=rate*math.sin(heading)*DT
+            vx,vy=math.cos(heading),math.sin(heading)
+        else:
+            heading+=rate*DT
+            if kind==ARC:
+                angle+=rate*DT
+                x=cx+abs(radius)*math.cos(angle)
+                y=cy+abs(radius)*math.sin(angle)
+                vx,vy=-rate*math.sin(angle),rate*math.cos(angle)
+        if not bounce: continue
+
+        nx=1 if x<=left and vx<0 else -1 if x>=right and vx>0 else 0
+        ny=1 if y<=top and vy<0 else -1 if y>=bottom and vy>0 else 0
+        if not (nx or ny): continue
+        bumps+=1
+        if kind==LINEAR:
+            heading+=math.pi
+        else:
+            # mirror the heading in the wall and the centre in the normal through the robot
+            dx,dy=math.cos(heading),math.sin(heading)
+            along=dx*nx+dy*ny
+            heading=math.atan2(dy-2*along*ny,dx-2*along*nx)
+            ox,oy=cx-x,cy-y
+            across=ox*nx+oy*ny
+            cx,cy=x+2*across*nx-ox,y+2*across*ny-oy
+            angle=math.atan2(y-cy,x-cx)
+    return x,y,heading,bumps
+
+
+def firstHit(pose,duration,walls):
+    """
+    the first sample where the robot is at a wall heading into it
+
+    :param pose: function of an array of times returning x,y,vx,vy
+    """
+    t=numpy.arange(0,duration+DT/2,DT)
+    x,y,vx,vy=pose(t)
+    left,right,top,bottom=WALLMARGIN+SIZE/2,ARENA[0]-WALLMARGIN-SIZE/2,WALLMARGIN+SIZE/2,ARENA[1]-WALLMARGIN-SIZE/2
+    hit=((x<=left)&(vx<0))|((x>=right)&(vx>0))|((y<=top)&(vy<0))|((y>=bottom)&(vy>0))
+
+    segment=numpy.flatnonzero(walls.obstacle)
+    qx,qy,d=walls._closest(x[:,None],y[:,None],segment[None,:])
+    nearest=d.argmin(axis=1)
+    rows=numpy.arange(len(t))
+    into=(x-qx[rows,nearest])*vx+(y-qy[rows,nearest])*vy<0
+    hit|=(d[rows,nearest]<=SIZE)&into
+
+    first=numpy.flatnonzero(hit)
+    return t[first[0]] if len(first) else math.inf
+
+
+def assertPose(fleet,slot,x,y,heading,tolerance,turnTolerance=1e-6):
+    assert fleet.x[slot]==pytest.approx(x,abs=tolerance)
+    assert fleet.y[slot]==pytest.approx(y,abs=tolerance)
+    assert math.cos(fleet.heading[slot])==pytest.approx(math.cos(heading),abs=turnTolerance)
+    assert math.sin(fleet.heading[slot])==pytest.approx(math.sin(heading),abs=turnTolerance)
+
+
+def run(fleet,duration,fps=50):
+    for i in range(int(round(duration*fps))+1):
+        fleet.step(1/fps)
+
+
+@pytest.mark.parametrize("heading,speed",[(0,100),(0.7,-80),(2.5,120),(-1.2,60)])
+def test_straightMatchesStepping(heading,speed):
+    fleet,slot=makeFleet(400,150,heading)
+    fleet.startLinear(slot,speed,1.2)
+    for t in (0.1,0.55,1.2):
+        x,y,h,a=fleet.poseAt(numpy.array([slot]),numpy.array([t]))
+        rx,ry,rh,bumps=stepped(LINEAR,400,150,heading,speed,t)
+        assert (x[0],y[0],h[0])==pytest.approx((rx,ry,rh),abs=1e-6)
+    run(fleet,1.2)
+    assertPose(fleet,slot,*stepped(LINEAR,400,150,heading,speed,1.2)[:3],1e-6)
+    assert not fleet.isMoving(slot)
+
+
+@pytest.mark.parametrize("turnRate",[math.pi,-2.0,0.3])
+def test_turnMatchesStepping(turnRate):
+    fleet,slot=makeFleet(400,300,1.0)
+    fleet.startTurn(slot,turnRate,1.5)
+    run(fleet,1.5,fps=30)
+    assertPose(fleet,slot,*stepped(TURN,400,300,1.0,turnRate,1.5)[:3],1e-9)
+
+
+@pytest.mark.parametrize("radius,turnRate",[(60,1.0),(-60,-1.0),(120,-0.5),(-30,2.0)])
+def test_arcMatchesStepping(radius,turnRate):
+    fleet,slot=makeFleet(500,300,0.4)
+    cx,cy=500-radius*math.sin(0.4),300+radius*math.cos(0.4)
+    fleet.startArc(slot,cx,cy,radius,turnRate,2.0)
+    run(fleet,2.0)
+    assertPose(fleet,slot,*stepped(ARC,500,300,0.4,turnRate,2.0,cx,cy,radius)[:3],1e-6)
+
+
+def test_tickSizeMakesNoDifference():
+    # where a robot ends up doesn't depend on how the time is cut up, bounces included
+    ends=[]
+    for fps in (50,7,333):
+        fleet,slot=makeFleet(200,200,0.3,WALLS)
+        fleet.startArc(slot,260,420,100,1.7,3.0)
+        run(fleet,3.0,fps)
+        ends.append((fleet.x[slot],fleet.y[slot],fleet.bumps[slot]))
+    assert ends[1]==pytest.approx(ends[0],abs=1e-6)
+    assert ends[2]==pytest.approx(ends[0],abs=1e-6)
+
+
+def test_lineHitTimes():
+    rng=random.Random(1)
+    for i in range(60):
+        x,y=rng.uniform(80,720),rng.uniform(80,520)
+        if not WALLS.isClear(x,y,SIZE): continue
+        heading=rng.uniform(0,2*math.pi)
+        speed=rng.uniform(40,300)
+        vx,vy=speed*math.cos(heading),speed*math.sin(heading)
+        t,nx,ny,edge=lineHit(x,y,vx,vy,SIZE,ARENA,WALLS,3.0)
+        expected=firstHit(lambda s:(x+vx*s,y+vy*s,vx+0*s,vy+0*s),3.0,WALLS)
+        assert t==pytest.approx(expected,abs=2*DT) or t==expected==math.inf
+
+
+def test_arcHitTimes():
+    rng=random.Random(2)
+    for i in range(60):
+        x,y=rng.uniform(80,720),rng.uniform(80,520)
+        if not WALLS.isClear(x,y,SIZE): continue
+        radius=rng.uniform(10,250)
+        a0=rng.uniform(0,2*math.pi)
+        w=rng.choice((-1,1))*rng.uniform(0.3,3)
+        cx,cy=x-radius*math.cos(a0),y-radius*math.sin(a0)
+        t,nx,ny,edge=arcHit(cx,cy,radius,a0,w,SIZE,ARENA,WALLS,3.0)
+
+        def pose(s):
+            a=a0+w*s
+            return cx+radius*numpy.cos(a),cy+radius*numpy.sin(a),-w*numpy.sin(a),w*numpy.cos(a)
+        expected=firstHit(pose,3.0,WALLS)
+        assert t==pytest.approx(expected,abs=2*DT) or t==expected==math.inf
+
+
+def test_lineSplitAtWall():
+    # 100 pixels a second from x=600 reaches the right edge line after 1.425s
+    fleet,slot=makeFleet(600,300,0)
+    fleet.startLinear(slot,100,2.0)
+    assert fleet.hitTime[slot]==pytest.approx((ARENA[0]-WALLMARGIN-SIZE/2-600)/100)
+
+    run(fleet,2.0)
+    x,y,heading,bumps=stepped(LINEAR,600,300,0,100,2.0,bounce=True)
+    assertPose(fleet,slot,x,y,heading,2*100*DT)
+    assert fleet.bumps[slot]==bumps==1
+
+
+def test_wallHitReportedOnItsTick():
+    fleet,slot=makeFleet(600,300,0)
+    fleet.startLinear(slot,100,2.0)
+    ticks=[]
+    for tick in range(100):
+        fleet.step(1/50)
+        for slots,x,y,nx,ny in fleet.getWallHits():
+            ticks.append(tick)
+            assert (x[0],nx[0],ny[0])==pytest.approx((ARENA[0]-WALLMARGIN-SIZE/2,-1,0))
+    # 1.425s is during the 72nd tick
+    assert ticks==[71]
+
+
+@pytest.mark.parametrize("radius,turnRate",[(-50,-math.pi),(80,2.0)])
+def test_arcSplitAtWall(radius,turnRate):
+    # round a centre close enough to the right edge for the arc to cross the edge line
+    cx,cy=700,300
+    x,y=cx-abs(radius),cy
+    heading=math.pi+math.copysign(math.pi/2,turnRate)
+    fleet,slot=makeFleet(x,y,heading)
+    fleet.startArc(slot,cx,cy,radius,turnRate,2.0)
+    run(fleet,2.0)
+
+    # stepping finds each bump up to one step late
+    ex,ey,eh,bumps=stepped(ARC,x,y,heading,turnRate,2.0,cx,cy,radius,bounce=True)
+    assert bumps>=1
+    assertPose(fleet,slot,ex,ey,eh,4*abs(turnRate*radius)*DT,1e-3)
+    assert fleet.bumps[slot]==bumps
+
+
+def test_instantArcMatchesTimedArc():
+    ends=[]
+    for instant in (True,False):
+        fleet,slot=makeFleet(620,300,-math.pi/2,WALLS)
+        cx,cy=700,300
+        if instant:
+            fleet.jumpArc(slot,cx,cy,80,math.pi)
+        else:
+            fleet.startArc(slot,cx,cy,80,math.pi,1.0)
+            run(fleet,1.0)
+        ends.append((fleet.x[slot],fleet.y[slot],math.cos(fleet.heading[slot]),fleet.bumps[slot]))
+        assert len(fleet.getWallHits())==fleet.bumps[slot]
+    assert ends[0]==pytest.approx(ends[1],abs=1e-9)
+    assert ends[0][3]==1